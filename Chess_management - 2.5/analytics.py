@@ -0,0 +1,260 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+import history
+
+# Cross-batch analytics: all-time standings, player careers and head-to-head
+# records over every batch database. Batch files are read in groups of up
+# to ATTACH_LIMIT, each group ATTACHed to one in-memory connection; groups
+# are aggregated in parallel in a process pool and the partial results
+# merged here. Batches and their data versions come from the catalog, so a
+# result is cached (in the catalog database) under a key made of every
+# contributing batch's version and stays valid until one of them changes.
+
+# SQLite's default SQLITE_MAX_ATTACHED
+ATTACH_LIMIT = 10
+# Results kept in AnalyticsCache
+CACHE_ENTRIES = 200
+
+# One row per registered student per batch: career totals come from the
+# materialized Standings (all periods of the batch)
+_BATCH_STANDINGS_SQL = '''
+    SELECT s.student_id, s.name, s.class, IFNULL(t.points, 0), IFNULL(t.wins, 0), IFNULL(t.draws, 0),
+           IFNULL(t.losses, 0), IFNULL(t.games, 0)
+    FROM {db}.Students s
+    LEFT JOIN (
+        SELECT student_id, SUM(points) AS points, SUM(wins) AS wins, SUM(draws) AS draws,
+               SUM(losses) AS losses, SUM(games) AS games
+        FROM {db}.Standings GROUP BY student_id
+    ) t ON t.student_id = s.student_id
+    WHERE s.student_id IS NOT NULL
+'''
+
+# One player's completed games in a batch, with the opponent's name
+_PLAYER_GAMES_SQL = '''
+    SELECT CASE WHEN m.student1_id = :sid THEN m.student2_id ELSE m.student1_id END AS opponent_id,
+           m.winner_id
+    FROM {db}.{table} m
+    WHERE m.points_assigned = 1 AND m.student1_id = :sid AND m.student2_id IS NOT NULL
+          AND m.student2_id != :sid
+    UNION ALL
+    SELECT m.student1_id, m.winner_id
+    FROM {db}.{table} m
+    WHERE m.points_assigned = 1 AND m.student2_id = :sid AND m.student1_id IS NOT NULL
+          AND m.student1_id != :sid
+'''
+
+
+def create_cache_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS AnalyticsCache (
+        cache_key TEXT PRIMARY KEY,
+        result TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analytics_cache_created ON AnalyticsCache(created_at)')
+    conn.commit()
+
+
+def _attach(db_paths):
+    """In-memory connection with db_paths attached read-only as b0, b1, ..."""
+    conn = sqlite3.connect(':memory:', uri=True)
+    for i, db_path in enumerate(db_paths):
+        uri = 'file:' + urllib.parse.quote(os.path.abspath(db_path)) + '?mode=ro'
+        conn.execute(f'ATTACH DATABASE ? AS b{i}', (uri,))
+    return conn
+
+
+def _group_standings(db_paths):
+    """Per-batch standings rows for one group of batch files: [(db_path, rows)]."""
+    conn = _attach(db_paths)
+    try:
+        return [(db_path, conn.execute(_BATCH_STANDINGS_SQL.format(db=f'b{i}')).fetchall())
+                for i, db_path in enumerate(db_paths)]
+    finally:
+        conn.close()
+
+
+def _cold_player_games(conn, db, db_path, student_id):
+    """The player's games in the batch's months in cold storage, shaped like _PLAYER_GAMES_SQL rows."""
+    games = []
+    for (file,) in conn.execute(f'SELECT file FROM {db}.ColdMonths ORDER BY month_key').fetchall():
+        for g in history.read_cold_month(os.path.join(history.batch_cold_dir(db_path), file)):
+            s1, s2 = g['student1_id'], g['student2_id']
+            if g['points_assigned'] != 1 or s1 is None or s2 is None or s1 == s2 or student_id not in (s1, s2):
+                continue
+            games.append((s2 if s1 == student_id else s1, g['winner_id']))
+    if not games:
+        return []
+    names = dict(conn.execute(f'''
+        SELECT student_id, name FROM {db}.Students WHERE student_id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(sorted({opponent_id for opponent_id, _ in games})),)).fetchall())
+    return [(opponent_id, names.get(opponent_id), winner_id) for opponent_id, winner_id in games]
+
+
+def _group_player(db_paths, student_id):
+    """One player's registration and games in each batch of a group: [(db_path, student row, games)]."""
+    conn = _attach(db_paths)
+    try:
+        partial = []
+        for i, db_path in enumerate(db_paths):
+            db = f'b{i}'
+            student = conn.execute(_BATCH_STANDINGS_SQL.format(db=db) + ' AND s.student_id = ?',
+                                   (student_id,)).fetchone()
+            games = []
+            for table in ('MatchHistory', 'Matches'):
+                games.extend(conn.execute(f'''
+                    SELECT g.opponent_id, o.name, g.winner_id
+                    FROM ({_PLAYER_GAMES_SQL.format(db=db, table=table)}) g
+                    LEFT JOIN {db}.Students o ON o.student_id = g.opponent_id
+                ''', {'sid': student_id}).fetchall())
+            games.extend(_cold_player_games(conn, db, db_path, student_id))
+            if student is not None or games:
+                partial.append((db_path, student, games))
+        return partial
+    finally:
+        conn.close()
+
+
+class Analytics:
+    """Cross-batch queries over the batches in a catalog.Catalog."""
+
+    def __init__(self, batch_catalog, workers=None):
+        self.catalog = batch_catalog
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        conn = self._cache_conn()
+        create_cache_table(conn)
+        conn.close()
+
+    def _cache_conn(self):
+        conn = sqlite3.connect(self.catalog.catalog_db, timeout=30)
+        conn.execute('PRAGMA journal_mode = WAL')
+        return conn
+
+    def _get_executor(self):
+        # Started on first use in each process, like the report job pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _map(self, fn, batches, *args):
+        """Run fn(group of db_paths, *args) over batches in ATTACH_LIMIT groups; return the partials, flattened."""
+        paths = [batch['db_path'] for batch in batches]
+        groups = [paths[i:i + ATTACH_LIMIT] for i in range(0, len(paths), ATTACH_LIMIT)]
+        if len(groups) <= 1 or self.workers <= 1:
+            results = [fn(group, *args) for group in groups]
+        else:
+            executor = self._get_executor()
+            results = [f.result() for f in [executor.submit(fn, group, *args) for group in groups]]
+        return [item for partial in results for item in partial]
+
+    def _cached(self, name, args, compute):
+        """Return compute(batches), cached under name, args and the version of every batch."""
+        batches = self.catalog.batches()
+        versions = sorted((batch['db_path'], batch['data_version']) for batch in batches)
+        payload = json.dumps([name, args, versions], separators=(',', ':'))
+        key = hashlib.sha256(payload.encode()).hexdigest()
+        conn = self._cache_conn()
+        try:
+            row = conn.execute('SELECT result FROM AnalyticsCache WHERE cache_key = ?', (key,)).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+            result = compute(batches)
+            conn.execute('INSERT OR REPLACE INTO AnalyticsCache (cache_key, result, created_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(result), time.time()))
+            conn.execute('''
+                DELETE FROM AnalyticsCache WHERE cache_key IN (
+                    SELECT cache_key FROM AnalyticsCache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (CACHE_ENTRIES,))
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    def leaderboard(self, limit=100):
+        """All-time leaderboard: totals per student ID over every batch, best first."""
+        return self._cached('leaderboard', [limit], lambda batches: self._leaderboard(batches, limit))
+
+    def _leaderboard(self, batches, limit):
+        names = {batch['db_path']: batch['batch_name'] for batch in batches}
+        created = {batch['db_path']: batch['created_at'] for batch in batches}
+        players = {}
+        # Oldest batch first, so the name and class shown are the latest ones
+        for db_path, rows in sorted(self._map(_group_standings, batches), key=lambda p: created[p[0]]):
+            for student_id, name, class_, points, wins, draws, losses, games in rows:
+                player = players.get(student_id)
+                if player is None:
+                    player = players[student_id] = {
+                        'student_id': student_id, 'points': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'games': 0,
+                        'batches': 0, 'batches_played': 0, 'first_batch': names[db_path],
+                    }
+                player['name'] = name
+                player['class'] = class_
+                player['points'] += points
+                player['wins'] += wins
+                player['draws'] += draws
+                player['losses'] += losses
+                player['games'] += games
+                player['batches'] += 1
+                player['batches_played'] += games > 0
+                player['last_batch'] = names[db_path]
+        ranked = sorted(players.values(), key=lambda p: (-p['points'], -p['wins'], p['student_id']))
+        return ranked[:limit] if limit else ranked
+
+    def player(self, student_id):
+        """A player's career: per-batch totals and head-to-head records against every opponent."""
+        return self._cached('player', [student_id], lambda batches: self._player(batches, student_id))
+
+    def _player(self, batches, student_id):
+        names = {batch['db_path']: batch['batch_name'] for batch in batches}
+        created = {batch['db_path']: batch['created_at'] for batch in batches}
+        seasons = []
+        opponents = {}
+        totals = {'points': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'games': 0}
+        name = None
+        for db_path, student, games in sorted(self._map(_group_player, batches, student_id),
+                                              key=lambda p: created[p[0]]):
+            if student is not None:
+                _, name, class_, points, wins, draws, losses, played = student
+                seasons.append({'batch_name': names[db_path], 'class': class_, 'points': points, 'wins': wins,
+                                'draws': draws, 'losses': losses, 'games': played})
+                for field, value in (('points', points), ('wins', wins), ('draws', draws), ('losses', losses),
+                                     ('games', played)):
+                    totals[field] += value
+            for opponent_id, opponent_name, winner_id in games:
+                record = opponents.get(opponent_id)
+                if record is None:
+                    record = opponents[opponent_id] = {'opponent_id': opponent_id, 'wins': 0, 'draws': 0,
+                                                       'losses': 0, 'games': 0}
+                record['name'] = opponent_name
+                record['games'] += 1
+                if winner_id is None:
+                    record['draws'] += 1
+                elif winner_id == student_id:
+                    record['wins'] += 1
+                else:
+                    record['losses'] += 1
+        head_to_head = sorted(opponents.values(), key=lambda r: (-r['games'], r['opponent_id']))
+        return {'student_id': student_id, 'name': name, 'totals': totals, 'seasons': seasons,
+                'head_to_head': head_to_head}
@@ -1,21 +1,51 @@
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, flash
+from flask import (Flask, render_template, request, redirect, url_for, session, send_file, flash, g, jsonify,
+                   Response, stream_with_context, abort, before_render_template, template_rendered,
+                   send_from_directory)
 import sqlite3
 from functools import wraps
 import datetime
-import csv
-from io import StringIO, BytesIO
-import random
+import hmac
+import time
 import uuid
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 import os
 import re
+import click
+from database import (safe_batch_name, batch_db_path, list_batch_databases, migrate_all_batches, check_query_plans,
+                      data_version, bump_data_version, STUDENT_SORT_COLUMNS, MATCH_SORT_COLUMNS)
+from db_pool import ConnectionPool, BatchNotFound
+import standings
+from pagination import parse_page_args, keyset_page, InvalidCursor
+import search
+from csv_import import import_students
+import exports
+import pairing
+import ratings
+import tiebreaks
+import results
+import live
+import catalog
+import analytics
+import history
+import scheduler
+import brackets
+import jobs
+import report_cache
+import metrics
+import roster
+from write_queue import WriteQueue
 
 app = Flask(__name__)
 app.secret_key = 'secret_key_for_session'  # Change this in production
+# PDF report workers per web worker, and how long finished reports are kept (seconds)
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 2))
+app.config['REPORT_RETENTION_SECONDS'] = int(os.environ.get('REPORT_RETENTION_SECONDS', 3600))
+# Disk budget for cached report PDFs (bytes)
+app.config['REPORT_CACHE_BYTES'] = int(os.environ.get('REPORT_CACHE_BYTES', 256 * 1024 * 1024))
+# Processes for cross-batch analytics (default: one per CPU)
+app.config['ANALYTICS_WORKERS'] = int(os.environ.get('ANALYTICS_WORKERS', 0)) or None
+# Statements slower than this are logged (milliseconds, 0 = off); /metrics needs this token when set
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
 
 # Ensure required directories exist
 if not os.path.exists('Entry_fee'):
@@ -23,20 +53,165 @@ if not os.path.exists('Entry_fee'):
 if not os.path.exists('DB'):
     os.makedirs('DB')
 
+# Bring every existing batch database up to the current schema
+migrate_all_batches()
+
+# Registry of batches with cached counts; picks up batch files it has not seen
+batch_catalog = catalog.Catalog()
+batch_catalog.sync(list_batch_databases())
+cross_batch = analytics.Analytics(batch_catalog, workers=app.config['ANALYTICS_WORKERS'])
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Upgrade every batch database to the current schema."""
+    for db_path, applied in migrate_all_batches().items():
+        click.echo(f'{db_path}: {applied} migration(s) applied')
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN QUERY PLAN every query of the modules that set CHECK_QUERY_PLANS and report table scans."""
+    unexpected = 0
+    for source, lineno, sql, plan, scans in check_query_plans():
+        status = 'SCAN' if scans else 'ok'
+        unexpected += bool(scans)
+        click.echo(f'{os.path.basename(source)}:{lineno} [{status}] {sql[:100]}')
+        for line in plan:
+            click.echo(f'    {line}')
+    if unexpected:
+        raise click.ClickException(f'{unexpected} query(s) still scan a table')
+
+@app.cli.command('rebuild-standings')
+def rebuild_standings_command():
+    """Recompute the Standings table of every batch from its matches."""
+    for db_path in list_batch_databases():
+        conn = sqlite3.connect(db_path, timeout=30)
+        standings.rebuild_standings(conn)
+        tiebreaks.rebuild_tiebreaks(conn)
+        conn.commit()
+        conn.close()
+        click.echo(f'{db_path}: standings rebuilt')
+
+@app.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """Recompute Elo and Glicko-2 ratings of every batch from its games."""
+    for db_path in list_batch_databases():
+        conn = sqlite3.connect(db_path, timeout=30)
+        games = ratings.rebuild_ratings(conn)
+        bump_data_version(conn)
+        conn.commit()
+        conn.close()
+        click.echo(f'{db_path}: {games} game(s) rated')
+
+@app.cli.command('compact-history')
+@click.option('--keep-months', default=12, show_default=True, help='Recent months to keep in MatchHistory.')
+def compact_history_command(keep_months):
+    """Move archived months older than --keep-months into compressed cold storage."""
+    today = datetime.date.today()
+    months = today.year * 12 + today.month - 1 - keep_months
+    before_month = f'{months // 12:04d}-{months % 12 + 1:02d}'
+    for db_path in list_batch_databases():
+        conn = sqlite3.connect(db_path, timeout=30)
+        moved = history.compact(conn, before_month)
+        conn.close()
+        click.echo(f'{db_path}: {sum(moved.values())} game(s) in {len(moved)} month(s) moved to cold storage')
+
+# Request, statement, template and report timings; each worker snapshots its own to DB/metrics
+metrics_registry = metrics.Registry('DB/metrics', slow_query_seconds=app.config['SLOW_QUERY_MS'] / 1000)
+
+# Per-worker pool of open batch database connections
+db_pool = ConnectionPool(max_idle=16, max_per_db=8, observer=metrics_registry.observe_statement)
+
+# Player names and classes for match listings come from this worker's roster cache (roster.py)
+roster.rosters.observer = metrics_registry.observe_roster
+
+# Background PDF report jobs, shared by all workers through DB/jobs.db
+report_jobs = jobs.JobQueue('DB/jobs.db', 'Reports', workers=app.config['REPORT_WORKERS'],
+                            retention=app.config['REPORT_RETENTION_SECONDS'],
+                            cache_bytes=app.config['REPORT_CACHE_BYTES'],
+                            observer=metrics_registry.observe_report)
+
+# Recount a batch in the catalog after its writer commits, on the writer's connection
+def refresh_catalog(db_path, conn):
+    try:
+        batch_catalog.refresh(db_path, conn)
+    except sqlite3.Error:
+        app.logger.exception("Could not refresh the catalog entry for %s", db_path)
+
+# Mutations of a batch, serialized across workers and group-committed (write_queue.py)
+write_queue = WriteQueue(db_pool, observer=metrics_registry.observe_write_group, on_commit=refresh_catalog)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics_registry.observe('http_request_duration_seconds',
+                                 (('route', route), ('method', request.method), ('status', str(response.status_code))),
+                                 time.perf_counter() - start)
+        metrics_registry.flush()
+    return response
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    starts = g.get('render_starts')
+    if starts:
+        metrics_registry.observe('template_render_duration_seconds', (('template', template.name or 'string'),),
+                                 time.perf_counter() - starts.pop())
+
+# A cursor a listing did not hand out (edited or truncated ?cursor=) is the client's error
+@app.errorhandler(InvalidCursor)
+def invalid_cursor(e):
+    if request.args.get('format') == 'json':
+        return jsonify({'error': str(e)}), 400
+    return Response(f'Bad request: {e}', status=400, mimetype='text/plain')
+
+@app.cli.command('purge-reports')
+def purge_reports_command():
+    """Delete finished report jobs and cached reports past their retention time."""
+    click.echo(f'{report_jobs.purge_expired()} expired job(s) and cached report(s) removed')
+
 # Database connection helper
 def get_db_connection():
     batch_name = session.get('batch_name')
     if not batch_name:
         raise Exception("No batch selected")
-    # Sanitize batch_name to match database creation
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', batch_name)
-    db_path = f'DB/batch_{safe_batch_name}_database.db'
-    if not os.path.exists(db_path):
-        raise Exception(f"Database for batch {batch_name} not found")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    db_path = batch_db_path(batch_name)
+    conn = db_pool.acquire(db_path)
+    g.setdefault('db_connections', []).append((conn, conn._lease))
     return conn
 
+# The selected batch's database file is gone (deleted outside the app): drop it from the catalog
+@app.errorhandler(BatchNotFound)
+def batch_not_found(e):
+    batch_catalog.unregister(e.args[0])
+    batch_name = session.pop('batch_name', None)
+    flash(f"Database for batch {batch_name} not found", "error")
+    return redirect(url_for('select_batch'))
+
+# Return connections a route did not close (e.g. after an exception) to the pool
+@app.teardown_appcontext
+def release_db_connections(exc):
+    for conn, lease in g.pop('db_connections', []):
+        db_pool.release(conn, lease)
+
+# Run fn(conn, *args) on the current batch through its write queue; return fn's result once committed.
+# fn runs on the batch's writer thread, so it must not use the request, session or g.
+def write_batch(fn, *args):
+    batch_name = session.get('batch_name')
+    if not batch_name:
+        raise Exception("No batch selected")
+    return write_queue.run(batch_db_path(batch_name), fn, *args)
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -66,8 +241,7 @@ def select_batch():
         action = request.form.get('action')
         if action == 'select':
             batch_name = request.form.get('batch_name')
-            safe_batch_name = re.sub(r'[^a-zAZ0-9_-]', '_', batch_name)
-            if batch_name and os.path.exists(f'DB/batch_{safe_batch_name}_database.db'):
+            if batch_name and batch_catalog.get(batch_name) is not None:
                 session['batch_name'] = batch_name
                 return redirect(url_for('dashboard'))
             else:
@@ -76,20 +250,19 @@ def select_batch():
             batch_name = request.form.get('batch_name')
             if batch_name:
                 from database import create_batch_database
-                create_batch_database(batch_name)
-                session['batch_name'] = batch_name
-                flash(f"New batch '{batch_name}' created", "success")
-                return redirect(url_for('dashboard'))
+                db_path = create_batch_database(batch_name)
+                try:
+                    batch_catalog.register(batch_name, safe_batch_name(batch_name), db_path)
+                except catalog.NameTaken as e:
+                    flash(f"Batch name '{batch_name}' clashes with existing batch '{e}'", "error")
+                else:
+                    session['batch_name'] = batch_name
+                    flash(f"New batch '{batch_name}' created", "success")
+                    return redirect(url_for('dashboard'))
             else:
                 flash("Batch name is required", "error")
     
-    # List existing batches
-    batches = []
-    for file in os.listdir('DB'):
-        if file.startswith('batch_') and file.endswith('_database.db'):
-            batch_name = file[len('batch_'):-len('_database.db')]
-            batches.append({'batch_name': batch_name, 'display_name': batch_name})
-    return render_template('select_batch.html', batches=batches)
+    return render_template('select_batch.html', batches=batch_catalog.batches())
 
 # Logout route
 @app.route('/logout')
@@ -98,6 +271,33 @@ def logout():
     session.pop('batch_name', None)
     return redirect(url_for('login'))
 
+# Connection pool and roster cache counters for this worker
+@app.route('/db_stats')
+@login_required
+def db_stats():
+    return jsonify(dict(db_pool.stats(), rosters=roster.rosters.stats()))
+
+# Scrapers send Bearer METRICS_TOKEN; without one configured, only logged-in users see metrics
+def metrics_allowed():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return 'logged_in' in session
+
+# Timings of every worker in Prometheus text format
+@app.route('/metrics')
+def metrics_page():
+    if not metrics_allowed():
+        abort(401)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+# The SQL behind each statement fingerprint in /metrics, as JSON
+@app.route('/metrics/statements')
+def metrics_statements():
+    if not metrics_allowed():
+        abort(401)
+    return jsonify(metrics_registry.statements())
+
 # Dashboard route
 @app.route('/')
 @login_required
@@ -110,40 +310,64 @@ def dashboard():
     conn.close()
     return render_template('dashboard.html', total_students=total_students, total_matches=total_matches, top5=top5, batch_name=batch_name)
 
-# Students list with search
+# Students list with search, one keyset page at a time (?format=json for JSON)
 @app.route('/students')
 @login_required
 def students():
     q = request.args.get('q', '')
-    conn = get_db_connection()
+    sort, order, cursor, limit = parse_page_args(request.args, STUDENT_SORT_COLUMNS, 'student_id')
+    where, params = [], []
     if q:
-        students = conn.execute('SELECT * FROM Students WHERE name LIKE ? OR student_id LIKE ?', (f'%{q}%', f'%{q}%')).fetchall()
-    else:
-        students = conn.execute('SELECT * FROM Students').fetchall()
+        where.append('id IN (SELECT rowid FROM StudentSearch WHERE StudentSearch MATCH ?)')
+        params.append(search.prefix_query(q) or '""')
+    conn = get_db_connection()
+    page = keyset_page(conn, '*', 'Students', 'id', STUDENT_SORT_COLUMNS, sort, order, cursor, limit, where, params)
+    # Nothing starts with what was typed: offer similarly spelled names instead
+    suggestions = []
+    if q and not page.rows and cursor is None:
+        suggestions = search.fuzzy_search(conn, q, limit=10)
     batch_name = session.get('batch_name')
     conn.close()
-    return render_template('students.html', students=students, batch_name=batch_name)
+    if request.args.get('format') == 'json':
+        return jsonify(page.to_dict())
+    return render_template('students.html', students=page.rows, page=page, suggestions=suggestions, batch_name=batch_name)
+
+# Ranked student search API: prefix matches by bm25, then typo-tolerant name matches
+@app.route('/students/search')
+@login_required
+def search_students():
+    q = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    fuzzy = request.args.get('fuzzy', '1') != '0'
+    conn = get_db_connection()
+    results = search.search_students(conn, q, limit, fuzzy)
+    conn.close()
+    return jsonify({
+        'query': q,
+        'results': [dict(row, match=kind) for row, kind in results],
+    })
 
 # Toggle paid entry
 @app.route('/students/toggle_paid/<student_id>')
 @login_required
 def toggle_paid(student_id):
-    conn = get_db_connection()
-    current_status = conn.execute('SELECT paid_entry FROM Students WHERE student_id = ?', (student_id,)).fetchone()['paid_entry']
-    new_status = 0 if current_status else 1
-    conn.execute('UPDATE Students SET paid_entry = ? WHERE student_id = ?', (new_status, student_id))
-    conn.commit()
-    conn.close()
+    def toggle(conn):
+        current_status = conn.execute('SELECT paid_entry FROM Students WHERE student_id = ?', (student_id,)).fetchone()['paid_entry']
+        new_status = 0 if current_status else 1
+        conn.execute('UPDATE Students SET paid_entry = ? WHERE student_id = ?', (new_status, student_id))
+    write_batch(toggle)
     return redirect(url_for('students'))
 
 # Toggle all students' paid entry to Yes
 @app.route('/students/toggle_all_paid')
 @login_required
 def toggle_all_paid():
-    conn = get_db_connection()
-    conn.execute('UPDATE Students SET paid_entry = 1')
-    conn.commit()
-    conn.close()
+    def mark_all_paid(conn):
+        conn.execute('UPDATE Students SET paid_entry = 1')
+    write_batch(mark_all_paid)
     flash("All students' paid entry status set to Yes", "success")
     return redirect(url_for('students'))
 
@@ -157,16 +381,17 @@ def add_student():
         roll = request.form.get('roll', '')
         mobile = request.form.get('mobile', '')
         year = request.form.get('year', '')
-        conn = get_db_connection()
-        max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
-        if max_id is None:
-            new_id = '00001'
-        else:
-            new_id = str(int(max_id) + 1).zfill(5)
-        conn.execute('INSERT INTO Students (student_id, name, class, roll, mobile, year, paid_entry) VALUES (?, ?, ?, ?, ?, ?, 0)',
-                     (new_id, name, class_, roll, mobile, year))
-        conn.commit()
-        conn.close()
+
+        # The next ID is read and used in the same write, so concurrent adds cannot take the same one
+        def add(conn):
+            max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
+            if max_id is None:
+                new_id = '00001'
+            else:
+                new_id = str(int(max_id) + 1).zfill(5)
+            conn.execute('INSERT INTO Students (student_id, name, class, roll, mobile, year, paid_entry) VALUES (?, ?, ?, ?, ?, ?, 0)',
+                         (new_id, name, class_, roll, mobile, year))
+        write_batch(add)
         return redirect(url_for('students'))
     return render_template('add_student.html')
 
@@ -174,8 +399,6 @@ def add_student():
 @app.route('/students/edit/<student_id>', methods=['GET', 'POST'])
 @login_required
 def edit_student(student_id):
-    conn = get_db_connection()
-    student = conn.execute('SELECT * FROM Students WHERE student_id = ?', (student_id,)).fetchone()
     if request.method == 'POST':
         name = request.form['name']
         class_ = request.form['class']
@@ -183,203 +406,130 @@ def edit_student(student_id):
         mobile = request.form.get('mobile', '')
         year = request.form.get('year', '')
         paid_entry = 1 if 'paid_entry' in request.form else 0
-        conn.execute('''
-            UPDATE Students SET name = ?, class = ?, roll = ?, mobile = ?, year = ?, paid_entry = ?
-            WHERE student_id = ?
-        ''', (name, class_, roll, mobile, year, paid_entry, student_id))
-        conn.commit()
-        conn.close()
+
+        def update(conn):
+            conn.execute('''
+                UPDATE Students SET name = ?, class = ?, roll = ?, mobile = ?, year = ?, paid_entry = ?
+                WHERE student_id = ?
+            ''', (name, class_, roll, mobile, year, paid_entry, student_id))
+        write_batch(update)
         return redirect(url_for('students'))
+    conn = get_db_connection()
+    student = conn.execute('SELECT * FROM Students WHERE student_id = ?', (student_id,)).fetchone()
     conn.close()
     return render_template('edit_student.html', student=student)
 
-# Export students to CSV
+# Stream a table export straight from the cursor (?format=csv or ?format=ndjson)
+def export_response(spec, basename):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        fmt = 'csv'
+    filename = f'{basename}_batch_{safe_batch_name(session["batch_name"])}.{fmt}'
+    conn = get_db_connection()
+    return Response(
+        stream_with_context(exports.stream_export(conn, spec, fmt)),
+        mimetype=exports.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Export students
 @app.route('/students/export_csv')
 @login_required
 def export_csv():
-    conn = get_db_connection()
-    students = conn.execute('SELECT student_id, name, class, roll, mobile, year, paid_entry FROM Students').fetchall()
-    conn.close()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year', 'Paid Entry'])
-    for student in students:
-        writer.writerow([student['student_id'], student['name'], student['class'], student['roll'], student['mobile'], student['year'], 'Yes' if student['paid_entry'] else 'No'])
-    
-    output.seek(0)
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', session["batch_name"])
-    return send_file(
-        BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'students_batch_{safe_batch_name}.csv'
-    )
+    return export_response(exports.STUDENTS, 'students')
+
+# Export matches
+@app.route('/matches/export_csv')
+@login_required
+def export_matches_csv():
+    return export_response(exports.MATCHES, 'matches')
 
-# Import students from CSV
+# Export match history
+@app.route('/match_history/export_csv')
+@login_required
+def export_match_history_csv():
+    return export_response(exports.MATCH_HISTORY, 'match_history')
+
+# Import students from CSV (tick "dry run" to validate without writing)
 @app.route('/students/import_csv', methods=['GET', 'POST'])
 @login_required
 def import_csv():
     if request.method == 'POST':
-        print("POST request received for CSV import")
         if 'file' not in request.files:
-            print("No file in request.files")
             flash("No file uploaded", "error")
             return redirect(url_for('students'))
         file = request.files['file']
-        print(f"Selected file: {file.filename}")
         if file.filename == '':
-            print("Empty filename")
             flash("No file selected", "error")
             return redirect(url_for('students'))
         if not file.filename.lower().endswith('.csv'):
-            print(f"Invalid file extension: {file.filename}")
             flash("Invalid file format. Please upload a CSV file.", "error")
             return redirect(url_for('students'))
-        
-        # Save uploaded file for inspection
-        file.save('uploaded_csv.csv')
-        print("Saved uploaded file as uploaded_csv.csv")
-        
-        # Read raw file content for debugging
-        file.seek(0)  # Reset file pointer
-        raw_content = file.read().decode('utf-8', errors='replace')
-        print(f"Raw CSV content (first 500 chars):\n{raw_content[:500]}")
-        
-        if not raw_content.strip():
-            print("CSV file is empty")
-            flash("The uploaded CSV file is empty.", "error")
-            return redirect(url_for('students'))
-        
-        conn = get_db_connection()
-        # Optional: Clear existing students to start fresh (uncomment if desired)
-        # conn.execute('DELETE FROM Students')
-        # conn.commit()
-        # print("Cleared existing students from database")
-        
-        max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
-        next_id = int(max_id) + 1 if max_id else 1
-        print(f"Starting next_id: {next_id}")
-        
-        stream = StringIO(raw_content)
-        csv_reader = csv.DictReader(stream)
-        required_headers = {'ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year'}
-        
-        if csv_reader.fieldnames is None:
-            conn.close()
-            print("No headers found in CSV")
-            flash("CSV file has no headers or is malformed. Expected headers: ID, Name, Class, Roll, Mobile, Year", "error")
-            return redirect(url_for('students'))
-        
-        print(f"CSV headers: {csv_reader.fieldnames}")
-        if not required_headers.issubset(csv_reader.fieldnames):
+
+        dry_run = 'dry_run' in request.form
+        if dry_run:
+            conn = get_db_connection()
+            report = import_students(conn, file.stream, dry_run=True)
             conn.close()
-            print("Invalid headers")
-            flash(f"CSV must contain headers: {', '.join(required_headers)}", "error")
+        else:
+            # Streamed from the upload by the batch's writer while this request waits for it
+            report = write_batch(import_students, file.stream)
+        app.logger.info("CSV import%s of %s: %d rows, %d written, %d skipped in %.2fs (%.0f rows/s)",
+                        " dry run" if dry_run else "", file.filename, report.rows, report.written,
+                        report.skipped, report.elapsed, report.rows_per_second)
+
+        if report.fatal:
+            flash(report.fatal, "error")
             return redirect(url_for('students'))
-        
-        row_count = 0
-        try:
-            for row in csv_reader:
-                row_count += 1
-                print(f"Processing row {row_count}: {row}")
-                student_id = row['ID'] if row['ID'] else str(next_id).zfill(5)
-                next_id += 1
-                name = row['Name']
-                class_ = row['Class']
-                roll = row.get('Roll', '')
-                mobile = row.get('Mobile', '')
-                year = row.get('Year', '')
-                conn.execute('''
-                    INSERT OR REPLACE INTO Students (student_id, name, class, roll, mobile, year, points, matches_played, paid_entry)
-                    VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0)
-                ''', (student_id, name, class_, roll, mobile, year))
-            print(f"Total rows processed: {row_count}")
-            conn.commit()
-            total_students = conn.execute('SELECT COUNT(*) FROM Students').fetchone()[0]
-            print(f"Total students in database after import: {total_students}")
-            conn.close()
-            flash(f"Successfully imported {row_count} students. Total students: {total_students}", "success")
-            return redirect(url_for('students'))
-        except Exception as e:
-            print(f"Error at row {row_count}: {str(e)}")
-            conn.close()
-            flash(f"Error processing CSV at row {row_count}: {str(e)}", "error")
+        if not dry_run and not report.skipped:
+            flash(f"Successfully imported {report.written} students.", "success")
             return redirect(url_for('students'))
+        return render_template('import_csv.html', report=report)
     return render_template('import_csv.html')
 
-# Helper function to generate entry fee PDF
-def generate_entry_fee_pdf(batch_name, safe_batch_name, fee_amount, students):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=(A4[1], A4[0]))  # Landscape A4
-    elements = []
-    styles = getSampleStyleSheet()
-
-    elements.append(Paragraph(f"Entry Fee Report - Batch {batch_name}", styles['Title']))
-    elements.append(Paragraph(f"Generated on {datetime.date.today().strftime('%Y-%m-%d')}", styles['Normal']))
-    elements.append(Paragraph(f"Fee per Student: {fee_amount} Taka", styles['Normal']))
-
-    if students:
-        data = [['Student ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year', 'Paid']]  # Header
-        for student in students:
-            data.append([
-                student['student_id'],
-                student['name'],
-                student['class'],
-                student['roll'],
-                student['mobile'],
-                student['year'],
-                'Yes' if student['paid_entry'] else 'No'
-            ])
-        
-        table = Table(data, colWidths=[20*mm, 40*mm, 20*mm, 20*mm, 25*mm, 20*mm, 20*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-
-        total_students = len(students)
-        total_amount = total_students * fee_amount
-        elements.append(Paragraph(f"Total Students: {total_students}", styles['Normal']))
-        elements.append(Paragraph(f"Total Amount: {total_amount} Taka", styles['Normal']))
-
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
+# Jobs are only visible from the batch they were queued for
+def get_job_or_404(job_id):
+    job = report_jobs.get(job_id)
+    if job is None or job['batch_name'] != session.get('batch_name'):
+        abort(404)
+    return job
+
+# Send a rendered report; its content hash is the ETag, so an unchanged report is a 304
+def send_report(path, sha, download_name):
+    return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=download_name,
+                     etag=sha, conditional=True)
+
+# Serve the current batch's report from the cache, or queue it and point the client at the job
+def submit_report(kind, params, download_name, archive_path=None):
+    batch_name = session['batch_name']
+    conn = get_db_connection()
+    key = report_cache.cache_key(kind, batch_name, params, data_version(conn), datetime.date.today().isoformat())
+    conn.close()
+    cached = report_jobs.cached(key)
+    if cached is not None:
+        _, sha, path = cached
+        if archive_path and not os.path.exists(archive_path):
+            report_cache.link_archive(path, archive_path)
+        if request.args.get('format') == 'json':
+            return jsonify(status=jobs.DONE, download_url=url_for('download_report', key=key, name=download_name))
+        return send_report(path, sha, download_name)
+    job_id = report_jobs.submit(kind, batch_db_path(batch_name), batch_name, params, download_name, archive_path,
+                                key=key)
+    if request.args.get('format') == 'json':
+        return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+    return redirect(url_for('job_page', job_id=job_id))
 
 # Entry fee PDF (existing report)
 @app.route('/students/export_entry_fee', methods=['GET', 'POST'])
 @login_required
 def export_entry_fee():
     batch_name = session.get('batch_name')
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', batch_name)
+    safe_name = safe_batch_name(batch_name)
     if request.method == 'POST':
         fee_amount = float(request.form.get('fee_amount', 0))
-        conn = get_db_connection()
-        students = conn.execute('SELECT * FROM Students WHERE paid_entry = 1').fetchall()
-        conn.close()
-
-        pdf = generate_entry_fee_pdf(batch_name, safe_batch_name, fee_amount, students)
-
-        # Save PDF to Entry_fee folder
-        pdf_filename = f'Entry_fee/entry_fee_{safe_batch_name}_{datetime.date.today().strftime("%Y%m%d")}.pdf'
-        with open(pdf_filename, 'wb') as f:
-            f.write(pdf)
-
-        return send_file(
-            BytesIO(pdf),
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'entry_fee_{safe_batch_name}.pdf'
-        )
+        # Saved to the Entry_fee folder as well once it is generated
+        pdf_filename = f'Entry_fee/entry_fee_{safe_name}_{datetime.date.today().strftime("%Y%m%d")}.pdf'
+        return submit_report('entry_fee', {'fee_amount': fee_amount}, f'entry_fee_{safe_name}.pdf', pdf_filename)
 
     return render_template('entry_fee_form.html', batch_name=batch_name)
 
@@ -388,26 +538,13 @@ def export_entry_fee():
 @login_required
 def export_entry_fee_form():
     batch_name = session.get('batch_name')
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', batch_name)
+    safe_name = safe_batch_name(batch_name)
     if request.method == 'POST':
         fee_amount = float(request.form.get('fee_amount', 0))
-        conn = get_db_connection()
-        students = conn.execute('SELECT * FROM Students').fetchall()  # Include all students
-        conn.close()
-
-        pdf = generate_entry_fee_pdf(batch_name, safe_batch_name, fee_amount, students)
-
-        # Save PDF to Entry_fee folder
-        pdf_filename = f'Entry_fee/entry_fee_form_{safe_batch_name}_{datetime.date.today().strftime("%Y%m%d")}.pdf'
-        with open(pdf_filename, 'wb') as f:
-            f.write(pdf)
-
-        return send_file(
-            BytesIO(pdf),
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'entry_fee_form_{safe_batch_name}.pdf'
-        )
+        # Saved to the Entry_fee folder as well once it is generated
+        pdf_filename = f'Entry_fee/entry_fee_form_{safe_name}_{datetime.date.today().strftime("%Y%m%d")}.pdf'
+        return submit_report('entry_fee', {'fee_amount': fee_amount, 'all_students': True},
+                             f'entry_fee_form_{safe_name}.pdf', pdf_filename)
 
     return render_template('entry_fee_form_select.html', batch_name=batch_name)
 
@@ -416,10 +553,10 @@ def export_entry_fee_form():
 @login_required
 def entry_fee_history():
     batch_name = session.get('batch_name')
-    safe_batch_name = re.sub(r'[^a-zAZ0-9_-]', '_', batch_name)
+    safe_name = safe_batch_name(batch_name)
     entry_fee_files = []
     for file in os.listdir('Entry_fee'):
-        if file.endswith('.pdf') and (file.startswith(f'entry_fee_{safe_batch_name}_') or file.startswith(f'entry_fee_form_{safe_batch_name}_')):
+        if file.endswith('.pdf') and (file.startswith(f'entry_fee_{safe_name}_') or file.startswith(f'entry_fee_form_{safe_name}_')):
             try:
                 # Extract date from filename (format: YYYYMMDD)
                 date_part = file.split('_')[-1].split('.')[0]
@@ -439,23 +576,29 @@ def entry_fee_history():
 @app.route('/entry_fee/download/<path:filename>')
 @login_required
 def download_entry_fee(filename):
-    return send_file(f'Entry_fee/{filename}', as_attachment=True)
+    return send_from_directory(os.path.abspath('Entry_fee'), filename, as_attachment=True)
+
+# Board assignment of each match (scheduler.py); match_id is renamed so the
+# keyset key stays unambiguous
+SCHEDULE_JOIN = '''
+    LEFT JOIN (SELECT match_id AS scheduled_id, slot, room, board, starts_at FROM Schedule) sc
+        ON sc.scheduled_id = m.match_id
+'''
 
-# Matches list
+# Matches list, one keyset page at a time (?format=json for JSON)
 @app.route('/matches', methods=['GET', 'POST'])
 @login_required
 def matches():
+    sort, order, cursor, limit = parse_page_args(request.args, MATCH_SORT_COLUMNS, 'match_id')
     conn = get_db_connection()
-    matches = conn.execute('''
-        SELECT m.*, s1.name AS s1_name, s2.name AS s2_name, w.name AS winner_name
-        FROM Matches m
-        LEFT JOIN Students s1 ON m.student1_id = s1.student_id
-        LEFT JOIN Students s2 ON m.student2_id = s2.student_id
-        LEFT JOIN Students w ON m.winner_id = w.student_id
-    ''').fetchall()
+    page = keyset_page(conn, 'm.*, sc.slot, sc.room, sc.board, sc.starts_at', 'Matches m' + SCHEDULE_JOIN,
+                       'match_id', MATCH_SORT_COLUMNS, sort, order, cursor, limit)
+    page.rows = roster.load(conn).with_names(page.rows)
     batch_name = session.get('batch_name')
     conn.close()
-    return render_template('matches.html', matches=matches, batch_name=batch_name)
+    if request.args.get('format') == 'json':
+        return jsonify(page.to_dict())
+    return render_template('matches.html', matches=page.rows, page=page, batch_name=batch_name)
 
 # Auto generate matches
 @app.route('/matches/auto', methods=['POST'])
@@ -466,381 +609,358 @@ def auto_matches():
         flash("Number of matches must be between 1 and 20", "error")
         return redirect(url_for('matches'))
 
-    conn = get_db_connection()
-    # Check for incomplete matches
-    incomplete_matches = conn.execute('SELECT COUNT(*) FROM Matches WHERE points_assigned = 0').fetchone()[0]
-    if incomplete_matches > 0:
-        conn.close()
+    batch_name = session.get('batch_name')
+
+    # Checked, paired and inserted in one write, so two organizers cannot pair the same round
+    def pair(conn):
+        # Check for incomplete matches
+        incomplete_matches = conn.execute('SELECT COUNT(*) FROM Matches WHERE points_assigned = 0').fetchone()[0]
+        if incomplete_matches > 0:
+            return None
+        # Swiss pairing: max_matches rounds, player 1 (student1) has white
+        result = pairing.pair_batch(conn, rounds=max_matches)
+        conn.executemany('INSERT INTO Matches (student1_id, student2_id, batch_id) VALUES (?, ?, ?)',
+                         [(white, black, batch_name) for white, black in result.pairs])
+        return result, scheduler.schedule(conn)
+    paired = write_batch(pair)
+    if paired is None:
         flash("Cannot generate new matches until current batch is completed", "error")
         return redirect(url_for('matches'))
-
-    students = conn.execute('SELECT student_id FROM Students WHERE paid_entry = 1').fetchall()
-    student_ids = [s['student_id'] for s in students]
-    random.shuffle(student_ids)
-    
-    matches = []
-    match_counts = {sid: 0 for sid in student_ids}
-    batch_name = session.get('batch_name')
-    
-    while any(count < max_matches for count in match_counts.values()) and len(student_ids) >= 2:
-        available = [sid for sid, count in match_counts.items() if count < max_matches]
-        if len(available) < 2:
-            break
-        random.shuffle(available)
-        for i in range(0, len(available)-1, 2):
-            s1, s2 = available[i], available[i+1]
-            if match_counts[s1] < max_matches and match_counts[s2] < max_matches:
-                matches.append((s1, s2, batch_name))
-                match_counts[s1] += 1
-                match_counts[s2] += 1
-    
-    for s1, s2, bname in matches:
-        conn.execute('INSERT INTO Matches (student1_id, student2_id, batch_id) VALUES (?, ?, ?)', (s1, s2, bname))
-    conn.commit()
-    conn.close()
+    result, placed = paired
+    live.notify(batch_db_path(batch_name))
+    app.logger.info("Paired %d games in %.3fs (%d byes, %d rematches); scheduled in %d slots in %.3fs",
+                    len(result.pairs), result.elapsed, len(result.byes), result.rematches, placed.slots, placed.elapsed)
     flash("Matches generated successfully", "success")
+    if result.byes:
+        flash(f"Byes: {', '.join(sorted(set(result.byes)))}", "info")
     return redirect(url_for('matches'))
 
-# Download tournament schedule as PDF
-@app.route('/matches/export_schedule')
+# Round robins and knockout brackets seeded from the current standings
+@app.route('/matches/brackets', methods=['GET', 'POST'])
 @login_required
-def export_schedule():
+def brackets_page():
+    if request.method == 'POST':
+        event_format = request.form.get('format', '')
+        class_filter = request.form.get('class', '').strip()
+        try:
+            limit = int(request.form.get('players') or 0)
+        except ValueError:
+            limit = 0
+        batch_name = session.get('batch_name')
+
+        # Checked, seeded and generated in one write, as for auto_matches
+        def create(conn):
+            if conn.execute('SELECT COUNT(*) FROM Matches WHERE points_assigned = 0').fetchone()[0] > 0:
+                return None
+            seeds = brackets.load_seeds(conn, limit, class_filter)
+            return brackets.create_event(conn, event_format, seeds, batch_name)
+        try:
+            created = write_batch(create)
+        except ValueError as e:
+            flash(str(e), "error")
+        else:
+            if created is None:
+                flash("Cannot generate new matches until current batch is completed", "error")
+            else:
+                live.notify(batch_db_path(session['batch_name']))
+                app.logger.info("Created %s for %d players: %d games in %.3fs", event_format, created.players,
+                                created.matches, created.elapsed)
+                flash(f"{brackets.FORMATS[event_format]} for {created.players} players: "
+                      f"{created.matches} matches generated", "success")
+                if created.bracket_id is not None:
+                    return redirect(url_for('bracket_page', bracket_id=created.bracket_id))
+                return redirect(url_for('matches'))
     conn = get_db_connection()
-    matches = conn.execute('''
-        SELECT m.match_id, s1.student_id AS s1_id, s1.name AS s1_name, s1.class AS s1_class,
-               s2.student_id AS s2_id, s2.name AS s2_name, s2.class AS s2_class
-        FROM Matches m
-        LEFT JOIN Students s1 ON m.student1_id = s1.student_id
-        LEFT JOIN Students s2 ON m.student2_id = s2.student_id
-        WHERE m.winner_id IS NULL
+    events = conn.execute('''
+        SELECT b.*, s.name AS champion_name FROM Brackets b
+        LEFT JOIN Students s ON s.student_id = b.champion_id
+        ORDER BY b.bracket_id DESC
     ''').fetchall()
     conn.close()
+    return render_template('brackets.html', events=events, formats=brackets.FORMATS)
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=(A4[1], A4[0]))  # Landscape A4
-    elements = []
-    styles = getSampleStyleSheet()
-
-    elements.append(Paragraph(f"Chess Club Tournament Schedule - Batch {session['batch_name']}", styles['Title']))
-    elements.append(Paragraph(f"Generated on {datetime.date.today().strftime('%Y-%m-%d')}", styles['Normal']))
-    elements.append(Spacer(1, 12))  # Add spacing after header
-
-    if matches:
-        # Group matches into sessions of 10
-        matches_per_session = 10
-        for session_num, i in enumerate(range(0, len(matches), matches_per_session), 1):
-            session_matches = matches[i:i + matches_per_session]
-            elements.append(Paragraph(f"Session {session_num}", styles['Heading2']))
-            elements.append(Spacer(1, 6))
-
-            data = [['Match ID', 'Board', 'Player 1 ID', 'Player 1 Name', 'Player 1 Class',
-                     'Player 2 ID', 'Player 2 Name', 'Player 2 Class']]
-            for j, match in enumerate(session_matches):
-                # Calculate board number: (j % 10) + 1 to reset to 1-10 per session
-                board = f"Board-{((j % 10) + 1)}"
-                data.append([
-                    str(match['match_id']),
-                    board,
-                    match['s1_id'],
-                    match['s1_name'],
-                    match['s1_class'],
-                    match['s2_id'],
-                    match['s2_name'],
-                    match['s2_class']
-                ])
-
-            table = Table(data, colWidths=[20*mm, 20*mm, 20*mm, 40*mm, 20*mm, 20*mm, 40*mm, 20*mm])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ]))
-            elements.append(table)
-            elements.append(Spacer(1, 12))  # Add spacing between sessions
-    else:
-        elements.append(Paragraph("No pending matches available.", styles['Normal']))
-
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', session["batch_name"])
-    return send_file(
-        BytesIO(pdf),
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'tournament_schedule_{safe_batch_name}.pdf'
-    )
+# One knockout bracket, round by round (?format=json for JSON)
+@app.route('/matches/brackets/<int:bracket_id>')
+@login_required
+def bracket_page(bracket_id):
+    conn = get_db_connection()
+    view = brackets.bracket_view(conn, bracket_id)
+    conn.close()
+    if view is None:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify(view)
+    return render_template('bracket.html', view=view, formats=brackets.FORMATS)
+
+# Boards, rooms and time slots for pending matches
+@app.route('/matches/schedule', methods=['GET', 'POST'])
+@login_required
+def schedule_boards():
+    conn = get_db_connection()
+    settings = scheduler.load_settings(conn)
+    rooms_text = scheduler.format_rooms(settings['rooms'])
+    if request.method == 'POST':
+        rooms_text = request.form.get('rooms', '')
+        try:
+            start = request.form.get('start', '').strip().replace('T', ' ')
+            if start:
+                datetime.datetime.strptime(start, scheduler.START_FORMAT)
+            settings = {
+                'rooms': scheduler.parse_rooms(rooms_text),
+                'rest_slots': int(request.form.get('rest_slots', 0)),
+                'slot_minutes': int(request.form.get('slot_minutes', 60)),
+                'start': start,
+            }
+            if settings['rest_slots'] < 0 or settings['slot_minutes'] < 1:
+                raise ValueError("Rest must be 0 or more slots and a slot at least 1 minute")
+        except ValueError as e:
+            flash(str(e), "error")
+        else:
+            conn.close()
+
+            def reschedule(conn):
+                scheduler.save_settings(conn, settings)
+                placed = scheduler.schedule(conn, settings, reschedule=True)
+                bump_data_version(conn)
+                return placed
+            placed = write_batch(reschedule)
+            live.notify(batch_db_path(session['batch_name']))
+            app.logger.info("Scheduled %d games in %d slots in %.3fs", placed.scheduled, placed.slots, placed.elapsed)
+            flash(f"Scheduled {placed.scheduled} matches in {placed.slots} sessions", "success")
+            if placed.unscheduled:
+                flash(f"No room takes the players of {len(placed.unscheduled)} matches: "
+                      f"{', '.join(map(str, sorted(placed.unscheduled)[:20]))}", "error")
+            return redirect(url_for('matches'))
+    summary = conn.execute('''
+        SELECT COUNT(*) AS pending, COUNT(sc.match_id) AS scheduled, MAX(sc.slot) + 1 AS slots
+        FROM Matches m LEFT JOIN Schedule sc ON sc.match_id = m.match_id
+        WHERE m.points_assigned = 0
+    ''').fetchone()
+    conn.close()
+    return render_template('schedule.html', settings=settings, rooms_text=rooms_text, summary=summary)
+
+# Download tournament schedule as PDF
+@app.route('/matches/export_schedule')
+@login_required
+def export_schedule():
+    safe_name = safe_batch_name(session["batch_name"])
+    return submit_report('schedule', {}, f'tournament_schedule_{safe_name}.pdf')
 
 # Download match results as PDF
 @app.route('/matches/export_results')
 @login_required
 def export_results():
-    conn = get_db_connection()
-    matches = conn.execute('''
-        SELECT m.match_id, s1.student_id AS s1_id, s1.name AS s1_name, s1.class AS s1_class,
-               s2.student_id AS s2_id, s2.name AS s2_name, s2.class AS s2_class, w.name AS winner_name
-        FROM Matches m
-        LEFT JOIN Students s1 ON m.student1_id = s1.student_id
-        LEFT JOIN Students s2 ON m.student2_id = s2.student_id
-        LEFT JOIN Students w ON m.winner_id = w.student_id
-        WHERE m.points_assigned = 1
-    ''').fetchall()
-    conn.close()
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=(A4[1], A4[0]))
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    elements.append(Paragraph(f"Chess Club Match Results - Batch {session['batch_name']}", styles['Title']))
-    elements.append(Paragraph(f"Generated on {datetime.date.today().strftime('%Y-%m-%d')}", styles['Normal']))
-    
-    if matches:
-        data = [['Match ID', 'Player 1 ID', 'Player 1 Name', 'Player 1 Class',
-                 'Player 2 ID', 'Player 2 Name', 'Player 2 Class', 'Winner']]
-        for match in matches:
-            data.append([
-                str(match['match_id']),
-                match['s1_id'],
-                match['s1_name'],
-                match['s1_class'],
-                match['s2_id'],
-                match['s2_name'],
-                match['s2_class'],
-                match['winner_name'] or 'Draw'
-            ])
-        
-        table = Table(data, colWidths=[20*mm, 20*mm, 40*mm, 20*mm, 20*mm, 40*mm, 20*mm, 40*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-    
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', session["batch_name"])
-    return send_file(
-        BytesIO(pdf),
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'match_results_{safe_batch_name}.pdf'
-    )
+    safe_name = safe_batch_name(session["batch_name"])
+    return submit_report('results', {}, f'match_results_{safe_name}.pdf')
 
 # Archive completed matches to history
 @app.route('/matches/archive')
 @login_required
 def archive_matches():
-    conn = get_db_connection()
-    conn.execute('''
-        INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date, batch_id)
-        SELECT student1_id, student2_id, winner_id, points_assigned, match_date, batch_id
-        FROM Matches
-        WHERE points_assigned = 1
-    ''')
-    conn.execute('DELETE FROM Matches WHERE points_assigned = 1')
-    conn.commit()
-    conn.close()
+    def archive(conn):
+        standings.archive_completed(conn)
+        conn.execute('''
+            INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date, batch_id)
+            SELECT student1_id, student2_id, winner_id, points_assigned, match_date, batch_id
+            FROM Matches
+            WHERE points_assigned = 1
+        ''')
+        conn.execute('DELETE FROM Matches WHERE points_assigned = 1')
+        tiebreaks.rebuild_tiebreaks(conn)
+    write_batch(archive)
+    live.notify(batch_db_path(session['batch_name']))
     flash("Completed matches archived successfully", "success")
     return redirect(url_for('matches'))
 
-# Match history
+# Match history, one keyset page at a time (?format=json for JSON)
 @app.route('/match_history')
 @login_required
 def match_history():
+    sort, order, cursor, limit = parse_page_args(request.args, MATCH_SORT_COLUMNS, 'match_id')
     conn = get_db_connection()
-    matches = conn.execute('''
-        SELECT m.*, s1.name AS s1_name, s2.name AS s2_name, w.name AS winner_name
-        FROM MatchHistory m
-        LEFT JOIN Students s1 ON m.student1_id = s1.student_id
-        LEFT JOIN Students s2 ON m.student2_id = s2.student_id
-        LEFT JOIN Students w ON m.winner_id = s1.student_id
-    ''').fetchall()
+    page = keyset_page(conn, 'm.*', 'MatchHistory m', 'match_id', MATCH_SORT_COLUMNS, sort, order, cursor, limit)
+    page.rows = roster.load(conn).with_names(page.rows)
+    conn.close()
+    if request.args.get('format') == 'json':
+        return jsonify(page.to_dict())
+    return render_template('match_history.html', matches=page.rows, page=page)
+
+# One month of archived games as JSON, including months in cold storage
+@app.route('/match_history/month/<month>')
+@login_required
+def match_history_month(month):
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        abort(404)
+    conn = get_db_connection()
+    games = history.month_games(conn, month)
+    cold = month in history.cold_months(conn)
     conn.close()
-    return render_template('match_history.html', matches=matches)
+    return jsonify(month=month, cold=cold, games=games)
 
 # Update match
 @app.route('/matches/update/<int:match_id>', methods=['GET', 'POST'])
 @login_required
 def update_match(match_id):
-    conn = get_db_connection()
-    match = conn.execute('''
-        SELECT m.*, s1.name AS s1_name, s2.name AS s2_name
-        FROM Matches m
-        LEFT JOIN Students s1 ON m.student1_id = s1.student_id
-        LEFT JOIN Students s2 ON m.student2_id = s2.student_id
-        WHERE m.match_id = ?
-    ''', (match_id,)).fetchone()
     if request.method == 'POST':
-        winner = request.form['winner']
-        if match['points_assigned'] == 0:
-            conn.execute('UPDATE Students SET matches_played = matches_played + 1 WHERE student_id = ?', (match['student1_id'],))
-            conn.execute('UPDATE Students SET matches_played = matches_played + 1 WHERE student_id = ?', (match['student2_id'],))
-            if winner == 'draw':
-                conn.execute('UPDATE Students SET points = points + 0.5 WHERE student_id = ?', (match['student1_id'],))
-                conn.execute('UPDATE Students SET points = points + 0.5 WHERE student_id = ?', (match['student2_id'],))
-            elif winner:
-                conn.execute('UPDATE Students SET points = points + 3 WHERE student_id = ?', (winner,))
-        conn.execute('UPDATE Matches SET winner_id = ?, points_assigned = 1 WHERE match_id = ?', (winner if winner != 'draw' else None, match_id))
-        conn.commit()
-        conn.close()
+        report = write_batch(results.apply_results, [(1, match_id, request.form['winner'])])
+        live.notify(batch_db_path(session['batch_name']))
+        if not report.ok:
+            flash(f"Match {match_id}: {report.errors[0][2]}", "error")
+        elif report.started:
+            flash(f"Knockout: {report.started} new match(es) added", "success")
         return redirect(url_for('matches'))
+    conn = get_db_connection()
+    match = conn.execute('SELECT * FROM Matches WHERE match_id = ?', (match_id,)).fetchone()
+    if match is not None:
+        match = roster.load(conn).with_names([match])[0]
     conn.close()
     return render_template('update_match.html', match=match)
 
+# Enter a round of results at once: a JSON body {"results": [{"match_id": ..., "winner": ...}]}
+# or a CSV upload with match_id,winner columns. All boards are applied or none are.
+@app.route('/matches/results', methods=['GET', 'POST'])
+@login_required
+def submit_results():
+    if request.method == 'POST':
+        if request.is_json:
+            try:
+                entries = results.read_json(request.get_json(silent=True))
+            except ValueError as e:
+                return jsonify({'ok': False, 'error': str(e)}), 400
+        else:
+            file = request.files.get('file')
+            if file is None or file.filename == '':
+                flash("No file selected", "error")
+                return redirect(url_for('submit_results'))
+            try:
+                entries = results.read_csv(file.stream)
+            except ValueError as e:
+                flash(str(e), "error")
+                return redirect(url_for('submit_results'))
+
+        report = write_batch(results.apply_results, entries)
+        live.notify(batch_db_path(session['batch_name']))
+        app.logger.info("Results for %d boards: %d applied, %d rescored, %d unchanged, %d errors in %.1f ms",
+                        report.boards, report.applied, report.rescored, report.unchanged, len(report.errors),
+                        report.elapsed * 1000)
+        if request.is_json:
+            return jsonify(report.to_dict()), 200 if report.ok else 422
+        if report.ok:
+            flash(f"Results saved: {report.applied} new, {report.rescored} changed, {report.unchanged} unchanged.", "success")
+            if report.started:
+                flash(f"Knockout: {report.started} new match(es) added", "success")
+            return redirect(url_for('matches'))
+        return render_template('submit_results.html', report=report)
+    return render_template('submit_results.html')
+
+# Live standings and boards for spectator screens, pushed as results come in
+@app.route('/live')
+@login_required
+def live_board():
+    return render_template('live.html', batch_name=session['batch_name'])
+
+# Server-Sent Events feed behind /live: a snapshot, then standings and boards deltas
+@app.route('/live/stream')
+@login_required
+def live_stream():
+    db_path = batch_db_path(session['batch_name'])
+    if not os.path.exists(db_path):
+        abort(404)
+    return Response(live.stream(db_path), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# All-time leaderboard over every batch (?format=json for JSON)
+@app.route('/analytics/leaderboard')
+@login_required
+def all_time_leaderboard():
+    players = cross_batch.leaderboard(limit=request.args.get('limit', 100, type=int))
+    if request.args.get('format') == 'json':
+        return jsonify(players)
+    return render_template('all_time_leaderboard.html', players=players)
+
+# A player's career across batches and head-to-head records (?format=json for JSON)
+@app.route('/analytics/player/<student_id>')
+@login_required
+def player_career(student_id):
+    career = cross_batch.player(student_id)
+    if not career['seasons'] and not career['head_to_head']:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify(career)
+    return render_template('player_career.html', career=career)
+
 # Leaderboard
 @app.route('/leaderboard')
 @login_required
 def leaderboard():
     class_filter = request.args.get('class', '')
     month_filter = request.args.get('month', '')
+    month_to = request.args.get('month_to', '')
     conn = get_db_connection()
     batch_name = session.get('batch_name')
-
-    if month_filter:
-        query = '''
-            SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
-                   SUM(CASE WHEN m.winner_id = s.student_id THEN 3
-                            WHEN m.winner_id IS NULL THEN 0.5
-                            ELSE 0 END) AS points
-            FROM MatchHistory m
-            JOIN Students s ON m.student1_id = s.student_id OR m.student2_id = s.student_id
-            WHERE strftime('%Y-%m', m.match_date) = ? AND m.points_assigned = 1
-            GROUP BY s.student_id
-        '''
-        params = (month_filter,)
-        if class_filter:
-            query = query.replace('WHERE', 'WHERE s.class = ? AND')
-            params = (class_filter, month_filter)
-        leaders = conn.execute(query, params).fetchall()
-    else:
-        query = '''
-            SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
-                   SUM(CASE WHEN m.winner_id = s.student_id THEN 3
-                            WHEN m.winner_id IS NULL THEN 0.5
-                            ELSE 0 END) AS points
-            FROM Matches m
-            JOIN Students s ON m.student1_id = s.student_id OR m.student2_id = s.student_id
-            WHERE m.batch_id = ? AND m.points_assigned = 1
-            GROUP BY s.student_id
-        '''
-        params = (batch_name,)
-        if class_filter:
-            query = query.replace('WHERE', 'WHERE s.class = ? AND')
-            params = (class_filter, batch_name)
-        leaders = conn.execute(query, params).fetchall()
+    try:
+        leaders = history.fetch_leaderboard(conn, month_filter, month_to, class_filter)
+    except ValueError as e:
+        flash(str(e), "error")
+        leaders = []
     conn.close()
-    return render_template('leaderboard.html', leaders=leaders, class_filter=class_filter, month_filter=month_filter, batch_name=batch_name)
+    return render_template('leaderboard.html', leaders=leaders, class_filter=class_filter, month_filter=month_filter,
+                           month_to=month_to, batch_name=batch_name)
 
 # Download leaderboard as PDF
 @app.route('/leaderboard/export')
 @login_required
 def export_leaderboard():
-    class_filter = request.args.get('class', '')
-    month_filter = request.args.get('month', '')
-    conn = get_db_connection()
-    batch_name = session.get('batch_name')
-
-    if month_filter:
-        query = '''
-            SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
-                   SUM(CASE WHEN m.winner_id = s.student_id THEN 3
-                            WHEN m.winner_id IS NULL THEN 0.5
-                            ELSE 0 END) AS points
-            FROM MatchHistory m
-            JOIN Students s ON m.student1_id = s.student_id OR m.student2_id = s.student_id
-            WHERE strftime('%Y-%m', m.match_date) = ? AND m.points_assigned = 1
-            GROUP BY s.student_id
-            ORDER BY points DESC
-        '''
-        params = (month_filter,)
-        if class_filter:
-            query = query.replace('WHERE', 'WHERE s.class = ? AND')
-            params = (class_filter, month_filter)
-        leaders = conn.execute(query, params).fetchall()
-    else:
-        query = '''
-            SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
-                   SUM(CASE WHEN m.winner_id = s.student_id THEN 3
-                            WHEN m.winner_id IS NULL THEN 0.5
-                            ELSE 0 END) AS points
-            FROM Matches m
-            JOIN Students s ON m.student1_id = s.student_id OR m.student2_id = s.student_id
-            WHERE m.batch_id = ? AND m.points_assigned = 1
-            GROUP BY s.student_id
-            ORDER BY points DESC
-        '''
-        params = (batch_name,)
-        if class_filter:
-            query = query.replace('WHERE', 'WHERE s.class = ? AND')
-            params = (class_filter, batch_name)
-        leaders = conn.execute(query, params).fetchall()
-    conn.close()
+    params = {'class': request.args.get('class', ''), 'month': request.args.get('month', ''),
+              'month_to': request.args.get('month_to', '')}
+    try:
+        history.check_range(params['month'], params['month_to'])
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for('leaderboard', **request.args))
+    safe_name = safe_batch_name(session["batch_name"])
+    return submit_report('leaderboard', params, f'leaderboard_{safe_name}.pdf')
+
+# Report job page; polls the status endpoint until the PDF is ready
+@app.route('/jobs/<job_id>')
+@login_required
+def job_page(job_id):
+    job = get_job_or_404(job_id)
+    return render_template('job_status.html', job=job)
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=(A4[1], A4[0]))
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    title = f"Chess Club Leaderboard - Batch {batch_name}"
-    if month_filter:
-        title += f" ({month_filter})"
-    elements.append(Paragraph(title, styles['Title']))
-    elements.append(Paragraph(f"Generated on {datetime.date.today().strftime('%Y-%m-%d')}", styles['Normal']))
-    
-    if leaders:
-        data = [['Rank', 'Student ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year', 'Points', 'Matches Played']]
-        for i, leader in enumerate(leaders):
-            data.append([
-                str(i + 1),
-                leader['student_id'],
-                leader['name'],
-                leader['class'],
-                leader['roll'],
-                leader['mobile'],
-                leader['year'],
-                str(leader['points']),
-                str(leader['matches_played'])
-            ])
-        
-        table = Table(data, colWidths=[15*mm, 20*mm, 40*mm, 20*mm, 20*mm, 25*mm, 20*mm, 20*mm, 20*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-    
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', session["batch_name"])
-    return send_file(
-        BytesIO(pdf),
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'leaderboard_{safe_batch_name}.pdf'
+# Report job status as JSON
+@app.route('/jobs/<job_id>/status')
+@login_required
+def job_status(job_id):
+    job = get_job_or_404(job_id)
+    return jsonify(
+        job_id=job['job_id'],
+        kind=job['kind'],
+        status=job['status'],
+        progress=job['progress'],
+        error=job['error'],
+        download_url=url_for('download_job', job_id=job_id) if job['status'] == jobs.DONE else None,
     )
 
+# Download a finished report
+@app.route('/jobs/<job_id>/download')
+@login_required
+def download_job(job_id):
+    job = get_job_or_404(job_id)
+    if job['status'] != jobs.DONE or not os.path.exists(job['result_path']):
+        abort(404)
+    sha = os.path.splitext(os.path.basename(job['result_path']))[0]
+    return send_report(job['result_path'], sha, job['download_name'])
+
+# Download a cached report by its cache key
+@app.route('/reports/<key>')
+@login_required
+def download_report(key):
+    cached = report_jobs.cached(key)
+    if cached is None or cached[0] != session.get('batch_name'):
+        abort(404)
+    _, sha, path = cached
+    return send_report(path, sha, request.args.get('name', 'report.pdf'))
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
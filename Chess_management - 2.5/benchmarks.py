@@ -0,0 +1,867 @@
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import click
+import numpy as np
+from flask import request, request_finished
+
+import analytics
+import brackets
+import database
+import metrics
+import pairing
+import ratings
+import reports
+import results
+import roster
+import scheduler
+import standings
+import tiebreaks
+import write_queue
+from db_pool import ConnectionPool
+
+# Benchmark suite. A seeded generator builds batch databases of a given
+# size (students, active matches, archived history), and each scale is then
+# timed end to end: every route in app.py through the Flask test client (the
+# read-only pages first, then a tournament-day cycle of results, archiving,
+# pairing and scheduling), each PDF report built directly and as a job, and
+# pairing on its own. Timings go to a JSON file and can be compared with a
+# stored baseline; a case whose median is more than --threshold slower is a
+# regression and makes the run exit with status 1.
+#
+#   python benchmarks.py --scales small,medium --save-baseline
+#   python benchmarks.py --baseline benchmarks_baseline.json --threshold 0.25
+#   python benchmarks.py --component pairing --component reports
+#
+# Everything runs in a temporary directory, so the DB/ next to the app is
+# never touched.
+
+SCALES = {
+    'small': {'students': 200, 'matches': 200, 'history': 5000},
+    'medium': {'students': 2000, 'matches': 1000, 'history': 50000},
+    'large': {'students': 10000, 'matches': 5000, 'history': 300000},
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+# Archived games span this many months back from HISTORY_END
+HISTORY_MONTHS = 24
+HISTORY_END = datetime.date(2025, 12, 31)
+# Medians faster than this (ms) are never reported as regressions; their noise is larger than any change
+NOISE_FLOOR_MS = 2.0
+KNOCKOUT_PLAYERS = 64
+
+_FIRST_NAMES = ('Arif', 'Nusrat', 'Tanvir', 'Farhana', 'Rafiq', 'Sadia', 'Imran', 'Tahmina', 'Kamal', 'Ayesha',
+                'Rakib', 'Mitu', 'Sohel', 'Jannat', 'Hasan', 'Ruma')
+_LAST_NAMES = ('Rahman', 'Hossain', 'Islam', 'Ahmed', 'Akter', 'Khan', 'Chowdhury', 'Sarkar', 'Das', 'Uddin')
+
+# Read-only routes; {...} fields come from the batch's fixtures
+READ_ROUTES = [
+    '/',
+    '/students',
+    '/students?sort=points&order=desc',
+    '/students?format=json',
+    '/students?q={name_prefix}',
+    '/students/search?q={name_prefix}',
+    '/students/add',
+    '/students/edit/{student_id}',
+    '/students/import_csv',
+    '/students/export_csv',
+    '/students/export_entry_fee',
+    '/students/export_entry_fee_form',
+    '/entry_fee_history',
+    '/matches',
+    '/matches?sort=match_id&order=desc',
+    '/matches/export_csv',
+    '/matches/update/{match_id}',
+    '/matches/results',
+    '/matches/schedule',
+    '/matches/brackets',
+    '/matches/brackets/{bracket_id}',
+    '/matches/brackets/{bracket_id}?format=json',
+    '/match_history',
+    '/match_history?format=json',
+    '/match_history/export_csv',
+    '/match_history/month/{month}',
+    '/leaderboard',
+    '/leaderboard?class=7',
+    '/leaderboard?month={month}',
+    '/leaderboard?month={first_month}&month_to={month}',
+    '/live',
+    '/analytics/leaderboard',
+    '/analytics/player/{student_id}',
+    '/db_stats',
+    '/metrics',
+    '/select_batch',
+    '/login',
+]
+
+# Report kind -> (export route, method, form data, build params)
+REPORT_ROUTES = {
+    'schedule': ('/matches/export_schedule', 'GET', None, {}),
+    'results': ('/matches/export_results', 'GET', None, {}),
+    'leaderboard': ('/leaderboard/export', 'GET', None, {'class': '', 'month': '', 'month_to': ''}),
+    'entry_fee': ('/students/export_entry_fee', 'POST', {'fee_amount': '100'}, {'fee_amount': 100.0}),
+    'entry_fee_form': ('/students/export_entry_fee_form', 'POST', {'fee_amount': '100'},
+                       {'fee_amount': 100.0, 'all_students': True}),
+}
+
+
+def _month_key(months_back):
+    months = HISTORY_END.year * 12 + HISTORY_END.month - 1 - months_back
+    return f'{months // 12:04d}-{months % 12 + 1:02d}'
+
+
+def generate(batch_name, students, matches, history, seed=42):
+    """Create the batch database for batch_name filled with seeded synthetic data; return its fixtures.
+
+    history archived games spread over HISTORY_MONTHS months, a knockout of
+    up to KNOCKOUT_PLAYERS players, then matches active matches of which
+    half have results. Students' points, standings, ratings and tie-breaks
+    agree with the games.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(database.batch_db_path(batch_name)), exist_ok=True)
+    db_path = database.create_batch_database(batch_name)
+    conn = sqlite3.connect(db_path)
+    ids = [f'{i:05d}' for i in range(1, students + 1)]
+    classes = {sid: str(6 + rng.randrange(5)) for sid in ids}
+    conn.executemany('''
+        INSERT INTO Students (student_id, name, class, roll, mobile, year, paid_entry) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(sid, f'{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)} {sid}', classes[sid], str(rng.randrange(1, 61)),
+           f'017{rng.randrange(10 ** 8):08d}', '2025', int(rng.random() < 0.9)) for sid in ids])
+
+    def game(finished):
+        white, black = rng.sample(ids, 2)
+        if not finished:
+            return white, black, None, 0
+        outcome = rng.random()
+        return white, black, white if outcome < 0.45 else black if outcome < 0.85 else None, 1
+
+    archived = []
+    for _ in range(history):
+        day = HISTORY_END - datetime.timedelta(days=rng.randrange(HISTORY_MONTHS * 30))
+        archived.append(game(True) + (day.isoformat(), batch_name))
+    archived.sort(key=lambda row: row[4])
+    conn.executemany('''
+        INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date, batch_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', archived)
+    active = [game(i % 2 == 0) + (HISTORY_END.isoformat(), batch_name) for i in range(matches)]
+    conn.executemany('''
+        INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned, match_date, batch_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', active)
+
+    points = {}
+    played = {}
+    for white, black, winner, _, _, _ in archived + [row for row in active if row[3]]:
+        for player in (white, black):
+            points[player] = points.get(player, 0) + (3 if winner == player else 0.5 if winner is None else 0)
+            played[player] = played.get(player, 0) + 1
+    conn.executemany('UPDATE Students SET points = ?, matches_played = ? WHERE student_id = ?',
+                     [(points[sid], played[sid], sid) for sid in points])
+    database._rebuild_derived(conn)
+    conn.commit()
+
+    seeds = brackets.load_seeds(conn, KNOCKOUT_PLAYERS)
+    # Schedules every pending match as well
+    bracket = brackets.create_event(conn, brackets.SINGLE_ELIMINATION, seeds, batch_name)
+    conn.commit()
+    pending = conn.execute('SELECT MIN(match_id) FROM Matches WHERE points_assigned = 0').fetchone()[0]
+    conn.close()
+    return {
+        'db_path': db_path,
+        'student_id': ids[len(ids) // 2],
+        'name_prefix': rng.choice(_FIRST_NAMES)[:3],
+        'match_id': pending,
+        'bracket_id': bracket.bracket_id,
+        'month': _month_key(1),
+        'first_month': _month_key(HISTORY_MONTHS // 2),
+        'import_rows': max(students // 10, 10),
+    }
+
+
+class Timings:
+    """Seconds per case, in the order the cases first ran."""
+
+    def __init__(self):
+        self.cases = {}
+
+    def time(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.cases.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        return {name: {'median_ms': statistics.median(runs) * 1000, 'min_ms': min(runs) * 1000,
+                       'max_ms': max(runs) * 1000, 'runs': len(runs)}
+                for name, runs in self.cases.items()}
+
+
+def _ok(response, codes=(200, 302)):
+    if response.status_code not in codes:
+        raise RuntimeError(f'{response.request.method} {response.request.path}: HTTP {response.status_code}')
+    return response
+
+
+def _wait_report(client, response):
+    """Follow a submit_report JSON response to the finished PDF; return (job_id, download_url)."""
+    body = _ok(response, (200, 202)).get_json()
+    if response.status_code == 200:
+        return None, body['download_url']
+    while True:
+        status = _ok(client.get(body['status_url'])).get_json()
+        if status['status'] == 'done':
+            return body['job_id'], status['download_url']
+        if status['status'] == 'failed':
+            raise RuntimeError(f"Report job failed: {status['error']}")
+        time.sleep(0.005)
+
+
+def _import_csv(rows, rng):
+    lines = ['ID,Name,Class,Roll,Mobile,Year']
+    lines += [f',{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)},{6 + i % 5},{i},017{rng.randrange(10 ** 8):08d},2025'
+              for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def run_scale(app_module, scale, sizes, repeat, seed, log):
+    """Generate the scale's batch and time every case on it; return Timings."""
+    timings = Timings()
+    batch_name = f'Benchmark {scale}'
+    start = time.perf_counter()
+    fixtures = generate(batch_name, seed=seed, **sizes)
+    app_module.batch_catalog.sync(database.list_batch_databases())
+    app_module.batch_catalog.register(batch_name, database.safe_batch_name(batch_name), fixtures['db_path'])
+    log(f'{scale}: generated {sizes} in {time.perf_counter() - start:.1f}s')
+    rng = random.Random(seed)
+    client = app_module.app.test_client()
+    _ok(timings.time('POST /login', client.post, '/login', data={'username': 'admin', 'password': 'admin123'}))
+    _ok(client.post('/select_batch', data={'action': 'select', 'batch_name': batch_name}))
+
+    # Read-only pages, each repeat times over the same data
+    for route in READ_ROUTES:
+        url = route.format(**fixtures)
+        for _ in range(repeat):
+            _ok(timings.time(f'GET {route}', client.get, url))
+
+    def first_event():
+        response = client.get('/live/stream', buffered=False)
+        next(response.response)
+        response.close()
+    for _ in range(repeat):
+        timings.time('GET /live/stream (first event)', first_event)
+
+    # Reports: built directly, then as a job through the export route, then served from the report cache.
+    # Untimed jobs first, one per report process, so no timing includes starting them
+    warm_up = [client.get(f'/leaderboard/export?class={6 + i}&format=json')
+               for i in range(app_module.report_jobs.workers)]
+    for response in warm_up:
+        _wait_report(client, response)
+    for kind, (route, method, data, params) in REPORT_ROUTES.items():
+        builder = 'entry_fee' if kind.startswith('entry_fee') else kind
+        for _ in range(repeat):
+            timings.time(f'pdf {kind}', reports.build_report, builder, fixtures['db_path'], batch_name, params)
+        job_id, download_url = timings.time(
+            f'{method} {route} (job to PDF)',
+            lambda: _wait_report(client, client.open(f'{route}?format=json', method=method, data=data)))
+        for _ in range(repeat):
+            _ok(timings.time(f'GET /jobs/<job_id>', client.get, f'/jobs/{job_id}'))
+            _ok(timings.time(f'GET /jobs/<job_id>/status', client.get, f'/jobs/{job_id}/status'))
+            _ok(timings.time(f'GET /jobs/<job_id>/download', client.get, download_url))
+            cached = timings.time(f'{method} {route} (cached)', client.open, f'{route}?format=json',
+                                  method=method, data=data)
+            _ok(timings.time('GET /reports/<key>', client.get, _ok(cached).get_json()['download_url']))
+    for name in os.listdir('Entry_fee'):
+        for _ in range(repeat):
+            _ok(timings.time('GET /entry_fee/download/<filename>', client.get, f'/entry_fee/download/{name}'))
+
+    conn = sqlite3.connect(f"file:{fixtures['db_path']}?mode=ro", uri=True)
+    for rounds in (1, 5):
+        for _ in range(repeat):
+            timings.time(f'pairing {rounds} round(s)', pairing.pair_batch, conn, rounds)
+    conn.close()
+
+    # Tournament-day cycle: edits, imports, results for every pending board, archive, pair and schedule
+    student_id = fixtures['student_id']
+    rooms = 'Junior: 40: 6, 7, 8\nSenior: 40: 9, 10\nHall: 20'
+    for cycle in range(repeat):
+        _ok(timings.time('GET /students/toggle_paid/<student_id>', client.get, f'/students/toggle_paid/{student_id}'))
+        _ok(timings.time('GET /students/toggle_all_paid', client.get, '/students/toggle_all_paid'))
+        _ok(timings.time('POST /students/add', client.post, '/students/add',
+                         data={'name': f'Walk-in {cycle}', 'class': '8', 'roll': '1', 'mobile': '', 'year': '2025'}))
+        _ok(timings.time('POST /students/edit/<student_id>', client.post, f'/students/edit/{student_id}',
+                         data={'name': f'Edited {cycle}', 'class': '9', 'roll': '2', 'mobile': '', 'year': '2025'}))
+        csv_data = _import_csv(fixtures['import_rows'], rng)
+        _ok(timings.time('POST /students/import_csv', client.post, '/students/import_csv',
+                         data={'file': (io.BytesIO(csv_data), 'students.csv')}, content_type='multipart/form-data'))
+        _ok(timings.time('POST /students/import_csv (dry run)', client.post, '/students/import_csv',
+                         data={'file': (io.BytesIO(csv_data), 'students.csv'), 'dry_run': '1'},
+                         content_type='multipart/form-data'))
+        conn = sqlite3.connect(f"file:{fixtures['db_path']}?mode=ro", uri=True)
+        boards = conn.execute('SELECT match_id, student1_id FROM Matches WHERE points_assigned = 0').fetchall()
+        conn.close()
+        if boards:
+            match_id, white = boards[0]
+            _ok(timings.time('POST /matches/update/<match_id>', client.post, f'/matches/update/{match_id}',
+                             data={'winner': white}))
+        # Knockout games advance as results come in; keep entering results until nothing is left
+        while boards:
+            entries = [{'match_id': match_id, 'winner': rng.choice((white, 'draw', '0-1'))}
+                       for match_id, white in boards]
+            _ok(timings.time('POST /matches/results (JSON)', client.post, '/matches/results',
+                             json={'results': entries}))
+            conn = sqlite3.connect(f"file:{fixtures['db_path']}?mode=ro", uri=True)
+            boards = conn.execute('SELECT match_id, student1_id FROM Matches WHERE points_assigned = 0').fetchall()
+            conn.close()
+        _ok(timings.time('GET /matches/archive', client.get, '/matches/archive'))
+        _ok(timings.time('POST /matches/auto', client.post, '/matches/auto', data={'max_matches': '1'}))
+        _ok(timings.time('POST /matches/schedule', client.post, '/matches/schedule',
+                         data={'rooms': rooms, 'rest_slots': '0', 'slot_minutes': '60', 'start': '2026-01-10 09:00'}))
+        _ok(timings.time('GET /matches (after pairing)', client.get, '/matches'))
+        _ok(timings.time('GET /leaderboard (after results)', client.get, '/leaderboard'))
+
+    # A knockout needs a finished round, so it is created once after the last one
+    conn = sqlite3.connect(f"file:{fixtures['db_path']}?mode=ro", uri=True)
+    boards = conn.execute('SELECT match_id, student1_id FROM Matches WHERE points_assigned = 0').fetchall()
+    conn.close()
+    _ok(client.post('/matches/results', json={'results': [{'match_id': m, 'winner': w} for m, w in boards]}))
+    _ok(timings.time('POST /matches/brackets', client.post, '/matches/brackets',
+                     data={'format': brackets.SINGLE_ELIMINATION, 'players': str(KNOCKOUT_PLAYERS), 'class': ''}))
+    _ok(timings.time('GET /logout', client.get, '/logout'))
+    return timings
+
+
+def compare(results, baseline, threshold, floor_ms=NOISE_FLOOR_MS):
+    """Return [(case, baseline ms, current ms, ratio)] for cases slower than baseline by more than threshold."""
+    regressions = []
+    for case, current in results['cases'].items():
+        before = baseline['cases'].get(case)
+        if before is None:
+            continue
+        ratio = current['median_ms'] / before['median_ms'] if before['median_ms'] else 1.0
+        if ratio > 1 + threshold and current['median_ms'] - before['median_ms'] > floor_ms:
+            regressions.append((case, before['median_ms'], current['median_ms'], ratio))
+    return regressions
+
+
+def run(scales, repeat=5, seed=42, log=print):
+    """Run every scale in a fresh temporary directory; return the results dict."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as work:
+        os.chdir(work)
+        sys.path.insert(0, here)
+        try:
+            import app as app_module
+            app_module.app.config['TESTING'] = True
+            # Endpoints requested, to list any route of app.py the suite does not reach
+            reached = set()
+            request_finished.connect(lambda sender, response, **extra: reached.add(request.endpoint),
+                                     app_module.app, weak=False)
+            cases = {}
+            try:
+                for scale in scales:
+                    for name, stats in run_scale(app_module, scale, SCALES[scale], repeat, seed, log).summary().items():
+                        cases[f'{scale}: {name}'] = stats
+            finally:
+                app_module.report_jobs.shutdown()
+                app_module.cross_batch.shutdown()
+            uncovered = sorted(rule.endpoint for rule in app_module.app.url_map.iter_rules()
+                               if rule.endpoint != 'static' and rule.endpoint not in reached)
+        finally:
+            os.chdir(previous)
+    return {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'scales': {scale: SCALES[scale] for scale in scales},
+        'uncovered_endpoints': uncovered,
+        'cases': cases,
+    }
+
+
+# Component benchmarks: each module's hot path timed on its own, on
+# synthetic input, without the app. Run with --component; they print their
+# timings and are not compared with the baseline.
+
+def _report_batch(db_path, players, matches):
+    """Fill db_path with players students and matches matches, half of them completed."""
+    rng = random.Random(42)
+    database.migrate_database(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO Students (student_id, name, class, roll, mobile, year, paid_entry) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(f'{i:05d}', f'Player {i}', str(6 + i % 5), str(i), f'0171{i:07d}', '2025', i % 2)
+         for i in range(1, players + 1)])
+    rows = []
+    for i in range(matches):
+        s1, s2 = (f'{n:05d}' for n in rng.sample(range(1, players + 1), 2))
+        if i % 2:
+            rows.append((s1, s2, rng.choice((s1, s2, None)), 1))
+        else:
+            rows.append((s1, s2, None, 0))
+    conn.executemany('INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned) VALUES (?, ?, ?, ?)',
+                     rows)
+    standings.rebuild_standings(conn)
+    conn.commit()
+    conn.close()
+
+
+def _memory_batch(ids):
+    """An in-memory batch database with the paid students ids."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.apply_migrations(conn)
+    conn.executemany('''
+        INSERT INTO Students (student_id, name, class, roll, mobile, year, points, matches_played, paid_entry)
+        VALUES (?, ?, '10A', '', '', '2025', 0, 0, 1)
+    ''', [(sid, f'Player {sid}') for sid in ids])
+    conn.commit()
+    return conn
+
+
+def bench_pairing(log=print, players=10000, past_rounds=5, rounds=1):
+    """Time pairing players who have already played past_rounds rounds; return seconds per round."""
+    rng = random.Random(42)
+    ids = [f'{i:05d}' for i in range(players)]
+    field = [(sid, rng.choice((0, 0.5, 3, 3.5, 6, 6.5, 9)), past_rounds, rng.gauss(1200, 200)) for sid in ids]
+    played = []
+    for _ in range(past_rounds):
+        shuffled = ids[:]
+        rng.shuffle(shuffled)
+        played.extend(zip(shuffled[::2], shuffled[1::2]))
+    result = pairing.swiss_pairings(field, played, rounds)
+    per_round = result.elapsed / rounds
+    log(f'{players} players, {len(played)} past games: {per_round * 1000:.0f} ms per round, '
+        f'{len(result.pairs)} pairs, {len(result.byes)} byes, {result.rematches} rematches')
+    return per_round
+
+
+def bench_ratings(log=print, players=10000, games=200000):
+    """Time a full recompute of games random games between players; return games per second."""
+    rng = np.random.default_rng(42)
+    white = rng.integers(0, players, games)
+    black = (white + rng.integers(1, players, games)) % players
+    scores = rng.choice(np.array([0.0, 0.5, 1.0]), games)
+    start = time.perf_counter()
+    state = ratings.rate_games(players, white, black, scores)
+    elapsed = time.perf_counter() - start
+    log(f'{games} games, {players} players: {elapsed:.2f}s, {games / elapsed:,.0f} games/s '
+        f'(top Elo {state.elo.max():.0f}, top Glicko {state.glicko.max():.0f})')
+    return games / elapsed
+
+
+def bench_tiebreaks(log=print, players=5000, rounds=11):
+    """Time recomputing and storing a period of players over rounds rounds; return seconds."""
+    rng = random.Random(42)
+    ids = [f'{i:05d}' for i in range(players)]
+    games = []
+    for _ in range(rounds):
+        shuffled = ids[:]
+        rng.shuffle(shuffled)
+        games.extend((a, b, rng.choice((a, b, None))) for a, b in zip(shuffled[::2], shuffled[1::2]))
+    conn = sqlite3.connect(':memory:')
+    tiebreaks.create_tiebreaks_table(conn)
+    start = time.perf_counter()
+    values = tiebreaks.compute(games)
+    computed = time.perf_counter()
+    tiebreaks._store(conn, standings.CURRENT_PERIOD, values)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    log(f'{players} players, {len(games)} games: {elapsed * 1000:.0f} ms '
+        f'({(computed - start) * 1000:.0f} ms computing)')
+    return elapsed
+
+
+def bench_results(log=print, players=1000, boards=500):
+    """Time entering one round of boards results into a fresh in-memory batch; return seconds."""
+    rng = random.Random(42)
+    ids = [f'{i:05d}' for i in range(players)]
+    conn = _memory_batch(ids)
+    rng.shuffle(ids)
+    conn.executemany('''
+        INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) VALUES (?, ?, 0, '2025-01-01')
+    ''', list(zip(ids[0:2 * boards:2], ids[1:2 * boards:2])))
+    conn.commit()
+    entries = [(board, match_id, rng.choice(('1-0', '0-1', 'draw')))
+               for board, (match_id,) in enumerate(conn.execute('SELECT match_id FROM Matches'), 1)]
+    report = results.apply_results(conn, entries)
+    again = results.apply_results(conn, entries)
+    conn.close()
+    log(f'{boards} boards: {report.elapsed * 1000:.1f} ms ({report.applied} applied, {len(report.errors)} errors); '
+        f'resubmitted: {again.elapsed * 1000:.1f} ms ({again.unchanged} unchanged)')
+    return report.elapsed
+
+
+def bench_brackets(log=print, players=1000):
+    """Time generating and playing through players-player events in an in-memory batch; return seconds."""
+    rng = random.Random(42)
+    ids = [f'{i:05d}' for i in range(players)]
+    start = time.perf_counter()
+    games = brackets.round_robin(ids)
+    log(f'{brackets.FORMATS[brackets.ROUND_ROBIN]}, {players} players: Berger table of {len(games)} games in '
+        f'{(time.perf_counter() - start) * 1000:.0f} ms')
+    for event_format in (brackets.SINGLE_ELIMINATION, brackets.DOUBLE_ELIMINATION):
+        conn = _memory_batch(ids)
+        created = brackets.create_event(conn, event_format, brackets.load_seeds(conn))
+        conn.commit()
+        start = time.perf_counter()
+        rounds = 0
+        while True:
+            pending = conn.execute('SELECT match_id, student1_id, student2_id FROM Matches '
+                                   'WHERE points_assigned = 0').fetchall()
+            if not pending:
+                break
+            rounds += 1
+            report = results.apply_results(conn, [(i, m[0], rng.choice((m[1], m[1], m[2], 'draw')))
+                                                  for i, m in enumerate(pending, 1)])
+            assert report.ok, report.errors[:3]
+        played = time.perf_counter() - start
+        champion = conn.execute('SELECT champion_id FROM Brackets').fetchone()[0]
+        total = conn.execute('SELECT COUNT(*) FROM Matches').fetchone()[0]
+        conn.close()
+        log(f'{brackets.FORMATS[event_format]}, {players} players: generated in {created.elapsed * 1000:.0f} ms; '
+            f'{total} games over {rounds} result rounds in {played:.2f} s, champion {champion}')
+    return created.elapsed
+
+
+def bench_scheduler(log=print, players=2000, rounds=10, boards=100, rest_slots=1):
+    """Time placing rounds of players on boards over two class rooms and a hall; return seconds."""
+    rng = random.Random(42)
+    classes = {f'{i:05d}': str(6 + i % 5) for i in range(players)}
+    ids = list(classes)
+    games = []
+    for _ in range(rounds):
+        rng.shuffle(ids)
+        for white, black in zip(ids[0::2], ids[1::2]):
+            games.append((len(games) + 1, white, black, classes[white], classes[black]))
+    rooms = [{'name': 'Junior', 'boards': boards // 2, 'classes': ['6', '7', '8']},
+             {'name': 'Senior', 'boards': boards // 2, 'classes': ['9', '10']},
+             {'name': 'Hall', 'boards': boards // 2, 'classes': []}]
+    start = time.perf_counter()
+    assignments, unscheduled = scheduler.plan(games, rooms, rest_slots)
+    elapsed = time.perf_counter() - start
+
+    seen = set()
+    slot_of = {match_id: slot for match_id, slot, _, _ in assignments}
+    by_player = {}
+    for match_id, slot, room, board in assignments:
+        assert (slot, room, board) not in seen
+        seen.add((slot, room, board))
+    for match_id, white, black, _, _ in games:
+        for player in (white, black):
+            by_player.setdefault(player, []).append(slot_of[match_id])
+    for slots in by_player.values():
+        slots.sort()
+        assert all(b - a > rest_slots for a, b in zip(slots, slots[1:]))
+    makespan = 1 + max(slot_of.values())
+    log(f'{len(games)} games, {players} players, {len(rooms) * (boards // 2)} boards, rest {rest_slots}: '
+        f'{elapsed * 1000:.0f} ms, {makespan} slots ({len(unscheduled)} unscheduled)')
+    return elapsed
+
+
+def bench_reports(log=print, players=10000, matches=20000):
+    """Time every report kind on a generated batch; return {kind: seconds}."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'batch_benchmark_database.db')
+        _report_batch(db_path, players, matches)
+        for kind, params in (('entry_fee', {'fee_amount': 100, 'all_students': True}),
+                             ('schedule', {}),
+                             ('results', {}),
+                             ('leaderboard', {})):
+            start = time.perf_counter()
+            pdf = reports.build_report(kind, db_path, 'benchmark', params)
+            timings[kind] = time.perf_counter() - start
+            log(f'{kind:12} {timings[kind]:7.2f}s {len(pdf) / 1024:9.0f} KiB')
+    return timings
+
+
+def bench_roster(log=print, players=2000, matches=20000, repeat=200):
+    """Time match listings with the Students joins against the cached roster; return {name: seconds}."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'batch_benchmark_database.db')
+        _report_batch(db_path, players, matches)
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        cache = roster.RosterCache()
+        joined = '''
+            SELECT m.*, s1.name AS s1_name, s2.name AS s2_name, w.name AS winner_name
+            FROM Matches m
+            LEFT JOIN Students s1 ON m.student1_id = s1.student_id
+            LEFT JOIN Students s2 ON m.student2_id = s2.student_id
+            LEFT JOIN Students w ON m.winner_id = w.student_id
+        '''
+        plain = 'SELECT * FROM Matches m'
+        # The first page (or all) of the matches list in match_id order
+        page = ' WHERE m.match_id > ? ORDER BY m.match_id LIMIT ?'
+        for label, limit in (('page of 50', 50), (f'all {matches}', matches)):
+            runs = repeat if limit == 50 else max(repeat // 50, 3)
+            start = time.perf_counter()
+            for _ in range(runs):
+                [dict(row) for row in conn.execute(joined + page, (0, limit))]
+            timings[f'join, {label}'] = (time.perf_counter() - start) / runs
+            cache.get(conn)
+            start = time.perf_counter()
+            for _ in range(runs):
+                cache.get(conn).with_names(conn.execute(plain + page, (0, limit)))
+            timings[f'roster, {label}'] = (time.perf_counter() - start) / runs
+        start = time.perf_counter()
+        for _ in range(repeat):
+            roster.RosterCache().get(conn)
+        timings[f'roster load, {players} players'] = (time.perf_counter() - start) / repeat
+        conn.close()
+    for name, seconds in timings.items():
+        log(f'{name:32} {seconds * 1000:8.3f} ms')
+    return timings
+
+
+def bench_metrics(log=print, statements=200000):
+    """Time a cheap indexed query through a pooled connection with and without the statement observer."""
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+        conn.executemany('INSERT INTO t (v) VALUES (?)', [(str(i),) for i in range(1000)])
+        conn.commit()
+        conn.close()
+        registry = metrics.Registry()
+        timings = {}
+        for label, observer in (('off', None), ('on', registry.observe_statement)):
+            pool = ConnectionPool(observer=observer)
+            conn = pool.acquire(db_path)
+            start = time.perf_counter()
+            for i in range(statements):
+                conn.execute('SELECT v FROM t WHERE id = ?', (i % 1000 + 1,)).fetchone()
+            timings[label] = (time.perf_counter() - start) / statements
+            pool.release(conn)
+            pool.close_all()
+    log(f'{statements} statements: {timings["off"] * 1e6:.2f} us each without metrics, '
+        f'{timings["on"] * 1e6:.2f} us with (+{(timings["on"] - timings["off"]) * 1e6:.2f} us)')
+    return timings['on'] - timings['off']
+
+
+def _add_student(conn, name):
+    # add_student: the next ID is read before the insert starts the write transaction
+    max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
+    conn.execute('INSERT INTO Students (student_id, name, class, paid_entry) VALUES (?, ?, ?, 0)',
+                 (str(int(max_id) + 1).zfill(5), name, '7'))
+
+
+def _write_queue_worker(db_path, mode, threads, writes, failed):
+    pool = ConnectionPool(max_per_db=threads + 1)
+    writer = write_queue.WriteQueue(pool)
+    failures = [0]
+    count_lock = threading.Lock()
+
+    def client(number):
+        for i in range(writes):
+            name = f'Walk-in {os.getpid()}-{number}-{i}'
+            try:
+                if mode == 'queue':
+                    writer.run(db_path, _add_student, name)
+                else:
+                    conn = pool.acquire(db_path)
+                    try:
+                        _add_student(conn, name)
+                        conn.commit()
+                    finally:
+                        pool.release(conn)
+            except sqlite3.Error:
+                with count_lock:
+                    failures[0] += 1
+
+    clients = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    failed.put(failures[0])
+
+
+def bench_write_queue(log=print, processes=4, threads=8, writes=100):
+    """Time processes x threads clients each adding writes students, directly and through the queue."""
+    context = multiprocessing.get_context('fork')
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'batch_benchmark_database.db')
+        database.migrate_database(db_path)
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO Students (student_id, name, class, paid_entry) VALUES ('00001', 'Player 1', '7', 0)")
+        conn.commit()
+        conn.close()
+        total = processes * threads * writes
+        for mode in ('direct', 'queue'):
+            conn = sqlite3.connect(db_path)
+            before = conn.execute('SELECT COUNT(*) FROM Students').fetchone()[0]
+            failed = context.Queue()
+            workers = [context.Process(target=_write_queue_worker, args=(db_path, mode, threads, writes, failed))
+                       for _ in range(processes)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            failures = sum(failed.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            written = conn.execute('SELECT COUNT(*) FROM Students').fetchone()[0] - before
+            conn.close()
+            assert written == total - failures
+            timings[mode] = elapsed
+            log(f'{mode:6} {processes} processes x {threads} threads: {total} writes in {elapsed:.2f}s '
+                f'({written / elapsed:.0f} committed/s), {failures} failed')
+    return timings
+
+
+class _StaticCatalog:
+    """Stands in for catalog.Catalog with a fixed list of batches."""
+
+    def __init__(self, catalog_db, batches):
+        self.catalog_db = catalog_db
+        self.rows = batches
+
+    def batches(self):
+        return self.rows
+
+
+def _analytics_batches(directory, count, players, games):
+    """Create count batch files of players students and games completed games each; return catalog-style rows."""
+    rng = random.Random(42)
+    pool = [f'{i:05d}' for i in range(players * 3)]
+    batches = []
+    for b in range(count):
+        db_path = os.path.join(directory, f'batch_bench{b}_database.db')
+        database.migrate_database(db_path)
+        conn = sqlite3.connect(db_path)
+        ids = rng.sample(pool, players)
+        conn.executemany("INSERT INTO Students (student_id, name, class, points, matches_played) "
+                         "VALUES (?, ?, '9', 0, 0)", [(sid, f'Player {sid}') for sid in ids])
+        rows = []
+        for _ in range(games):
+            white, black = rng.sample(ids, 2)
+            rows.append((white, black, rng.choice((white, black, None)), f'2025-{rng.randint(1, 12):02d}-01'))
+        conn.executemany('''
+            INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date)
+            VALUES (?, ?, ?, 1, ?)
+        ''', rows)
+        standings.rebuild_standings(conn)
+        conn.commit()
+        conn.close()
+        batches.append({'db_path': db_path, 'batch_name': f'bench{b}', 'created_at': b, 'data_version': 0})
+    return batches
+
+
+def bench_analytics(log=print, batch_counts=(50, 100, 200, 250), players=300, games=1500, workers=None):
+    """Time the all-time leaderboard and a player career over growing numbers of batch files."""
+    with tempfile.TemporaryDirectory() as directory:
+        all_batches = _analytics_batches(directory, max(batch_counts), players, games)
+        for count in batch_counts:
+            for n_workers in sorted({1, workers or os.cpu_count() or 1}):
+                cross_batch = analytics.Analytics(
+                    _StaticCatalog(os.path.join(directory, f'catalog{count}_{n_workers}.db'), all_batches[:count]),
+                    workers=n_workers)
+                start = time.perf_counter()
+                top = cross_batch.leaderboard()
+                leaderboard_time = time.perf_counter() - start
+                start = time.perf_counter()
+                career = cross_batch.player(top[0]['student_id'])
+                player_time = time.perf_counter() - start
+                start = time.perf_counter()
+                cross_batch.leaderboard()
+                cached_time = time.perf_counter() - start
+                cross_batch.shutdown()
+                log(f'{count} batches, {n_workers} worker(s): leaderboard {leaderboard_time * 1000:.0f} ms, '
+                    f'player {player_time * 1000:.0f} ms ({len(career["head_to_head"])} opponents), '
+                    f'cached {cached_time * 1000:.1f} ms')
+
+
+COMPONENTS = {
+    'pairing': bench_pairing,
+    'ratings': bench_ratings,
+    'tiebreaks': bench_tiebreaks,
+    'results': bench_results,
+    'brackets': bench_brackets,
+    'scheduler': bench_scheduler,
+    'reports': bench_reports,
+    'roster': bench_roster,
+    'metrics': bench_metrics,
+    'write_queue': bench_write_queue,
+    'analytics': bench_analytics,
+}
+
+
+@click.command()
+@click.option('--scales', default='small,medium', show_default=True,
+              help=f"Comma-separated scales to run: {', '.join(SCALES)}.")
+@click.option('--repeat', default=5, show_default=True, help='Runs of each case (and tournament-day cycles).')
+@click.option('--seed', default=42, show_default=True, help='Seed of the data generator.')
+@click.option('--output', default='benchmark_results.json', show_default=True, help='Where to write the results.')
+@click.option('--baseline', default=DEFAULT_BASELINE, show_default=True, help='Results to compare against.')
+@click.option('--threshold', default=0.25, show_default=True,
+              help='Slowdown of a median over the baseline that counts as a regression (0.25 = 25%).')
+@click.option('--save-baseline', is_flag=True, help='Also write the results to --baseline.')
+@click.option('--component', 'components', multiple=True, type=click.Choice(list(COMPONENTS)),
+              help='Only run this component benchmark (repeatable) instead of the scales.')
+def main(scales, repeat, seed, output, baseline, threshold, save_baseline, components):
+    """Time every route, report, import/export and pairing on generated batches."""
+    if components:
+        for name in components:
+            click.echo(f'== {name}')
+            COMPONENTS[name](log=click.echo)
+        return
+    scales = [scale.strip() for scale in scales.split(',') if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        raise click.BadParameter(f"Unknown scale(s): {', '.join(unknown)}", param_hint='--scales')
+    output = os.path.abspath(output)
+    baseline = os.path.abspath(baseline)
+    results = run(scales, repeat, seed, log=click.echo)
+
+    width = max(len(case) for case in results['cases'])
+    for case, stats in results['cases'].items():
+        click.echo(f"{case:{width}}  {stats['median_ms']:10.2f} ms  (min {stats['min_ms']:.2f}, {stats['runs']} runs)")
+    if results['uncovered_endpoints']:
+        click.echo(f"Not covered: {', '.join(results['uncovered_endpoints'])}")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {output}')
+
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f'Baseline written to {baseline}')
+        return
+    if not os.path.exists(baseline):
+        click.echo(f'No baseline at {baseline}; run with --save-baseline to store one')
+        return
+    with open(baseline) as f:
+        stored = json.load(f)
+    regressions = compare(results, stored, threshold)
+    for case, before, after, ratio in regressions:
+        click.echo(f'REGRESSION {case}: {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)')
+    compared = len(set(results['cases']) & set(stored['cases']))
+    click.echo(f'{len(regressions)} regression(s) over {threshold:.0%} in {compared} case(s) compared '
+               f"with the baseline of {stored['created_at']}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+import datetime
+import json
+import time
+
+import ratings
+import roster
+import scheduler
+import standings
+
+# Round robins and knockout brackets.
+#
+# Round robins follow the FIDE Berger tables: every round is generated up
+# front and all of it goes into Matches at once. A double round robin plays
+# the table twice with colours reversed.
+#
+# A knockout bracket is a graph of nodes stored in BracketNodes. Each node
+# has two player slots and says where its winner (and, in the winners'
+# bracket of a double elimination, its loser) goes next. A slot is pending
+# until the game feeding it is decided; it then holds a player or nobody
+# (NULL), which is how byes are carried through the bracket. A node whose
+# slots are both decided either gets a Matches row (two players), passes its
+# one player on, or passes nobody on. When a knockout game ends in a draw
+# the same pair plays again with colours reversed. Results reach the
+# brackets through results.apply_results, which calls advance() in the same
+# transaction, so the next round appears as soon as its players are known.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+ROUND_ROBIN = 'round_robin'
+DOUBLE_ROUND_ROBIN = 'double_round_robin'
+SINGLE_ELIMINATION = 'single_elimination'
+DOUBLE_ELIMINATION = 'double_elimination'
+FORMATS = {
+    ROUND_ROBIN: 'Round robin',
+    DOUBLE_ROUND_ROBIN: 'Double round robin',
+    SINGLE_ELIMINATION: 'Single elimination',
+    DOUBLE_ELIMINATION: 'Double elimination',
+}
+MAX_ROUND_ROBIN_PLAYERS = 100
+MAX_KNOCKOUT_PLAYERS = 4096
+
+# Sections of a knockout bracket: winners', losers' and the grand final
+WINNERS = 'W'
+LOSERS = 'L'
+FINAL = 'F'
+
+_NODE_COLUMNS = ('node', 'section', 'round', 'position', 'player1_id', 'player1_ready', 'player2_id',
+                 'player2_ready', 'winner_node', 'winner_slot', 'loser_node', 'loser_slot', 'match_id',
+                 'winner_id', 'done')
+
+
+def create_bracket_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Brackets (
+        bracket_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        format TEXT NOT NULL,
+        players INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        champion_id TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS BracketNodes (
+        bracket_id INTEGER NOT NULL,
+        node INTEGER NOT NULL,
+        section TEXT NOT NULL,
+        round INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        player1_id TEXT,
+        player1_ready INTEGER NOT NULL DEFAULT 0,
+        player2_id TEXT,
+        player2_ready INTEGER NOT NULL DEFAULT 0,
+        winner_node INTEGER,
+        winner_slot INTEGER,
+        loser_node INTEGER,
+        loser_slot INTEGER,
+        match_id INTEGER,
+        winner_id TEXT,
+        done INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bracket_id, node)
+    )
+    ''')
+    # Every game played in a bracket, replays included
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS BracketGames (
+        match_id INTEGER PRIMARY KEY,
+        bracket_id INTEGER NOT NULL,
+        node INTEGER NOT NULL
+    )
+    ''')
+
+
+def berger_rounds(players):
+    """Berger table rounds for players in seed order: a list of rounds of (white, black).
+
+    With an odd number of players, whoever would meet the extra seat sits the round out.
+    """
+    seats = list(players)
+    if len(seats) % 2:
+        seats.append(None)
+    n = len(seats)
+    if n < 2:
+        return []
+    half = n // 2
+    # Seat numbers 1..n; n stays on table 1 and alternates colour, the rest move on by n/2 each round
+    tables = [(1, n)] + [(k, n + 1 - k) for k in range(2, half + 1)]
+    rounds = []
+    for r in range(n - 1):
+        games = []
+        for white, black in tables:
+            if seats[white - 1] is not None and seats[black - 1] is not None:
+                games.append((seats[white - 1], seats[black - 1]))
+        rounds.append(games)
+
+        def move(k):
+            return k if k == n else (k - 1 + half) % (n - 1) + 1
+        first_white, first_black = tables[0]
+        tables = [(move(first_black), move(first_white))] + [(move(w), move(b)) for w, b in tables[1:]]
+    return rounds
+
+
+def round_robin(players, double=False):
+    """All games of a (double) round robin in round order as (white, black)."""
+    rounds = berger_rounds(players)
+    if double:
+        rounds += [[(black, white) for white, black in games] for games in rounds]
+    return [game for games in rounds for game in games]
+
+
+def seed_positions(size):
+    """Seed numbers (1-based) in bracket order for a bracket of size (a power of two), so 1 and 2 meet last."""
+    order = [1]
+    while len(order) < size:
+        n = 2 * len(order) + 1
+        order = [seed for s in order for seed in (s, n - s)]
+    return order
+
+
+def build_knockout(players, double=False):
+    """Nodes of a knockout bracket for players in seed order, as dicts with the BracketNodes columns."""
+    size = 1
+    while size < len(players):
+        size *= 2
+    rounds = size.bit_length() - 1
+    nodes = []
+
+    def add(section, rnd, position):
+        nodes.append({'node': len(nodes), 'section': section, 'round': rnd, 'position': position,
+                      'player1_id': None, 'player1_ready': 0, 'player2_id': None, 'player2_ready': 0,
+                      'winner_node': None, 'winner_slot': None, 'loser_node': None, 'loser_slot': None,
+                      'match_id': None, 'winner_id': None, 'done': 0})
+        return nodes[-1]['node']
+
+    winners = [[add(WINNERS, r, p) for p in range(size >> r)] for r in range(1, rounds + 1)]
+    for r in range(rounds - 1):
+        for p, node in enumerate(winners[r]):
+            nodes[node]['winner_node'], nodes[node]['winner_slot'] = winners[r + 1][p // 2], p % 2 + 1
+    # First round: seeds past the number of players are byes
+    order = seed_positions(size)
+    for p, node in enumerate(winners[0]):
+        for slot, seed in ((1, order[2 * p]), (2, order[2 * p + 1])):
+            nodes[node][f'player{slot}_id'] = players[seed - 1] if seed <= len(players) else None
+            nodes[node][f'player{slot}_ready'] = 1
+    if not double:
+        return nodes
+
+    # Losers' bracket: odd rounds pair the survivors, even rounds bring in
+    # the losers of the next winners' round (in reverse order, to put off rematches)
+    losers = []
+    for j in range(1, rounds):
+        if j == 1:
+            losers.append([add(LOSERS, 1, p) for p in range(size // 4)])
+            for p, node in enumerate(winners[0]):
+                nodes[node]['loser_node'], nodes[node]['loser_slot'] = losers[0][p // 2], p % 2 + 1
+        else:
+            previous = losers[-1]
+            losers.append([add(LOSERS, 2 * j - 1, p) for p in range(len(previous) // 2)])
+            for p, node in enumerate(previous):
+                nodes[node]['winner_node'], nodes[node]['winner_slot'] = losers[-1][p // 2], p % 2 + 1
+        survivors = losers[-1]
+        losers.append([add(LOSERS, 2 * j, p) for p in range(len(survivors))])
+        for p, node in enumerate(survivors):
+            nodes[node]['winner_node'], nodes[node]['winner_slot'] = losers[-1][p], 1
+        dropping = winners[j]
+        for p, node in enumerate(dropping):
+            nodes[node]['loser_node'], nodes[node]['loser_slot'] = losers[-1][len(dropping) - 1 - p], 2
+
+    # Grand final, and a second game only if the losers' bracket winner takes the first
+    final = add(FINAL, 1, 0)
+    reset = add(FINAL, 2, 0)
+    nodes[winners[-1][0]]['winner_node'], nodes[winners[-1][0]]['winner_slot'] = final, 1
+    if losers:
+        nodes[losers[-1][0]]['winner_node'], nodes[losers[-1][0]]['winner_slot'] = final, 2
+    else:
+        nodes[winners[-1][0]]['loser_node'], nodes[winners[-1][0]]['loser_slot'] = final, 2
+    nodes[final].update(winner_node=reset, winner_slot=1, loser_node=reset, loser_slot=2)
+    return nodes
+
+
+def _place(nodes, target, slot, player, changed):
+    if target is None:
+        return
+    node = nodes[target]
+    node[f'player{slot}_id'] = player
+    node[f'player{slot}_ready'] = 1
+    changed.add(target)
+
+
+def _finish(nodes, number, winner, loser, changed):
+    node = nodes[number]
+    node['winner_id'] = winner
+    node['done'] = 1
+    changed.add(number)
+    if node['section'] == FINAL and node['round'] == 1 and winner is not None and winner == node['player1_id']:
+        # The unbeaten player won the grand final: no second game
+        loser = None
+    _place(nodes, node['winner_node'], node['winner_slot'], winner, changed)
+    _place(nodes, node['loser_node'], node['loser_slot'], loser, changed)
+
+
+def _resolve(nodes, changed):
+    """Decide every node whose slots are known and that needs no game; return the nodes that need a Matches row."""
+    ready = []
+    pending = sorted(changed)
+    while pending:
+        number = pending.pop()
+        node = nodes[number]
+        if node['done'] or node['match_id'] is not None or not (node['player1_ready'] and node['player2_ready']):
+            continue
+        p1, p2 = node['player1_id'], node['player2_id']
+        if p1 is not None and p2 is not None:
+            ready.append(number)
+            continue
+        touched = set()
+        _finish(nodes, number, p1 if p1 is not None else p2, None, touched)
+        changed |= touched
+        pending.extend(touched)
+    return ready
+
+
+def _load_nodes(conn, bracket_id):
+    return {row[0]: dict(zip(_NODE_COLUMNS, row)) for row in conn.execute(f'''
+        SELECT {', '.join(_NODE_COLUMNS)} FROM BracketNodes WHERE bracket_id = ? ORDER BY node
+    ''', (bracket_id,))}
+
+
+def _save_nodes(conn, bracket_id, nodes, changed):
+    columns = _NODE_COLUMNS[4:]
+    conn.executemany(f'''
+        UPDATE BracketNodes SET {', '.join(f'{c} = ?' for c in columns)} WHERE bracket_id = ? AND node = ?
+    ''', [tuple(nodes[n][c] for c in columns) + (bracket_id, n) for n in sorted(changed)])
+
+
+def _insert_matches(conn, pairs, batch_id):
+    """Insert (white, black) games; return their match IDs in order."""
+    return [conn.execute('INSERT INTO Matches (student1_id, student2_id, batch_id) VALUES (?, ?, ?) RETURNING match_id',
+                         (white, black, batch_id)).fetchone()[0] for white, black in pairs]
+
+
+def _start_games(conn, bracket_id, nodes, ready, batch_id, changed):
+    ready.sort(key=lambda n: (nodes[n]['section'] != WINNERS, nodes[n]['round'], nodes[n]['section'], nodes[n]['position']))
+    match_ids = _insert_matches(conn, [(nodes[n]['player1_id'], nodes[n]['player2_id']) for n in ready], batch_id)
+    for number, match_id in zip(ready, match_ids):
+        nodes[number]['match_id'] = match_id
+        changed.add(number)
+    conn.executemany('INSERT INTO BracketGames (match_id, bracket_id, node) VALUES (?, ?, ?)',
+                     [(match_id, bracket_id, number) for number, match_id in zip(ready, match_ids)])
+    return len(match_ids)
+
+
+def load_seeds(conn, limit=None, class_filter=''):
+    """Paid players in seed order: current standings (points, then tie-breaks), then total points and rating."""
+    query = f'''
+        SELECT s.student_id FROM Students s
+        LEFT JOIN Standings st ON st.period = '{standings.CURRENT_PERIOD}' AND st.student_id = s.student_id
+        LEFT JOIN TieBreaks tb ON tb.period = st.period AND tb.student_id = s.student_id
+        LEFT JOIN Ratings r ON r.student_id = s.student_id
+        WHERE s.paid_entry = 1
+    '''
+    params = []
+    if class_filter:
+        query += ' AND s.class = ?'
+        params.append(class_filter)
+    query += f'''
+        ORDER BY IFNULL(st.points, 0) DESC, IFNULL(tb.buchholz, 0) DESC, IFNULL(tb.sonneborn_berger, 0) DESC,
+                 IFNULL(s.points, 0) DESC, IFNULL(r.elo, {ratings.ELO_INITIAL}) DESC, s.student_id
+    '''
+    if limit:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return [row[0] for row in conn.execute(query, params)]
+
+
+class BracketResult:
+    """A generated event: its bracket (None for round robins), games inserted and timings."""
+
+    def __init__(self):
+        self.bracket_id = None
+        self.players = 0
+        self.matches = 0
+        self.elapsed = 0.0
+
+
+def create_event(conn, event_format, players, batch_id=None):
+    """Generate event_format for players (seed order) into Matches; return a BracketResult.
+
+    Runs inside the caller's transaction; the caller commits. Raises
+    ValueError if the number of players does not suit the format.
+    """
+    start = time.perf_counter()
+    if event_format not in FORMATS:
+        raise ValueError(f"Unknown format '{event_format}'")
+    limit = MAX_ROUND_ROBIN_PLAYERS if event_format in (ROUND_ROBIN, DOUBLE_ROUND_ROBIN) else MAX_KNOCKOUT_PLAYERS
+    if not 2 <= len(players) <= limit:
+        raise ValueError(f"{FORMATS[event_format]} needs between 2 and {limit} players, not {len(players)}")
+    result = BracketResult()
+    result.players = len(players)
+    if event_format in (ROUND_ROBIN, DOUBLE_ROUND_ROBIN):
+        result.matches = len(_insert_matches(conn, round_robin(players, event_format == DOUBLE_ROUND_ROBIN), batch_id))
+    else:
+        nodes = {node['node']: node for node in build_knockout(players, event_format == DOUBLE_ELIMINATION)}
+        result.bracket_id = conn.execute('''
+            INSERT INTO Brackets (format, players, created_at) VALUES (?, ?, ?) RETURNING bracket_id
+        ''', (event_format, len(players), datetime.datetime.now().isoformat(timespec='seconds'))).fetchone()[0]
+        changed = set(nodes)
+        ready = _resolve(nodes, changed)
+        result.matches = _start_games(conn, result.bracket_id, nodes, ready, batch_id, changed)
+        conn.executemany(f'''
+            INSERT INTO BracketNodes (bracket_id, {', '.join(_NODE_COLUMNS)})
+            VALUES (?, {', '.join('?' * len(_NODE_COLUMNS))})
+        ''', [(result.bracket_id,) + tuple(node[c] for c in _NODE_COLUMNS) for node in nodes.values()])
+    scheduler.schedule(conn)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def advance(conn, match_ids):
+    """Move the winners (and losers) of finished knockout games in match_ids on; return the games started.
+
+    Runs inside the caller's transaction. A drawn game is replayed with colours reversed.
+    """
+    rows = conn.execute('''
+        SELECT bg.bracket_id, bg.node, m.winner_id, m.batch_id
+        FROM json_each(?) AS j
+        CROSS JOIN BracketGames bg ON bg.match_id = j.value
+        JOIN Matches m ON m.match_id = bg.match_id
+        JOIN BracketNodes bn ON bn.bracket_id = bg.bracket_id AND bn.node = bg.node
+        WHERE bn.match_id = bg.match_id AND bn.done = 0 AND m.points_assigned = 1
+    ''', (json.dumps(list(match_ids)),)).fetchall()
+    by_bracket = {}
+    for bracket_id, node, winner_id, batch_id in rows:
+        by_bracket.setdefault(bracket_id, []).append((node, winner_id, batch_id))
+    started = 0
+    for bracket_id, finished in by_bracket.items():
+        nodes = _load_nodes(conn, bracket_id)
+        changed = set()
+        replays = []
+        batch_id = finished[0][2]
+        for number, winner_id, _ in finished:
+            node = nodes[number]
+            if winner_id is None:
+                replays.append(number)
+                node['player1_id'], node['player2_id'] = node['player2_id'], node['player1_id']
+                node['match_id'] = None
+                continue
+            loser_id = node['player2_id'] if winner_id == node['player1_id'] else node['player1_id']
+            _finish(nodes, number, winner_id, loser_id, changed)
+        ready = _resolve(nodes, changed) + replays
+        started += _start_games(conn, bracket_id, nodes, ready, batch_id, changed)
+        _save_nodes(conn, bracket_id, nodes, changed)
+        champion = [n for n in nodes.values() if n['done'] and n['winner_node'] is None and n['winner_id'] is not None]
+        if champion:
+            conn.execute('UPDATE Brackets SET champion_id = ? WHERE bracket_id = ?', (champion[0]['winner_id'], bracket_id))
+    if started:
+        scheduler.schedule(conn)
+    return started
+
+
+def bracket_view(conn, bracket_id):
+    """A bracket and its nodes with player names, or None: {'bracket': row, 'sections': {section: {round: [nodes]}}}."""
+    bracket = conn.execute('SELECT * FROM Brackets WHERE bracket_id = ?', (bracket_id,)).fetchone()
+    if bracket is None:
+        return None
+    players = roster.load(conn)
+    sections = {}
+    for row in players.with_names(
+            conn.execute('SELECT * FROM BracketNodes WHERE bracket_id = ? ORDER BY node', (bracket_id,)),
+            {'player1_id': 'player1_name', 'player2_id': 'player2_name', 'winner_id': 'winner_name'}):
+        sections.setdefault(row['section'], {}).setdefault(row['round'], []).append(row)
+    return {'bracket': players.with_names([bracket], {'champion_id': 'champion_name'})[0], 'sections': sections}
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import time
+
+from database import data_version
+
+# Registry of batches. The batch picker and cross-batch features read this
+# one small database instead of listing DB/ and opening every batch file.
+# It keeps each batch's name as entered (the database file only has the
+# sanitized form) and cached counts. The batch's writer refreshes them after
+# each commit, on its own connection (see app.refresh_catalog), and records
+# the database file's modification time, so at startup sync() only opens
+# batch files that were changed outside the app (CLI commands) or are new.
+
+CATALOG_DB = 'DB/catalog.db'
+
+
+def _connect(catalog_db):
+    conn = sqlite3.connect(catalog_db, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def create_catalog_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Batches (
+        batch_name TEXT PRIMARY KEY,
+        safe_name TEXT NOT NULL UNIQUE,
+        db_path TEXT NOT NULL UNIQUE,
+        created_at REAL NOT NULL,
+        players INTEGER NOT NULL DEFAULT 0,
+        paid_players INTEGER NOT NULL DEFAULT 0,
+        matches INTEGER NOT NULL DEFAULT 0,
+        completed_matches INTEGER NOT NULL DEFAULT 0,
+        history_matches INTEGER NOT NULL DEFAULT 0,
+        data_version INTEGER NOT NULL DEFAULT -1,
+        last_activity REAL NOT NULL,
+        file_mtime REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(Batches)')}
+    if 'file_mtime' not in columns:
+        # Catalogs created before sync() compared modification times
+        conn.execute('ALTER TABLE Batches ADD COLUMN file_mtime REAL NOT NULL DEFAULT 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_batches_activity ON Batches(last_activity DESC)')
+    conn.commit()
+
+
+def file_mtime(db_path):
+    """Last modification of the batch database at db_path or its WAL, or None if it does not exist."""
+    try:
+        mtime = os.path.getmtime(db_path)
+    except FileNotFoundError:
+        return None
+    try:
+        return max(mtime, os.path.getmtime(f'{db_path}-wal'))
+    except FileNotFoundError:
+        return mtime
+
+
+class NameTaken(Exception):
+    """Raised when a new batch name maps to the same database file as another batch."""
+
+
+class Catalog:
+    """The batch registry in catalog_db."""
+
+    def __init__(self, catalog_db=CATALOG_DB):
+        self.catalog_db = catalog_db
+        conn = _connect(catalog_db)
+        create_catalog_table(conn)
+        conn.close()
+
+    def register(self, batch_name, safe_name, db_path, created_at=None):
+        """Add a batch (a no-op if it is already registered).
+
+        Raises NameTaken if another batch already uses safe_name.
+        """
+        now = time.time()
+        conn = _connect(self.catalog_db)
+        try:
+            try:
+                conn.execute('''
+                    INSERT INTO Batches (batch_name, safe_name, db_path, created_at, last_activity)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (batch_name, safe_name, db_path, created_at or now, created_at or now))
+                conn.commit()
+                return
+            except sqlite3.IntegrityError:
+                # Already registered, possibly just now by a concurrent create of the same name
+                conn.rollback()
+            existing = conn.execute('SELECT batch_name FROM Batches WHERE safe_name = ?', (safe_name,)).fetchone()
+            if existing is None:
+                raise NameTaken(batch_name)
+            if existing['batch_name'] == safe_name and batch_name != safe_name:
+                # Found on disk by sync(), which only knew the file name: keep the name as entered
+                conn.execute('UPDATE Batches SET batch_name = ? WHERE safe_name = ?', (batch_name, safe_name))
+                conn.commit()
+            elif existing['batch_name'] != batch_name:
+                raise NameTaken(existing['batch_name'])
+        finally:
+            conn.close()
+
+    def unregister(self, db_path):
+        """Forget the batch in db_path, e.g. once its database file is gone."""
+        conn = _connect(self.catalog_db)
+        try:
+            conn.execute('DELETE FROM Batches WHERE db_path = ?', (db_path,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def refresh(self, db_path, batch_conn, activity=None):
+        """Recount the players and matches of the batch in db_path from batch_conn if its data version moved.
+
+        Also records the file's modification time, which sync() compares.
+        Returns whether the batch was recounted.
+        """
+        version = data_version(batch_conn)
+        conn = _connect(self.catalog_db)
+        try:
+            row = conn.execute('SELECT data_version FROM Batches WHERE db_path = ?', (db_path,)).fetchone()
+            if row is None:
+                return False
+            recount = row['data_version'] != version
+            if not recount:
+                conn.execute('UPDATE Batches SET file_mtime = ? WHERE db_path = ?', (file_mtime(db_path), db_path))
+            else:
+                counts = batch_conn.execute('''
+                    SELECT (SELECT COUNT(*) FROM Students),
+                           (SELECT COUNT(*) FROM Students WHERE paid_entry = 1),
+                           (SELECT COUNT(*) FROM Matches),
+                           (SELECT COUNT(*) FROM Matches WHERE points_assigned = 1),
+                           (SELECT COUNT(*) FROM MatchHistory)
+                ''').fetchone()
+                conn.execute('''
+                    UPDATE Batches SET players = ?, paid_players = ?, matches = ?, completed_matches = ?,
+                                       history_matches = ?, data_version = ?, last_activity = ?, file_mtime = ?
+                    WHERE db_path = ?
+                ''', (*counts, version, activity or time.time(), file_mtime(db_path), db_path))
+            conn.commit()
+            return recount
+        finally:
+            conn.close()
+
+    def get(self, batch_name):
+        conn = _connect(self.catalog_db)
+        try:
+            return conn.execute('SELECT * FROM Batches WHERE batch_name = ?', (batch_name,)).fetchone()
+        finally:
+            conn.close()
+
+    def batches(self):
+        """Every batch, most recently active first."""
+        conn = _connect(self.catalog_db)
+        try:
+            return conn.execute('SELECT * FROM Batches ORDER BY last_activity DESC').fetchall()
+        finally:
+            conn.close()
+
+    def sync(self, db_paths):
+        """Bring the catalog in line with the batch files db_paths (every DB/batch_<safe name>_database.db).
+
+        Registers files not in the catalog yet, recounts those whose data
+        changed since the catalog last saw them and unregisters batches whose
+        file is gone; returns the number of batches registered, recounted or
+        unregistered. Files not modified since are not opened.
+
+        A batch found this way is registered under its sanitized name, which
+        is all the file records, until it is created again under its full name.
+        """
+        conn = _connect(self.catalog_db)
+        try:
+            known = {row['db_path']: row['file_mtime']
+                     for row in conn.execute('SELECT db_path, file_mtime FROM Batches')}
+        finally:
+            conn.close()
+        changed = 0
+        for db_path in set(known) - set(db_paths):
+            self.unregister(db_path)
+            changed += 1
+        for db_path in db_paths:
+            mtime = file_mtime(db_path)
+            if mtime is None or (db_path in known and mtime <= known[db_path]):
+                continue
+            batch_conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+            try:
+                if db_path not in known:
+                    name = os.path.basename(db_path)[len('batch_'):-len('_database.db')]
+                    self.register(name, name, db_path, created_at=mtime)
+                if self.refresh(db_path, batch_conn, activity=mtime):
+                    changed += 1
+            finally:
+                batch_conn.close()
+        return changed
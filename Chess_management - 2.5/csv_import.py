@@ -0,0 +1,152 @@
+import csv
+import io
+import re
+import time
+
+# Streaming student roster import. Rows are decoded and validated as they
+# are read and written in executemany chunks inside one transaction, so
+# memory stays flat however large the upload is.
+
+REQUIRED_HEADERS = ('ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year')
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Optional leading +, then 7-15 digits once spaces, dashes and dots are removed
+MOBILE_RE = re.compile(r'^\+?\d{7,15}$')
+_MOBILE_SEPARATORS = re.compile(r'[\s().-]')
+
+# New IDs get zeroed stats; existing players keep points, matches_played and paid_entry
+_UPSERT_SQL = '''
+    INSERT INTO Students (student_id, name, class, roll, mobile, year, points, matches_played, paid_entry)
+    VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0)
+    ON CONFLICT(student_id) DO UPDATE SET
+        name = excluded.name,
+        class = excluded.class,
+        roll = excluded.roll,
+        mobile = excluded.mobile,
+        year = excluded.year
+'''
+
+
+class ImportReport:
+    """Outcome of an import or dry run."""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.fatal = None
+        self.rows = 0
+        self.written = 0
+        self.skipped = 0
+        self.errors = []  # (line number, student ID, message), capped at MAX_REPORTED_ERRORS
+        self.errors_truncated = False
+        self.elapsed = 0.0
+
+    def add_error(self, line, student_id, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, student_id, message))
+        else:
+            self.errors_truncated = True
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'fatal': self.fatal,
+            'rows': self.rows,
+            'written': self.written,
+            'skipped': self.skipped,
+            'errors': [{'line': line, 'id': sid, 'message': msg} for line, sid, msg in self.errors],
+            'errors_truncated': self.errors_truncated,
+            'elapsed': self.elapsed,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def _next_generated_id(conn):
+    max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
+    try:
+        return int(max_id) + 1 if max_id else 1
+    except ValueError:
+        return conn.execute('SELECT COUNT(*) FROM Students').fetchone()[0] + 1
+
+
+def import_students(conn, stream, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Import a binary CSV stream into Students and return an ImportReport.
+
+    Rows with a missing name or class, an ID already seen earlier in the
+    file, or a malformed mobile number are skipped and reported. With
+    dry_run nothing is written.
+    """
+    # newline='' leaves line breaks inside quoted fields to the csv module
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        return _import(conn, csv.DictReader(text), dry_run, chunk_size)
+    finally:
+        # Hand the stream back to the caller instead of closing it with the wrapper
+        text.detach()
+
+
+def _import(conn, reader, dry_run, chunk_size):
+    report = ImportReport(dry_run)
+    start = time.perf_counter()
+    if reader.fieldnames is None:
+        report.fatal = "The uploaded CSV file is empty."
+        return report
+    missing = [h for h in REQUIRED_HEADERS if h not in reader.fieldnames]
+    if missing:
+        report.fatal = f"CSV is missing headers: {', '.join(missing)}. Expected headers: {', '.join(REQUIRED_HEADERS)}"
+        return report
+
+    next_id = _next_generated_id(conn)
+    seen_ids = set()
+    chunk = []
+    try:
+        for row in reader:
+            report.rows += 1
+            line = reader.line_num
+            student_id = (row['ID'] or '').strip()
+            if not student_id:
+                student_id = str(next_id).zfill(5)
+                next_id += 1
+            name = (row['Name'] or '').strip()
+            class_ = (row['Class'] or '').strip()
+            mobile = _MOBILE_SEPARATORS.sub('', row['Mobile'] or '')
+            problems = []
+            if student_id in seen_ids:
+                problems.append('duplicate ID')
+            if not name:
+                problems.append('missing Name')
+            if not class_:
+                problems.append('missing Class')
+            if mobile and not MOBILE_RE.match(mobile):
+                problems.append(f"invalid mobile number '{row['Mobile']}'")
+            seen_ids.add(student_id)
+            if problems:
+                report.skipped += 1
+                report.add_error(line, student_id, '; '.join(problems))
+                continue
+            chunk.append((student_id, name, class_, (row['Roll'] or '').strip(), mobile, (row['Year'] or '').strip()))
+            if len(chunk) >= chunk_size:
+                if not dry_run:
+                    conn.executemany(_UPSERT_SQL, chunk)
+                report.written += len(chunk)
+                chunk = []
+        if chunk:
+            if not dry_run:
+                conn.executemany(_UPSERT_SQL, chunk)
+            report.written += len(chunk)
+        if not dry_run:
+            conn.commit()
+    except (csv.Error, UnicodeError) as e:
+        conn.rollback()
+        report.written = 0
+        report.fatal = f"Error processing CSV at row {report.rows}: {e}"
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        report.elapsed = time.perf_counter() - start
+    return report
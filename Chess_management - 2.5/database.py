@@ -1,26 +1,44 @@
 import sqlite3
 import os
 import re
+import ast
+import glob
+import sys
+from functools import lru_cache
+import standings
+import search
+import ratings
+import tiebreaks
+import history
+import scheduler
+import brackets
+import roster
 
 # Ensure DB directory exists
 if not os.path.exists('DB'):
     os.makedirs('DB')
 
+@lru_cache(maxsize=1024)
+def safe_batch_name(batch_name):
+    """Return the filesystem-safe form of batch_name."""
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', batch_name)
+
+def batch_db_path(batch_name):
+    """Return the database path for batch_name."""
+    return f'DB/batch_{safe_batch_name(batch_name)}_database.db'
+
 def create_batch_database(batch_name):
-    """Create a new SQLite database for a given batch_name."""
-    # Sanitize batch_name to be filesystem-safe
-    safe_batch_name = re.sub(r'[^a-zA-Z0-9_-]', '_', batch_name)
-    db_path = f'DB/batch_{safe_batch_name}_database.db'
-    
-    # Check if database already exists to prevent duplicates
-    if os.path.exists(db_path):
-        return db_path
-
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
+    """Create a new SQLite database for a given batch_name, or upgrade an existing one."""
+    db_path = batch_db_path(batch_name)
+    migrate_database(db_path)
+    return db_path
 
+# Schema migrations. Each takes an open connection inside the migration
+# transaction; a database's PRAGMA user_version is the number applied so far.
+
+def _create_tables(conn):
     # Create Students table
-    c.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS Students (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         student_id TEXT UNIQUE,
@@ -36,7 +54,7 @@ def create_batch_database(batch_name):
     ''')
 
     # Create Matches table with batch_id
-    c.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS Matches (
         match_id INTEGER PRIMARY KEY AUTOINCREMENT,
         student1_id TEXT,
@@ -49,7 +67,7 @@ def create_batch_database(batch_name):
     ''')
 
     # Create MatchHistory table with batch_id
-    c.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS MatchHistory (
         match_id INTEGER PRIMARY KEY AUTOINCREMENT,
         student1_id TEXT,
@@ -61,6 +79,200 @@ def create_batch_database(batch_name):
     )
     ''')
 
+def _create_indexes(conn):
+    # Dashboard top 5 and paid-player selection
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_points ON Students(points)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_paid ON Students(paid_entry, student_id)')
+    # Participant lookups carry the result columns so joins never touch the table
+    for table, prefix in (('Matches', 'matches'), ('MatchHistory', 'history')):
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{prefix}_student1 ON {table}(student1_id, points_assigned, winner_id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{prefix}_student2 ON {table}(student2_id, points_assigned, winner_id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{prefix}_winner ON {table}(winner_id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{prefix}_date ON {table}(match_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_matches_assigned ON Matches(points_assigned, batch_id)')
+    # Monthly leaderboard filters on strftime('%Y-%m', match_date)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_month ON MatchHistory(strftime('%Y-%m', match_date), points_assigned)")
+
+# Sortable listing columns for keyset pagination. Expressions are NULL-free
+# so cursors compare cleanly, and each has a matching (expression, key) index.
+STUDENT_SORT_COLUMNS = {
+    'student_id': "IFNULL(student_id, '')",
+    'name': "IFNULL(name, '')",
+    'class': "IFNULL(class, '')",
+    'points': 'IFNULL(points, 0)',
+    'matches_played': 'IFNULL(matches_played, 0)',
+}
+MATCH_SORT_COLUMNS = {
+    'match_id': 'match_id',
+    'match_date': "IFNULL(match_date, '')",
+}
+
+# Tables derived from the games (Standings, Ratings, TieBreaks) are filled by
+# _rebuild_derived at the end of the latest migration that changes how they
+# are computed, so a database upgraded from any version ends up consistent.
+def _create_standings(conn):
+    standings.create_standings_table(conn)
+
+def _create_sort_indexes(conn):
+    for column, expr in STUDENT_SORT_COLUMNS.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_students_sort_{column} ON Students({expr}, id)')
+    for table, prefix in (('Matches', 'matches'), ('MatchHistory', 'history')):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{prefix}_sort_match_date ON {table}({MATCH_SORT_COLUMNS['match_date']}, match_id)")
+
+# Tables whose changes bump the batch's data version
+VERSIONED_TABLES = ('Students', 'Matches', 'MatchHistory')
+
+def _create_data_version(conn):
+    # A single counter bumped by every write to the versioned tables; caches
+    # of anything derived from the batch key on it
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS DataVersion (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO DataVersion (id, version) VALUES (1, 0)')
+    for table in VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table.lower()}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE DataVersion SET version = version + 1 WHERE id = 1;
+            END
+            ''')
+
+def data_version(conn):
+    """Return the batch's data version, which changes whenever its students or matches do."""
+    return conn.execute('SELECT version FROM DataVersion WHERE id = 1').fetchone()[0]
+
+def bump_data_version(conn):
+    """Invalidate caches after changing derived data (e.g. ratings) without touching the versioned tables."""
+    conn.execute('UPDATE DataVersion SET version = version + 1 WHERE id = 1')
+
+def _create_ratings(conn):
+    ratings.create_ratings_tables(conn)
+
+def _create_tiebreaks(conn):
+    tiebreaks.create_tiebreaks_table(conn)
+
+def _rebuild_derived(conn):
+    standings.rebuild_standings(conn)
+    ratings.rebuild_ratings(conn)
+    tiebreaks.rebuild_tiebreaks(conn)
+
+def _add_month_key(conn):
+    # Archived games are keyed by month so monthly reads are plain index ranges
+    conn.execute("ALTER TABLE MatchHistory ADD COLUMN month_key TEXT GENERATED ALWAYS AS (strftime('%Y-%m', match_date)) VIRTUAL")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_history_month_key ON MatchHistory(month_key, points_assigned, match_id)')
+    conn.execute('DROP INDEX IF EXISTS idx_history_month')
+    history.create_cold_months_table(conn)
+    _rebuild_derived(conn)
+
+MIGRATIONS = [
+    _create_tables,
+    _create_indexes,
+    _create_standings,
+    _create_sort_indexes,
+    search.create_search_index,
+    _create_data_version,
+    _create_ratings,
+    _create_tiebreaks,
+    _add_month_key,
+    scheduler.create_schedule_tables,
+    brackets.create_bracket_tables,
+    roster.create_roster_version,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def apply_migrations(conn):
+    """Apply pending migrations on conn in a single transaction; return the number applied."""
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return 0
     conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Re-read under the write lock in case another worker migrated first
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[number - 1](conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return max(SCHEMA_VERSION - version, 0)
+
+def migrate_database(db_path):
+    """Create db_path if needed and bring it up to SCHEMA_VERSION."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+def list_batch_databases():
+    """Return the paths of every batch database in DB/."""
+    return sorted(glob.glob('DB/batch_*_database.db'))
+
+def migrate_all_batches():
+    """Upgrade every batch database; return {db_path: migrations applied}."""
+    return {db_path: migrate_database(db_path) for db_path in list_batch_databases()}
+
+# Query plan check. Collects the SQL literals passed to execute() in the
+# given modules and runs EXPLAIN QUERY PLAN for each against an empty,
+# fully migrated in-memory database. A module opts in by setting
+# CHECK_QUERY_PLANS = True; query_sources() finds the loaded ones.
+
+def query_sources():
+    """Return the source paths of the loaded modules that set CHECK_QUERY_PLANS."""
+    return sorted({os.path.abspath(module.__file__) for module in list(sys.modules.values())
+                   if getattr(module, 'CHECK_QUERY_PLANS', False) and getattr(module, '__file__', None)})
+
+def _collect_queries(source_path):
+    with open(source_path) as f:
+        tree = ast.parse(f.read(), source_path)
+    # Skip f-string pieces and str.format() templates; only literal SQL can be planned as-is
+    fragments = {id(part) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for part in node.values}
+    queries = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+                and id(node) not in fragments and '{' not in node.value):
+            sql = ' '.join(node.value.split())
+            if re.match(r'(SELECT|INSERT|UPDATE|DELETE|WITH)\b', sql, re.IGNORECASE) and re.search(r'\b(FROM|INTO|SET)\b', sql):
+                queries.append((node.lineno, sql))
+    return queries
+
+# EXPLAIN QUERY PLAN lines that introduce each arm of a compound SELECT
+_COMPOUND_ARMS = ('LEFT-MOST SUBQUERY', 'UNION ALL', 'UNION USING TEMP B-TREE', 'INTERSECT USING TEMP B-TREE',
+                  'EXCEPT USING TEMP B-TREE')
+
+def _is_full_listing(sql):
+    # Statements with no WHERE/LIMIT read or touch every row by design
+    return not re.search(r'\b(WHERE|LIMIT)\b', sql, re.IGNORECASE)
+
+def check_query_plans(source_paths=None):
+    """Return [(source, lineno, sql, plan lines, unexpected table scans)] for every query.
+
+    source_paths defaults to query_sources().
+
+    A full table scan is expected only as the outer loop of a statement
+    (or of each arm of a compound one) that has no WHERE or LIMIT clause.
+    """
+    conn = sqlite3.connect(':memory:')
+    apply_migrations(conn)
+    results = []
+    for source_path in source_paths or query_sources():
+        for lineno, sql in sorted(_collect_queries(source_path)):
+            params = (None,) * sql.count('?')
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            # "SCAN t" without an index is a full table scan; FTS5 MATCH lookups
+            # show up as "SCAN t VIRTUAL TABLE INDEX"
+            scans = [line for line in plan
+                     if line.startswith('SCAN ') and ' USING ' not in line and 'VIRTUAL TABLE INDEX' not in line]
+            if scans and _is_full_listing(sql):
+                # The outer loop of the statement, or of each arm of a UNION
+                outer = [line for k, line in enumerate(plan) if k == 0 or plan[k - 1] in _COMPOUND_ARMS]
+                scans = [line for line in scans if line not in outer]
+            results.append((source_path, lineno, sql, plan, scans))
     conn.close()
-    return db_path
\ No newline at end of file
+    return results
@@ -0,0 +1,307 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Per-connection settings, applied once when a connection is opened
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHED_STATEMENTS = 256
+
+
+class BatchNotFound(Exception):
+    """Raised when the database file for a batch does not exist."""
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times its statement and reports it to the connection's observer.
+
+    The time to execute and the time spent in fetchone(), fetchmany() and
+    fetchall() are added up and reported once, when the cursor runs its
+    next statement, is closed or is freed. Rows read by iterating the cursor
+    are not timed. A statement that fails is reported straight away with
+    its error.
+    """
+
+    _sql = None
+    _elapsed = 0.0
+
+    def _report(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self.connection._observer(sql, self._elapsed)
+
+    def _run(self, run, sql, parameters):
+        self._report()
+        start = time.perf_counter()
+        try:
+            result = run(sql, parameters)
+        except sqlite3.Error as e:
+            self.connection._observer(sql, time.perf_counter() - start, e)
+            raise
+        self._sql = sql
+        self._elapsed = time.perf_counter() - start
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def close(self):
+        self._report()
+        super().close()
+
+    def __del__(self):
+        self._report()
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    When the pool has an observer, every statement run through the
+    connection, and every commit, is timed and reported as
+    observer(sql, seconds, error), error being None unless it failed.
+    While a write queue group runs a mutation on the connection (see
+    write_queue.py), _savepoint names the mutation's savepoint: commit()
+    leaves committing to the group and rollback() only undoes the mutation.
+    """
+
+    _observer = None
+    _savepoint = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TimedCursor if self._observer is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if self._observer is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if self._savepoint is not None:
+            return
+        if self._observer is None:
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            super().commit()
+        except sqlite3.Error as e:
+            self._observer('COMMIT', time.perf_counter() - start, e)
+            raise
+        self._observer('COMMIT', time.perf_counter() - start)
+
+    def rollback(self):
+        if self._savepoint is not None:
+            self.execute(f'ROLLBACK TO {self._savepoint}')
+        else:
+            super().rollback()
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def really_close(self):
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """Bounded LRU of open SQLite connections, keyed by database path.
+
+    One pool lives in each worker process. Connections are opened with WAL
+    journaling and the pragmas above, and then reused across requests so the
+    per-connection prepared statement cache stays warm. observer, if given,
+    times every statement and commit on the pool's connections (see
+    PooledConnection and metrics.Registry).
+    """
+
+    def __init__(self, max_idle=16, max_per_db=8, acquire_timeout=30.0, observer=None):
+        self.max_idle = max_idle
+        self.max_per_db = max_per_db
+        self.acquire_timeout = acquire_timeout
+        self.observer = observer
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = OrderedDict()  # db_path -> [idle connections], least recently used first
+        self._idle_count = 0
+        self._open = {}  # db_path -> connections open (idle or checked out)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _check_fork(self):
+        # Connections must never be shared with a forked child (gunicorn workers)
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def _connect(self, db_path):
+        try:
+            conn = sqlite3.connect(f'file:{db_path}?mode=rw', uri=True, factory=PooledConnection,
+                                   cached_statements=CACHED_STATEMENTS, check_same_thread=False,
+                                   timeout=BUSY_TIMEOUT_MS / 1000)
+        except sqlite3.OperationalError:
+            raise BatchNotFound(db_path)
+        conn.row_factory = sqlite3.Row
+        conn._observer = self.observer
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        # REPLACE conflict deletes must fire delete triggers (search index upkeep)
+        conn.execute('PRAGMA recursive_triggers = ON')
+        conn._pool = self
+        conn._db_path = db_path
+        conn._checked_out = False
+        conn._lease = 0
+        return conn
+
+    def acquire(self, db_path):
+        """Check out a connection to db_path, opening one if none is idle."""
+        conn = None
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            self._check_fork()
+            while True:
+                idle = self._idle.get(db_path)
+                if idle:
+                    conn = idle.pop()
+                    self._idle_count -= 1
+                    if idle:
+                        self._idle.move_to_end(db_path)
+                    else:
+                        del self._idle[db_path]
+                    self.hits += 1
+                    break
+                if self._open.get(db_path, 0) < self.max_per_db:
+                    self._open[db_path] = self._open.get(db_path, 0) + 1
+                    self.misses += 1
+                    break
+                remaining = self.acquire_timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f'Timed out waiting for a connection to {db_path}')
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                elapsed = time.perf_counter() - start
+                self.waits += 1
+                self.wait_seconds += elapsed
+                self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+        if conn is None:
+            try:
+                conn = self._connect(db_path)
+            except Exception:
+                with self._cond:
+                    self._open[db_path] -= 1
+                    self._cond.notify()
+                raise
+        conn._checked_out = True
+        conn._lease += 1
+        return conn
+
+    def release(self, conn, lease=None):
+        """Return a checked-out connection to the idle list.
+
+        When lease is given the connection is only released if it has not
+        been handed out again since that checkout.
+        """
+        if not conn._checked_out or (lease is not None and lease != conn._lease):
+            return
+        conn._checked_out = False
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            db_path = conn._db_path
+            self._idle.setdefault(db_path, []).append(conn)
+            self._idle.move_to_end(db_path)
+            self._idle_count += 1
+            while self._idle_count > self.max_idle:
+                self._evict_oldest()
+            self._cond.notify()
+
+    def _evict_oldest(self):
+        db_path, idle = next(iter(self._idle.items()))
+        conn = idle.pop(0)
+        if not idle:
+            del self._idle[db_path]
+        self._idle_count -= 1
+        self._open[db_path] -= 1
+        self.evictions += 1
+        conn.really_close()
+
+    def discard(self, db_path):
+        """Close every idle connection to db_path."""
+        with self._cond:
+            for conn in self._idle.pop(db_path, []):
+                self._idle_count -= 1
+                self._open[db_path] -= 1
+                conn.really_close()
+            self._cond.notify_all()
+
+    def close_all(self):
+        with self._cond:
+            for db_path in list(self._idle):
+                for conn in self._idle.pop(db_path):
+                    self._open[db_path] -= 1
+                    conn.really_close()
+            self._idle_count = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {
+                'pid': self._pid,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'open': sum(self._open.values()),
+                'idle': self._idle_count,
+                'databases': len(self._idle),
+            }
@@ -0,0 +1,93 @@
+import csv
+import json
+from io import StringIO
+
+# Streaming table exports. Rows are pulled from the cursor in small batches
+# and encoded straight into the response, so memory stays constant and the
+# header reaches the client before the query has finished.
+
+FETCH_SIZE = 500
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _yes_no(value):
+    return 'Yes' if value else 'No'
+
+
+class ExportSpec:
+    """A query plus its columns as (CSV header, JSON key, CSV formatter or None)."""
+
+    def __init__(self, sql, columns):
+        self.sql = sql
+        self.columns = columns
+
+
+_MATCH_COLUMNS = [
+    ('Match ID', 'match_id', None),
+    ('Player 1 ID', 'student1_id', None),
+    ('Player 1 Name', 's1_name', None),
+    ('Player 2 ID', 'student2_id', None),
+    ('Player 2 Name', 's2_name', None),
+    ('Winner ID', 'winner_id', None),
+    ('Winner Name', 'winner_name', None),
+    ('Completed', 'points_assigned', _yes_no),
+    ('Date', 'match_date', None),
+]
+
+_MATCH_SQL = '''
+    SELECT m.match_id, m.student1_id, s1.name AS s1_name, m.student2_id, s2.name AS s2_name,
+           m.winner_id, w.name AS winner_name, m.points_assigned, m.match_date
+    FROM {table} m
+    LEFT JOIN Students s1 ON m.student1_id = s1.student_id
+    LEFT JOIN Students s2 ON m.student2_id = s2.student_id
+    LEFT JOIN Students w ON m.winner_id = w.student_id
+    ORDER BY m.match_id
+'''
+
+STUDENTS = ExportSpec(
+    'SELECT student_id, name, class, roll, mobile, year, paid_entry FROM Students ORDER BY id',
+    [
+        ('ID', 'student_id', None),
+        ('Name', 'name', None),
+        ('Class', 'class', None),
+        ('Roll', 'roll', None),
+        ('Mobile', 'mobile', None),
+        ('Year', 'year', None),
+        ('Paid Entry', 'paid_entry', _yes_no),
+    ],
+)
+
+MATCHES = ExportSpec(_MATCH_SQL.format(table='Matches'), _MATCH_COLUMNS)
+
+MATCH_HISTORY = ExportSpec(_MATCH_SQL.format(table='MatchHistory'), _MATCH_COLUMNS)
+
+
+def stream_export(conn, spec, fmt):
+    """Yield the encoded export of spec in fmt ('csv' or 'ndjson'), closing conn when done."""
+    try:
+        cursor = conn.execute(spec.sql)
+        buffer = StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow([header for header, _, _ in spec.columns])
+            yield buffer.getvalue().encode('utf-8')
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            buffer.seek(0)
+            buffer.truncate()
+            if fmt == 'csv':
+                for row in rows:
+                    writer.writerow([fn(row[i]) if fn else row[i] for i, (_, _, fn) in enumerate(spec.columns)])
+            else:
+                for row in rows:
+                    buffer.write(json.dumps({key: row[i] for i, (_, key, _) in enumerate(spec.columns)}))
+                    buffer.write('\n')
+            yield buffer.getvalue().encode('utf-8')
+    finally:
+        conn.close()
@@ -0,0 +1,15 @@
+import os
+
+# gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+#
+# Live viewers (/live/stream) keep a request open for as long as the page is
+# up, so requests run on threads (gthread) rather than one at a time per
+# worker: each worker serves up to `threads` requests and streams at once.
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = 60
+# Streams send a keep-alive comment every 15 seconds
+keepalive = 20
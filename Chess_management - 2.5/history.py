@@ -0,0 +1,221 @@
+import csv
+import gzip
+import io
+import os
+import time
+
+import standings
+import tiebreaks
+
+# Archived games by month. MatchHistory carries an indexed month_key
+# ('YYYY-MM'), and the per-player totals of every month are written to
+# Standings when games are archived, so monthly and month-range
+# leaderboards read Standings by period instead of touching the games.
+#
+# Old months can be compacted into cold storage: their games move out of
+# MatchHistory into one gzip-compressed CSV per month next to the batch
+# database (DB/cold/<batch database name>/YYYY-MM.csv.gz), listed in
+# ColdMonths. Their Standings and TieBreaks rows stay, and the games can
+# still be read back on demand with month_games() and cold_games().
+# A compaction never overwrites a file: it writes new ones (a month already
+# cold is merged into its new file), points ColdMonths at them in the same
+# transaction that deletes the rows, and only removes the old files after
+# the commit. Until then the rows and the file ColdMonths lists agree.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+_COLUMNS = ('match_id', 'student1_id', 'student2_id', 'winner_id', 'points_assigned', 'match_date', 'batch_id')
+
+
+def create_cold_months_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ColdMonths (
+        month_key TEXT PRIMARY KEY,
+        file TEXT NOT NULL,
+        games INTEGER NOT NULL,
+        compacted_at REAL NOT NULL
+    )
+    ''')
+
+
+def batch_cold_dir(db_path):
+    """Cold storage directory of the batch database at db_path."""
+    return os.path.join(os.path.dirname(db_path), 'cold', os.path.splitext(os.path.basename(db_path))[0])
+
+
+def cold_dir(conn):
+    """Cold storage directory of the batch database open on conn."""
+    return batch_cold_dir(conn.execute('PRAGMA database_list').fetchone()[2])
+
+
+def cold_months(conn):
+    return [row[0] for row in conn.execute('SELECT month_key FROM ColdMonths ORDER BY month_key')]
+
+
+def read_cold_month(path):
+    """Yield the games in one cold storage file as dicts."""
+    with gzip.open(path, 'rt', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'match_id': int(row['match_id']),
+                'student1_id': row['student1_id'] or None,
+                'student2_id': row['student2_id'] or None,
+                'winner_id': row['winner_id'] or None,
+                'points_assigned': int(row['points_assigned'] or 0),
+                'match_date': row['match_date'] or None,
+                'batch_id': row['batch_id'] or None,
+                'month_key': os.path.basename(path)[:7],
+            }
+
+
+def cold_games(conn, first_month=None, last_month=None):
+    """Yield the games of cold months between first_month and last_month (inclusive), oldest month first."""
+    directory = cold_dir(conn)
+    for month_key, file in conn.execute('''
+        SELECT month_key, file FROM ColdMonths
+        WHERE month_key BETWEEN IFNULL(?, '') AND IFNULL(?, '9999-99')
+        ORDER BY month_key
+    ''', (first_month, last_month)).fetchall():
+        yield from read_cold_month(os.path.join(directory, file))
+
+
+def month_games(conn, month_key):
+    """All archived games of month_key as dicts in playing order, from cold storage and MatchHistory.
+
+    A compacted month can still receive games archived after the compaction;
+    those stay in MatchHistory until the next one, so both are read.
+    """
+    games = list(cold_games(conn, month_key, month_key))
+    games += [dict(zip(_COLUMNS + ('month_key',), row)) for row in conn.execute('''
+        SELECT match_id, student1_id, student2_id, winner_id, points_assigned, match_date, batch_id, month_key
+        FROM MatchHistory WHERE month_key = ? ORDER BY match_id
+    ''', (month_key,))]
+    games.sort(key=lambda g: g['match_id'])
+    return games
+
+
+def compact(conn, before_month):
+    """Move every archived month earlier than before_month ('YYYY-MM') into cold storage.
+
+    Returns {month_key: games moved}. All months move in one transaction
+    (see the module comment); if it fails, no file ColdMonths lists changes.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    # Holds the write lock from the first read, so no game can be archived into a month being moved
+    conn.execute('BEGIN IMMEDIATE')
+    directory = cold_dir(conn)
+    written = []
+    replaced = []
+    moved = {}
+    try:
+        months = [row[0] for row in conn.execute('''
+            SELECT DISTINCT month_key FROM MatchHistory WHERE month_key < ? ORDER BY month_key
+        ''', (before_month,))]
+        if months:
+            os.makedirs(directory, exist_ok=True)
+        for month_key in months:
+            previous = conn.execute('SELECT file FROM ColdMonths WHERE month_key = ?', (month_key,)).fetchone()
+            existing = []
+            if previous is not None:
+                replaced.append(os.path.join(directory, previous[0]))
+                existing = list(read_cold_month(replaced[-1]))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(_COLUMNS)
+            for row in existing:
+                writer.writerow([row[column] for column in _COLUMNS])
+            count = len(existing)
+            for row in conn.execute(f'''
+                SELECT {', '.join(_COLUMNS)} FROM MatchHistory WHERE month_key = ? ORDER BY match_id
+            ''', (month_key,)):
+                writer.writerow(row)
+                count += 1
+            # A new name each time, so the file ColdMonths lists now is never touched
+            file = f'{month_key}.{time.time_ns()}.csv.gz'
+            path = os.path.join(directory, file)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with gzip.open(tmp_path, 'wt', newline='', compresslevel=9) as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+            written.append(path)
+            conn.execute('''
+                INSERT INTO ColdMonths (month_key, file, games, compacted_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(month_key) DO UPDATE SET
+                    file = excluded.file, games = excluded.games, compacted_at = excluded.compacted_at
+            ''', (month_key, file, count, time.time()))
+            conn.execute('DELETE FROM MatchHistory WHERE month_key = ?', (month_key,))
+            moved[month_key] = count
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        _remove(written)
+        raise
+    _remove(replaced)
+    return moved
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def fetch_range_leaderboard(conn, first_month, last_month, class_filter=''):
+    """Leaderboard over the months first_month..last_month ('YYYY-MM', inclusive), best first.
+
+    Totals are summed from the months' Standings rows; tie-breaks are
+    computed over the range's games, ordered as in standings.fetch_leaderboard.
+    """
+    # 'current' sorts after every 'YYYY-MM', so the range never includes it
+    query = '''
+        SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
+               CASE WHEN SUM(st.draws) = 0 THEN CAST(SUM(st.points) AS INTEGER) ELSE SUM(st.points) END AS points,
+               SUM(st.wins) AS wins, SUM(st.draws) AS draws, SUM(st.losses) AS losses, SUM(st.games) AS games,
+               r.elo, r.glicko, r.rd
+        FROM Standings st
+        JOIN Students s ON s.student_id = st.student_id
+        LEFT JOIN Ratings r ON r.student_id = st.student_id
+        WHERE st.period BETWEEN ? AND ?
+    '''
+    params = [first_month, last_month]
+    if class_filter:
+        query += ' AND s.class = ?'
+        params.append(class_filter)
+    query += ' GROUP BY st.student_id'
+    leaders = [dict(row) for row in conn.execute(query, params)]
+
+    games = [(g['month_key'], g['match_id'], g['student1_id'], g['student2_id'], g['winner_id'])
+             for g in cold_games(conn, first_month, last_month) if g['points_assigned'] == 1]
+    games += conn.execute('''
+        SELECT month_key, match_id, student1_id, student2_id, winner_id FROM MatchHistory
+        WHERE month_key BETWEEN ? AND ? AND points_assigned = 1
+    ''', (first_month, last_month)).fetchall()
+    # A compacted month may have later games still in MatchHistory
+    games.sort(key=lambda g: (g[0], g[1]))
+    values = tiebreaks.compute([g[2:] for g in games])
+    for leader in leaders:
+        leader.update(zip(tiebreaks.TIEBREAK_COLUMNS, values.get(leader['student_id'], (0,) * 5)))
+    leaders.sort(key=lambda l: (-l['points'], *(-l[c] for c in tiebreaks.TIEBREAK_COLUMNS), l['student_id']))
+    return leaders
+
+
+def check_range(month, month_to):
+    """Raise ValueError unless month_to, if given, ends a range that starts at month."""
+    if month_to and not month:
+        raise ValueError("A month range needs a starting month")
+    if month_to and month_to < month:
+        raise ValueError(f"The range ends ({month_to}) before it starts ({month})")
+
+
+def fetch_leaderboard(conn, month='', month_to='', class_filter=''):
+    """Leaderboard for the current games, one month, or the months month..month_to.
+
+    Raises ValueError for a range with no starting month (see check_range).
+    """
+    check_range(month, month_to)
+    if month and month_to and month_to != month:
+        return fetch_range_leaderboard(conn, month, month_to, class_filter)
+    return standings.fetch_leaderboard(conn, month or standings.CURRENT_PERIOD, class_filter)
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import report_cache
+import reports
+
+# Background report jobs. Job records live in a small SQLite database shared
+# by every web worker; the PDFs are rendered in a process pool so a long
+# report never blocks a request thread. A job moves queued -> running ->
+# done | failed. Finished PDFs go into the report cache (report_cache.py),
+# keyed by the job key, so a repeat request is served without a job.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Progress is written back at most this often (in percentage points)
+PROGRESS_STEP = 5
+
+
+def _connect(jobs_db):
+    conn = sqlite3.connect(jobs_db, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def create_jobs_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Jobs (
+        job_id TEXT PRIMARY KEY,
+        job_key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        batch_name TEXT NOT NULL,
+        params TEXT NOT NULL,
+        download_name TEXT NOT NULL,
+        archive_path TEXT,
+        status TEXT NOT NULL,
+        progress INTEGER NOT NULL DEFAULT 0,
+        result_path TEXT,
+        error TEXT,
+        owner_pid INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        expires_at REAL
+    )
+    ''')
+    # At most one queued or running job per key: identical requests share it
+    conn.execute(f'''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_key ON Jobs(job_key)
+    WHERE status IN ('{QUEUED}', '{RUNNING}')
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_expires ON Jobs(expires_at) WHERE expires_at IS NOT NULL')
+    conn.commit()
+
+
+def job_key(kind, batch_name, params):
+    payload = json.dumps([kind, batch_name, params], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_job(jobs_db, job_id, key, kind, db_path, batch_name, params, result_dir, archive_path, retention,
+            cache_bytes):
+    """Render one report. Runs in a pool process and records its own outcome.
+
+    Returns the seconds spent building the PDF, or None if the job failed.
+    """
+    conn = _connect(jobs_db)
+    try:
+        conn.execute('UPDATE Jobs SET status = ?, started_at = ? WHERE job_id = ?',
+                     (RUNNING, time.time(), job_id))
+        conn.commit()
+        last = [0]
+
+        def progress(percent):
+            if percent - last[0] >= PROGRESS_STEP:
+                last[0] = percent
+                conn.execute('UPDATE Jobs SET progress = ? WHERE job_id = ?', (percent, job_id))
+                conn.commit()
+
+        start = time.perf_counter()
+        pdf = reports.build_report(kind, db_path, batch_name, params, progress)
+        elapsed = time.perf_counter() - start
+        sha, result_path = report_cache.store_blob(result_dir, pdf)
+        if archive_path:
+            report_cache.link_archive(result_path, archive_path)
+        report_cache.record(conn, key, kind, batch_name, sha, len(pdf))
+        report_cache.evict(conn, result_dir, cache_bytes, retention)
+        now = time.time()
+        conn.execute('''
+            UPDATE Jobs SET status = ?, progress = 100, result_path = ?, finished_at = ?, expires_at = ?
+            WHERE job_id = ?
+        ''', (DONE, result_path, now, now + retention, job_id))
+        conn.commit()
+        return elapsed
+    except Exception as e:
+        conn.rollback()
+        now = time.time()
+        conn.execute('UPDATE Jobs SET status = ?, error = ?, finished_at = ?, expires_at = ? WHERE job_id = ?',
+                     (FAILED, f'{type(e).__name__}: {e}', now, now + retention, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """Submits report jobs to a per-process pool and tracks them in jobs_db.
+
+    The pool is started on first use in each process (so it is never
+    inherited across a gunicorn fork) and uses the spawn start method, which
+    keeps the children free of the parent's threads and open connections.
+    observer, if given, is called as observer(kind, seconds) in the
+    submitting process when a report has been built.
+    """
+
+    def __init__(self, jobs_db, result_dir, workers=2, retention=3600, cache_bytes=256 * 1024 * 1024,
+                 observer=None):
+        self.jobs_db = os.path.abspath(jobs_db)
+        self.observer = observer
+        self.result_dir = os.path.abspath(result_dir)
+        self.workers = workers
+        self.retention = retention
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        os.makedirs(self.result_dir, exist_ok=True)
+        conn = _connect(self.jobs_db)
+        create_jobs_table(conn)
+        report_cache.create_cache_table(conn)
+        conn.close()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, kind, db_path, batch_name, params, download_name, archive_path=None, key=None):
+        """Queue a report and return its job_id, or the id of an identical job still in progress.
+
+        key identifies identical requests and names the cached result; it
+        defaults to a hash of kind, batch_name and params.
+        """
+        self.purge_expired()
+        if key is None:
+            key = job_key(kind, batch_name, params)
+        conn = _connect(self.jobs_db)
+        try:
+            existing = conn.execute(f'''
+                SELECT job_id, owner_pid FROM Jobs
+                WHERE job_key = ? AND status IN ('{QUEUED}', '{RUNNING}')
+            ''', (key,)).fetchone()
+            if existing is not None:
+                if _pid_alive(existing['owner_pid']):
+                    return existing['job_id']
+                # The worker that queued it is gone and so is its pool
+                self._fail(conn, existing['job_id'], 'Worker exited before the report finished')
+            job_id = uuid.uuid4().hex
+            try:
+                conn.execute('''
+                    INSERT INTO Jobs (job_id, job_key, kind, batch_name, params, download_name, archive_path,
+                                      status, owner_pid, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (job_id, key, kind, batch_name, json.dumps(params), download_name, archive_path,
+                      QUEUED, os.getpid(), time.time()))
+                conn.commit()
+            except sqlite3.IntegrityError:
+                # Another worker queued the same report a moment ago
+                conn.rollback()
+                return conn.execute(f'''
+                    SELECT job_id FROM Jobs WHERE job_key = ? AND status IN ('{QUEUED}', '{RUNNING}')
+                ''', (key,)).fetchone()['job_id']
+        finally:
+            conn.close()
+
+        args = (run_job, self.jobs_db, job_id, key, kind, os.path.abspath(db_path), batch_name, params,
+                self.result_dir, archive_path and os.path.abspath(archive_path), self.retention, self.cache_bytes)
+        try:
+            future = self._get_executor().submit(*args)
+        except BrokenProcessPool:
+            self._reset_executor()
+            future = self._get_executor().submit(*args)
+        future.add_done_callback(lambda f: self._on_done(job_id, kind, f))
+        return job_id
+
+    def _on_done(self, job_id, kind, future):
+        # run_job records its own failures; this catches a pool process dying mid-job
+        if not future.cancelled() and future.exception() is None:
+            if self.observer is not None and future.result() is not None:
+                self.observer(kind, future.result())
+        else:
+            conn = _connect(self.jobs_db)
+            self._fail(conn, job_id, 'Report worker stopped unexpectedly')
+            conn.close()
+            if isinstance(future.exception(), BrokenProcessPool):
+                self._reset_executor()
+
+    def _fail(self, conn, job_id, error):
+        now = time.time()
+        conn.execute(f'''
+            UPDATE Jobs SET status = ?, error = ?, finished_at = ?, expires_at = ?
+            WHERE job_id = ? AND status IN ('{QUEUED}', '{RUNNING}')
+        ''', (FAILED, error, now, now + self.retention, job_id))
+        conn.commit()
+
+    def get(self, job_id):
+        conn = _connect(self.jobs_db)
+        job = conn.execute('SELECT * FROM Jobs WHERE job_id = ?', (job_id,)).fetchone()
+        conn.close()
+        return job
+
+    def cached(self, key):
+        """Return (batch_name, sha, path) of the finished report for key, or None."""
+        conn = _connect(self.jobs_db)
+        try:
+            return report_cache.lookup(conn, self.result_dir, key)
+        finally:
+            conn.close()
+
+    def purge_expired(self):
+        """Delete finished jobs past their expiry time and evict cached PDFs unused for as long."""
+        conn = _connect(self.jobs_db)
+        try:
+            expired = conn.execute('DELETE FROM Jobs WHERE expires_at < ?', (time.time(),)).rowcount
+            conn.commit()
+            return expired + report_cache.evict(conn, self.result_dir, self.cache_bytes, self.retention)
+        finally:
+            conn.close()
+
+    def shutdown(self):
+        self._reset_executor()
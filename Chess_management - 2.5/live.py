@@ -0,0 +1,205 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import roster
+import standings
+from database import data_version
+
+# Live standings and boards over Server-Sent Events. Each worker process runs
+# at most one feed thread per batch however many viewers are connected: it
+# polls the batch's DataVersion counter and, when it moves, reads the
+# standings and boards once, diffs them against the last snapshot and queues
+# the changes for every viewer. Commits made by another worker are picked up
+# on the next poll; notify() wakes the feed at once for commits made here.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15
+# A feed with no viewers stops after this long
+IDLE_SECONDS = 60
+# Events a viewer may fall behind by before it is dropped (the browser
+# reconnects and starts again from a snapshot)
+SUBSCRIBER_BACKLOG = 100
+RECONNECT_MS = 3000
+
+
+def _standings(conn):
+    return {row['student_id']: {
+        'rank': rank, 'student_id': row['student_id'], 'name': row['name'], 'class': row['class'],
+        'points': row['points'], 'games': row['games'], 'wins': row['wins'], 'draws': row['draws'],
+        'losses': row['losses'], 'buchholz': row['buchholz'], 'sonneborn_berger': row['sonneborn_berger'],
+    } for rank, row in enumerate(standings.fetch_leaderboard(conn), 1)}
+
+
+def _boards(conn):
+    rows = conn.execute('''
+        SELECT m.match_id, m.student1_id, m.student2_id, m.winner_id, m.points_assigned,
+               sc.slot, sc.room, sc.board, sc.starts_at
+        FROM Matches m
+        LEFT JOIN Schedule sc ON sc.match_id = m.match_id
+    ''')
+    return {row['match_id']: row for row in roster.load(conn).with_names(
+        rows, {'student1_id': 's1_name', 'student2_id': 's2_name'})}
+
+
+def _diff(old, new):
+    return {'changed': [row for key, row in new.items() if old.get(key) != row],
+            'removed': [key for key in old if key not in new]}
+
+
+def _event(name, version, data):
+    return f'id: {version}\nevent: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class Feed:
+    """Change detection and fan-out for one batch database."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._thread = None
+        self.version = None
+        self.standings = {}
+        self.boards = {}
+
+    def _snapshot(self):
+        return _event('snapshot', self.version, {
+            'standings': sorted(self.standings.values(), key=lambda row: row['rank']),
+            'boards': sorted(self.boards.values(), key=lambda row: row['match_id']),
+        })
+
+    def subscribe(self):
+        """Return a queue of SSE messages for a new viewer, starting with a snapshot."""
+        subscriber = queue.Queue(SUBSCRIBER_BACKLOG)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self.version is not None:
+                subscriber.put_nowait(self._snapshot())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'live-feed {self.db_path}', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def wake(self):
+        self._wake.set()
+
+    def _broadcast(self, message):
+        # Called with the lock held
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Too far behind: end its stream so it reconnects to a fresh snapshot
+                self._subscribers.discard(subscriber)
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+
+    def _update(self, conn):
+        version = data_version(conn)
+        if version == self.version:
+            return
+        new_standings = _standings(conn)
+        new_boards = _boards(conn)
+        with self._lock:
+            if self.version is None:
+                self.version, self.standings, self.boards = version, new_standings, new_boards
+                self._broadcast(self._snapshot())
+                return
+            standings_diff = _diff(self.standings, new_standings)
+            boards_diff = _diff(self.boards, new_boards)
+            self.version, self.standings, self.boards = version, new_standings, new_boards
+            if standings_diff['changed'] or standings_diff['removed']:
+                self._broadcast(_event('standings', version, standings_diff))
+            if boards_diff['changed'] or boards_diff['removed']:
+                self._broadcast(_event('boards', version, boards_diff))
+
+    def _run(self):
+        idle_since = None
+        conn = None
+        try:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=5)
+            conn.row_factory = sqlite3.Row
+            while True:
+                self._wake.clear()
+                self._update(conn)
+                with self._lock:
+                    if self._subscribers:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > IDLE_SECONDS:
+                        self._stop()
+                        return
+                self._wake.wait(POLL_SECONDS)
+        except Exception:
+            with self._lock:
+                self._broadcast(None)
+                self._subscribers.clear()
+                self._stop()
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _stop(self):
+        # Called with the lock held; the next subscriber starts a new thread from a fresh snapshot
+        self._thread = None
+        self.version = None
+        self.standings = {}
+        self.boards = {}
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+_feeds_pid = None
+
+
+def get_feed(db_path):
+    global _feeds_pid
+    with _feeds_lock:
+        # Feed threads do not survive a fork; start over in a new worker
+        if _feeds_pid != os.getpid():
+            _feeds.clear()
+            _feeds_pid = os.getpid()
+        feed = _feeds.get(db_path)
+        if feed is None:
+            feed = _feeds[db_path] = Feed(db_path)
+        return feed
+
+
+def notify(db_path):
+    """Wake this process's feed for db_path, if any, after a commit."""
+    feed = _feeds.get(db_path)
+    if feed is not None and _feeds_pid == os.getpid():
+        feed.wake()
+
+
+def stream(db_path):
+    """Yield SSE messages for one viewer of db_path until it disconnects."""
+    feed = get_feed(db_path)
+    subscriber = feed.subscribe()
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'
+        while True:
+            try:
+                message = subscriber.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if message is None:
+                return
+            yield message
+    finally:
+        feed.unsubscribe(subscriber)
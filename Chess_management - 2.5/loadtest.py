@@ -0,0 +1,385 @@
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import click
+
+import benchmarks
+import metrics
+
+# Tournament-day load test. Starts the app under gunicorn with several
+# workers on a generated batch (or targets a running server with --url)
+# and replays a mix of virtual users for a fixed time:
+#
+# - spectators refresh the leaderboard, matches and live pages and search
+#   for players;
+# - arbiters open a pending board and submit its result, or correct a
+#   finished one when nothing is pending;
+# - organizers archive finished games, pair the next round, enter a sheet
+#   of results at once and export the leaderboard PDF.
+#
+# Reports throughput and p50/p95/p99 latency per route as the clients saw
+# it, and the SQLite busy/locked errors the server ran into (count and time
+# spent before failing, per statement) from the difference between two
+# /metrics scrapes.
+#
+#   python loadtest.py --workers 4 --duration 60
+#   python loadtest.py --url http://127.0.0.1:8000 --batch "Spring 2025"
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_NAME = 'loadtest'
+USERNAME = 'admin'
+PASSWORD = 'admin123'
+
+# Spectator page -> weight
+SPECTATOR_PAGES = {
+    '/leaderboard': 40,
+    '/leaderboard?class=7': 10,
+    '/matches': 15,
+    '/': 10,
+    '/students?q={name}': 10,
+    '/students/search?q={name}': 10,
+    '/live': 5,
+}
+SEARCH_NAMES = ('Ari', 'Nus', 'Tan', 'Far', 'Raf', 'Sad', 'Imr', 'Kam', 'Aye', 'Hos', 'Kha')
+
+_SERIES = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_STATEMENT = re.compile(r'statement="((?:[^"\\]|\\.)*)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Client:
+    """One virtual user: a cookie session against base_url that records every request."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect)
+
+    def request(self, route, path=None, method='GET', form=None, body=None, record=True):
+        """Send one request and return (status, body bytes); route names it in the report."""
+        data = None
+        headers = {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + (path or route), data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            status, content = 0, str(e).encode()
+        if record:
+            self.recorder.record(f'{method} {route}', time.perf_counter() - start, status)
+        return status, content
+
+    def log_in(self, batch_name):
+        self.request('/login', method='POST', form={'username': USERNAME, 'password': PASSWORD}, record=False)
+        status, _ = self.request('/select_batch', method='POST', form={'action': 'select', 'batch_name': batch_name},
+                                 record=False)
+        if status != 302:
+            raise RuntimeError(f"Could not select batch '{batch_name}' (HTTP {status})")
+
+    def boards(self):
+        """(pending, finished) matches of the newest page of the matches list."""
+        status, content = self.request('/matches?format=json', '/matches?format=json&sort=match_id&order=desc&limit=200')
+        if status != 200:
+            return [], []
+        items = json.loads(content)['items']
+        return ([m for m in items if not m['points_assigned']], [m for m in items if m['points_assigned']])
+
+
+class Recorder:
+    """Latencies and statuses per route, shared by every virtual user."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # route -> ([seconds], {status: count})
+
+    def record(self, route, seconds, status):
+        with self._lock:
+            latencies, statuses = self.routes.setdefault(route, ([], {}))
+            latencies.append(seconds)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        routes = {}
+        with self._lock:
+            for route, (latencies, statuses) in sorted(self.routes.items()):
+                ordered = sorted(latencies)
+                routes[route] = {
+                    'requests': len(ordered),
+                    'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+                    'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                    'per_second': len(ordered) / elapsed,
+                    'p50_ms': percentile(ordered, 50) * 1000,
+                    'p95_ms': percentile(ordered, 95) * 1000,
+                    'p99_ms': percentile(ordered, 99) * 1000,
+                    'max_ms': ordered[-1] * 1000,
+                }
+        return routes
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def _pause(rng, think, stop):
+    stop.wait(rng.expovariate(1 / think) if think > 0 else 0)
+
+
+def spectator(client, rng, think, stop):
+    pages = list(SPECTATOR_PAGES)
+    weights = list(SPECTATOR_PAGES.values())
+    while not stop.is_set():
+        page = rng.choices(pages, weights)[0]
+        client.request(page, page.format(name=rng.choice(SEARCH_NAMES)))
+        _pause(rng, think, stop)
+
+
+def arbiter(client, rng, think, stop):
+    pending, finished = client.boards()
+    while not stop.is_set():
+        if not pending and not finished:
+            stop.wait(1)
+            pending, finished = client.boards()
+            continue
+        # A result for a waiting board, or a correction when every board is done
+        match = pending.pop(rng.randrange(len(pending))) if pending else rng.choice(finished)
+        client.request('/matches/update/<match_id>', f"/matches/update/{match['match_id']}")
+        _pause(rng, think, stop)
+        winner = rng.choice((match['student1_id'], match['student2_id'], 'draw'))
+        client.request('/matches/update/<match_id>', f"/matches/update/{match['match_id']}", method='POST',
+                       form={'winner': winner})
+        if not pending:
+            pending, finished = client.boards()
+        _pause(rng, think, stop)
+
+
+def organizer(client, rng, interval, stop):
+    while not stop.wait(rng.uniform(interval / 2, interval * 1.5)):
+        pending, _ = client.boards()
+        if pending:
+            # A results sheet handed in for a few boards at once
+            sheet = rng.sample(pending, min(len(pending), 20))
+            client.request('/matches/results', method='POST', body={'results': [
+                {'match_id': m['match_id'], 'winner': rng.choice(('1-0', '0-1', 'draw'))} for m in sheet]})
+        client.request('/matches/archive')
+        pending, _ = client.boards()
+        if not pending:
+            client.request('/matches/auto', method='POST', form={'max_matches': '1'})
+        client.request('/leaderboard/export', '/leaderboard/export?format=json')
+
+
+def scrape(base_url, workers, client):
+    """Lock-error series summed over every worker: {statement: [count, seconds]}.
+
+    Workers publish their metrics at most every metrics.FLUSH_SECONDS when
+    they serve a request, so this waits that long and sends a burst of
+    requests to reach each worker before reading /metrics.
+    """
+    time.sleep(metrics.FLUSH_SECONDS + 0.5)
+    burst = [threading.Thread(target=client.request, args=('/login',), kwargs={'record': False})
+             for _ in range(workers * 4)]
+    for thread in burst:
+        thread.start()
+    for thread in burst:
+        thread.join()
+    status, content = client.request('/metrics', record=False)
+    if status != 200:
+        raise RuntimeError(f'/metrics returned HTTP {status}')
+    locks = {}
+    for line in content.decode().splitlines():
+        match = _SERIES.match(line)
+        if match is None or not match.group(1).startswith('sqlite_lock_error_duration_seconds_'):
+            continue
+        name, labels, value = match.groups()
+        statement = _STATEMENT.search(labels or '')
+        entry = locks.setdefault(statement.group(1) if statement else '', [0, 0.0])
+        if name.endswith('_count'):
+            entry[0] += int(float(value))
+        elif name.endswith('_sum'):
+            entry[1] += float(value)
+    return locks
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(work, workers, threads, log_path):
+    """Run the app under gunicorn with work as its directory; return (process, base_url)."""
+    port = _free_port()
+    env = dict(os.environ, BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+                                    '--chdir', work, '--pythonpath', APP_DIR, 'app:app'],
+                                   env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}; see {log_path}')
+        try:
+            urllib.request.urlopen(f'{base_url}/login', timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not start in 60s; see {log_path}')
+
+
+def run(base_url, batch_name, workers, duration, spectators, arbiters, organizers, think, archive_every, seed,
+        log=print):
+    """Replay the tournament-day mix against base_url for duration seconds; return the results dict."""
+    recorder = Recorder()
+    control = Client(base_url, Recorder())
+    control.log_in(batch_name)
+    locks_before = scrape(base_url, workers, control)
+
+    stop = threading.Event()
+    threads = []
+    roles = ([(spectator, think)] * spectators + [(arbiter, think * 2)] * arbiters +
+             [(organizer, archive_every)] * organizers)
+    for number, (role, pause) in enumerate(roles):
+        client = Client(base_url, recorder)
+        client.log_in(batch_name)
+        threads.append(threading.Thread(target=role, args=(client, random.Random(seed + number), pause, stop),
+                                        name=f'{role.__name__}-{number}', daemon=True))
+    log(f'{spectators} spectators, {arbiters} arbiters and {organizers} organizers for {duration}s against {base_url}')
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    locks_after = scrape(base_url, workers, control)
+    lock_errors = {}
+    for statement, (count, seconds) in locks_after.items():
+        before = locks_before.get(statement, [0, 0.0])
+        if count > before[0]:
+            lock_errors[statement] = {'errors': count - before[0], 'seconds': seconds - before[1]}
+    if lock_errors:
+        status, content = control.request('/metrics/statements', record=False)
+        sql = json.loads(content) if status == 200 else {}
+        for statement, entry in lock_errors.items():
+            entry['sql'] = sql.get(statement, '')
+    routes = recorder.summary(elapsed)
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'base_url': base_url,
+        'workers': workers,
+        'duration': elapsed,
+        'users': {'spectators': spectators, 'arbiters': arbiters, 'organizers': organizers},
+        'think': think,
+        'seed': seed,
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'per_second': total / elapsed,
+        'routes': routes,
+        'lock_errors': lock_errors,
+    }
+
+
+def print_report(results, baseline=None, echo=print):
+    routes = results['routes']
+    old = baseline['routes'] if baseline else {}
+    width = max([len(route) for route in routes] + [5])
+    echo(f"{'route':{width}}  {'reqs':>6}  {'err':>4}  {'req/s':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}"
+         + ('  p95 before' if baseline else ''))
+    for route, stats in routes.items():
+        line = (f"{route:{width}}  {stats['requests']:6d}  {stats['errors']:4d}  {stats['per_second']:7.1f}  "
+                f"{stats['p50_ms']:8.1f}  {stats['p95_ms']:8.1f}  {stats['p99_ms']:8.1f}")
+        if route in old:
+            line += f"  {old[route]['p95_ms']:8.1f}"
+        echo(line)
+    echo(f"{results['requests']} requests in {results['duration']:.1f}s: {results['per_second']:.1f} req/s, "
+         f"{results['errors']} errors" + (f" (before: {baseline['per_second']:.1f} req/s, {baseline['errors']} errors)"
+                                           if baseline else ''))
+    locks = results['lock_errors']
+    echo(f"SQLite busy/locked errors: {sum(e['errors'] for e in locks.values())}, "
+         f"{sum(e['seconds'] for e in locks.values()):.2f}s spent before failing"
+         + (f" (before: {sum(e['errors'] for e in baseline['lock_errors'].values())})" if baseline else ''))
+    for statement, entry in sorted(locks.items(), key=lambda item: -item[1]['errors']):
+        echo(f"  {entry['errors']:5d}  {entry['seconds']:7.2f}s  {statement}  {entry.get('sql', '')[:100]}")
+
+
+@click.command()
+@click.option('--url', default='', help='Test a running server instead of starting one on a generated batch.')
+@click.option('--batch', 'batch_name', default=BATCH_NAME, show_default=True, help='Batch to use with --url.')
+@click.option('--scale', default='small', show_default=True, type=click.Choice(list(benchmarks.SCALES)),
+              help='Size of the generated batch (see benchmarks.py).')
+@click.option('--workers', default=4, show_default=True, help='gunicorn workers.')
+@click.option('--threads', default=8, show_default=True, help='Threads per gunicorn worker.')
+@click.option('--duration', default=30, show_default=True, help='Seconds of load.')
+@click.option('--spectators', default=24, show_default=True)
+@click.option('--arbiters', default=8, show_default=True)
+@click.option('--organizers', default=1, show_default=True)
+@click.option('--think', default=0.2, show_default=True, help='Mean pause between a user\'s requests (seconds).')
+@click.option('--archive-every', default=10.0, show_default=True, help='Mean seconds between organizer rounds.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--output', default='loadtest_results.json', show_default=True, help='Where to write the results.')
+@click.option('--baseline', default='', help='Earlier results to show next to these.')
+def main(url, batch_name, scale, workers, threads, duration, spectators, arbiters, organizers, think, archive_every,
+         seed, output, baseline):
+    """Replay a tournament-day mix of requests and report latency, throughput and lock errors."""
+    output = os.path.abspath(output)
+    process = None
+    with tempfile.TemporaryDirectory() as work:
+        try:
+            if not url:
+                previous = os.getcwd()
+                os.chdir(work)
+                try:
+                    benchmarks.generate(BATCH_NAME, seed=seed, **benchmarks.SCALES[scale])
+                finally:
+                    os.chdir(previous)
+                process, url = start_server(work, workers, threads, os.path.join(work, 'gunicorn.log'))
+                batch_name = BATCH_NAME
+            results = run(url, batch_name, workers, duration, spectators, arbiters, organizers, think, archive_every,
+                          seed, log=click.echo)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(30)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    stored = None
+    if baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+    print_report(results, stored, echo=click.echo)
+    click.echo(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
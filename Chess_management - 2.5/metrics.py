@@ -0,0 +1,287 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+# Request, SQL statement, template and report timings in Prometheus text
+# format. Each worker process records into its own Registry (a lock, a dict
+# lookup and a bisect per observation) and writes a snapshot of it to
+# snapshot_dir at most every FLUSH_SECONDS; /metrics adds up the snapshots of
+# every live worker, so a scrape sees the whole server whichever worker
+# answers it. Statements are grouped by their SQL with whitespace collapsed
+# and literals replaced by ?, so each distinct query is one series, labelled
+# with a short fingerprint ("SELECT Matches 3f2a9c1b": verb, first table and
+# a hash of the normalized SQL). statements() maps fingerprints to the SQL.
+
+# Upper bounds (seconds) of the histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REPORT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FLUSH_SECONDS = 5
+# Series kept per worker; statements beyond it are counted as "other"
+MAX_SERIES = 1000
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by route, method and status.'),
+    'sqlite_statement_duration_seconds': ('histogram', 'Time executing SQL statements and fetching their rows with '
+                                                       'fetchone/fetchmany/fetchall, by statement fingerprint '
+                                                       '(see /metrics/statements).'),
+    'template_render_duration_seconds': ('histogram', 'Time rendering Jinja templates, by template.'),
+    'report_build_duration_seconds': ('histogram', 'Time building PDF reports in the report workers, by kind.'),
+    'sqlite_lock_error_duration_seconds': ('histogram', 'Time statements and commits spent before failing with '
+                                                        'SQLITE_BUSY or SQLITE_LOCKED, by statement fingerprint '
+                                                        '(see /metrics/statements).'),
+    'write_lock_wait_seconds': ('histogram', 'Time a write queue group waited for the batch write lock.'),
+    'write_group_duration_seconds': ('histogram', 'Time from taking a write queue group to its commit.'),
+    'write_mutations_total': ('counter', 'Mutations committed through the write queue.'),
+    'write_groups_total': ('counter', 'Write queue transactions; mutations per group is the ratio of the two.'),
+    'roster_cache_lookups_total': ('counter', 'Roster cache lookups, by result (hit or miss).'),
+    'roster_cache_evictions_total': ('counter', 'Rosters evicted from the roster cache.'),
+    'sqlite_slow_statements_total': ('counter', 'Statements slower than the slow query threshold.'),
+}
+
+slow_query_log = logging.getLogger('chess.slow_queries')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_FIRST_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w.]+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """SQL with whitespace collapsed and literals and IN lists replaced by ?."""
+    sql = _LITERALS.sub('?', ' '.join(sql.split()))
+    return _IN_LISTS.sub('(?...)', sql)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Short label of a statement: its verb, the first table it names and a hash of its normalized SQL."""
+    normalized = normalize_sql(sql)
+    table = _FIRST_TABLE.search(normalized)
+    parts = [normalized.split(' ', 1)[0].upper()]
+    if table:
+        parts.append(table.group(1))
+    parts.append(hashlib.sha1(normalized.encode()).hexdigest()[:8])
+    return ' '.join(parts)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Metrics of one worker process."""
+
+    def __init__(self, snapshot_dir=None, slow_query_seconds=0):
+        self.snapshot_dir = snapshot_dir
+        self.slow_query_seconds = slow_query_seconds
+        self._flushed = 0.0
+        self._reset()
+        # A forked worker starts its own counts instead of repeating the parent's
+        os.register_at_fork(after_in_child=self._reset)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> value
+        self._by_sql = {}  # raw SQL text -> Histogram of its normalized statement
+        self._statements = {}  # fingerprint -> normalized SQL
+
+    def _statement(self, sql):
+        label = fingerprint(sql)
+        if label not in self._statements and len(self._statements) < MAX_SERIES:
+            with self._lock:
+                self._statements[label] = normalize_sql(sql)
+        return label
+
+    def _histogram(self, name, labels, buckets):
+        # Called with the lock held
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = Histogram(buckets)
+        return histogram
+
+    def observe(self, name, labels, seconds, buckets=LATENCY_BUCKETS):
+        """Record seconds in histogram name; labels is a tuple of (label, value) pairs."""
+        with self._lock:
+            self._histogram(name, labels, buckets).observe(seconds)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def observe_statement(self, sql, seconds, error=None):
+        """Connection observer (see db_pool): record one statement's execute and fetch time.
+
+        Failed statements are only recorded if they failed on a lock, in
+        sqlite_lock_error_duration_seconds; that time is mostly spent
+        waiting out the busy timeout.
+        """
+        if error is not None:
+            if getattr(error, 'sqlite_errorcode', 0) & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+                self.observe('sqlite_lock_error_duration_seconds', (('statement', self._statement(sql)),), seconds)
+            return
+        histogram = self._by_sql.get(sql)
+        if histogram is None:
+            statement = self._statement(sql)
+            with self._lock:
+                if len(self._histograms) >= MAX_SERIES and \
+                        ('sqlite_statement_duration_seconds', (('statement', statement),)) not in self._histograms:
+                    statement = 'other'
+                histogram = self._histogram('sqlite_statement_duration_seconds', (('statement', statement),),
+                                            LATENCY_BUCKETS)
+                if len(self._by_sql) < MAX_SERIES * 4:
+                    self._by_sql[sql] = histogram
+        with self._lock:
+            histogram.observe(seconds)
+        if self.slow_query_seconds and seconds >= self.slow_query_seconds:
+            self.inc('sqlite_slow_statements_total', ())
+            slow_query_log.warning('Slow statement %s (%.1f ms): %s', fingerprint(sql), seconds * 1000,
+                                   normalize_sql(sql))
+
+    def observe_write_group(self, mutations, lock_wait, seconds):
+        """Write queue observer (see write_queue.WriteQueue): record one group commit."""
+        self.observe('write_lock_wait_seconds', (), lock_wait)
+        self.observe('write_group_duration_seconds', (), seconds)
+        self.inc('write_mutations_total', (), mutations)
+        self.inc('write_groups_total', ())
+
+    def observe_roster(self, event):
+        """Roster cache observer (see roster.RosterCache): count a lookup or an eviction."""
+        if event == 'eviction':
+            self.inc('roster_cache_evictions_total', ())
+        else:
+            self.inc('roster_cache_lookups_total', (('result', event),))
+
+    def observe_report(self, kind, seconds):
+        """Report job observer (see jobs.JobQueue): time one PDF build."""
+        self.observe('report_build_duration_seconds', (('kind', kind),), seconds, REPORT_BUCKETS)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(h.buckets), h.counts[:], h.sum]
+                               for (name, labels), h in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'statements': dict(self._statements),
+            }
+
+    def flush(self, force=False):
+        """Write this worker's snapshot for the other workers' /metrics, at most every FLUSH_SECONDS."""
+        if not self.snapshot_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < FLUSH_SECONDS:
+            return
+        self._flushed = now
+        path = os.path.join(self.snapshot_dir, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Snapshots of every live worker (this one current), dropping those of workers that have exited."""
+        if not self.snapshot_dir:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(self.snapshot_dir, '*.json')):
+            pid = int(os.path.basename(path)[:-len('.json')])
+            if not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        return render(self.collect())
+
+    def statements(self):
+        """{fingerprint: normalized SQL} of the statements every live worker has labelled."""
+        statements = {}
+        for snapshot in self.collect():
+            statements.update(snapshot.get('statements', {}))
+        return statements
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(snapshots):
+    """Prometheus text exposition of the sum of snapshots."""
+    histograms = {}
+    counters = {}
+    for snapshot in snapshots:
+        for name, labels, buckets, counts, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None or merged[0] != buckets:
+                histograms[key] = [buckets, counts[:], total]
+            else:
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+
+    lines = []
+    seen = set()
+    for (name, labels), (buckets, counts, total) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, ("", ""))[1]}')
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_label_text(labels, (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{_label_text(labels)} {total}')
+        lines.append(f'{name}_count{_label_text(labels)} {cumulative}')
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, ("", ""))[1]}')
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_label_text(labels)} {value}')
+    return '\n'.join(lines) + '\n'
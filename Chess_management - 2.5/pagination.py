@@ -0,0 +1,100 @@
+import base64
+import json
+
+# Keyset (cursor) pagination. A page is read with
+#   WHERE sort_expr >= ? AND (sort_expr > ? OR key > ?) ORDER BY sort_expr, key LIMIT n
+# which SQLite serves as a range seek on a (sort_expr, key) index, so each
+# request touches at most one page of rows however deep it is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor token that is not one this module encoded."""
+
+
+class Page:
+    """One page of rows plus the state needed to render sort and next links."""
+
+    def __init__(self, rows, next_cursor, sort, order, limit):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.sort = sort
+        self.order = order
+        self.limit = limit
+
+    def to_dict(self):
+        return {
+            'items': [{k: row[k] for k in row.keys() if not k.startswith('_')} for row in self.rows],
+            'next_cursor': self.next_cursor,
+            'sort': self.sort,
+            'order': self.order,
+            'limit': self.limit,
+        }
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the [sort value, key] pair in token, or None if there is none.
+
+    Raises InvalidCursor unless token decodes to two numbers or strings, the
+    only values a (NULL-free) sort expression and key can hold.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise InvalidCursor('cursor is not valid base64-encoded JSON') from None
+    if not isinstance(values, list) or len(values) != 2 or \
+            not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in values):
+        raise InvalidCursor('cursor must be a [sort value, key] pair of numbers or strings')
+    return values
+
+
+def parse_page_args(args, sort_columns, default_sort):
+    """Read sort, order, cursor and limit from request args, falling back to safe defaults.
+
+    A malformed cursor has no safe default and raises InvalidCursor.
+    """
+    sort = args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    order = 'desc' if args.get('order') == 'desc' else 'asc'
+    try:
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return sort, order, decode_cursor(args.get('cursor')), limit
+
+
+def keyset_page(conn, columns, from_clause, key, sort_columns, sort, order, cursor, limit,
+                where=(), params=()):
+    """Fetch one page.
+
+    sort_columns maps each sortable name to a NULL-free SQL expression; key
+    is a unique, non-NULL column that breaks ties between equal sort values.
+    """
+    sort_expr = sort_columns[sort]
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    conditions = list(where)
+    params = list(params)
+    if cursor is not None:
+        op = '<' if order == 'desc' else '>'
+        conditions.append(f'{sort_expr} {op}= ? AND ({sort_expr} {op} ? OR {key} {op} ?)')
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    sql = f'SELECT {columns}, {sort_expr} AS _sort_value, {key} AS _sort_key FROM {from_clause}'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {sort_expr} {direction}, {key} {direction} LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['_sort_value'], rows[-1]['_sort_key']])
+    return Page(rows, next_cursor, sort, order, limit)
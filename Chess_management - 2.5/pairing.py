@@ -0,0 +1,183 @@
+import time
+from array import array
+import ratings
+
+# Swiss-system pairing. Players are ranked by score and paired inside their
+# score group, top half against bottom half, skipping anyone they have
+# already played; whoever cannot be paired floats down into the next group.
+# Colours go to whoever is most owed them. Player state is kept in flat
+# arrays indexed by rank, so a round is a single pass over the field.
+#
+# Several rounds can be paired in one call, but their results are not known
+# yet, so every round is grouped by the scores the players start with; only
+# the first is a true Swiss round. Later rounds still avoid rematches and
+# balance colours. For a full Swiss event, pair one round per call after
+# the previous round's results are in.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+WHITE = 1
+BLACK = -1
+
+# How far past the ideal opponent to look for one not yet played before
+# searching the whole group
+SEARCH_WINDOW = 16
+
+
+class PairingResult:
+    """Pairings for one or more rounds: (white, black) student IDs, plus byes and forced rematches."""
+
+    def __init__(self):
+        self.pairs = []
+        self.byes = []
+        self.rematches = 0
+        self.elapsed = 0.0
+
+
+class SwissPairer:
+    """Pairs players over successive rounds, remembering who has played whom.
+
+    players is a list of (student_id, score, games played, rating); history is an
+    iterable of (white_id, black_id) games already played, used for rematch
+    avoidance and colour balance. IDs in history that are not in players
+    are ignored.
+    """
+
+    def __init__(self, players, history=()):
+        # Rank order: score descending, then rating within a score group, then ID
+        players = sorted(players, key=lambda p: (-p[1], -p[3], p[0]))
+        self.ids = [p[0] for p in players]
+        self.scores = array('d', (p[1] for p in players))
+        self.games = array('l', (p[2] for p in players))
+        n = len(players)
+        self.balance = array('l', bytes(8 * n))  # whites minus blacks
+        self.last_color = array('b', bytes(n))
+        self.byes = array('l', bytes(8 * n))  # byes given by this pairer
+        self.opponents = [None] * n  # set of ranks played, created on first game
+        index = {sid: i for i, sid in enumerate(self.ids)}
+        for white_id, black_id in history:
+            w = index.get(white_id)
+            b = index.get(black_id)
+            if w is None or b is None or w == b:
+                continue
+            self._record(w, b)
+
+    def _record(self, w, b):
+        self.balance[w] += 1
+        self.balance[b] -= 1
+        self.last_color[w] = WHITE
+        self.last_color[b] = BLACK
+        for x, y in ((w, b), (b, w)):
+            played = self.opponents[x]
+            if played is None:
+                self.opponents[x] = {y}
+            else:
+                played.add(y)
+
+    def _played(self, a, b):
+        played = self.opponents[a]
+        return played is not None and b in played
+
+    def _colors(self, a, b, board):
+        """Return (white, black) for ranks a < b on board."""
+        if self.balance[a] != self.balance[b]:
+            return (a, b) if self.balance[a] < self.balance[b] else (b, a)
+        if self.last_color[a] != self.last_color[b]:
+            return (a, b) if self.last_color[a] < self.last_color[b] else (b, a)
+        # Nothing to choose between them: alternate by board
+        return (a, b) if board % 2 == 0 else (b, a)
+
+    def _pick_bye(self, ranks):
+        # Byes rotate: fewest byes so far, then most games played (a player
+        # who sat out before has fewer), then lowest score, then lowest ranked
+        return min(ranks, key=lambda r: (self.byes[r], -self.games[r], self.scores[r], -r))
+
+    def _pair_group(self, pool, pairs):
+        """Pair pool (ranks, best first) Dutch-style; return the ranks left unpaired."""
+        n = len(pool)
+        half = n // 2
+        used = bytearray(n)
+        for i in range(n):
+            if used[i]:
+                continue
+            a = pool[i]
+            # Ideal opponent is the same position in the other half
+            start = i + half if i < half else i + 1
+            partner = None
+            for j in range(start, min(start + SEARCH_WINDOW, n)):
+                if not used[j] and not self._played(a, pool[j]):
+                    partner = j
+                    break
+            else:
+                for j in range(i + 1, n):
+                    if not used[j] and not self._played(a, pool[j]):
+                        partner = j
+                        break
+            if partner is not None:
+                used[i] = used[partner] = 1
+                pairs.append((a, pool[partner]))
+        return [pool[i] for i in range(n) if not used[i]]
+
+    def pair_round(self, result):
+        """Pair one round into result and record it, so the next round avoids these games too."""
+        n = len(self.ids)
+        ranks = range(n)
+        if n % 2:
+            bye = self._pick_bye(ranks)
+            result.byes.append(self.ids[bye])
+            self.byes[bye] += 1
+            ranks = [r for r in ranks if r != bye]
+        pairs = []
+        floaters = []
+        group = []
+        for r in ranks:
+            if group and self.scores[r] != self.scores[group[0]]:
+                floaters = self._pair_group(floaters + group, pairs)
+                group = []
+            group.append(r)
+        floaters = self._pair_group(floaters + group, pairs)
+        # Everyone left has played everyone else left: pair them anyway
+        for k in range(0, len(floaters) - 1, 2):
+            pairs.append((floaters[k], floaters[k + 1]))
+            result.rematches += 1
+        for board, (a, b) in enumerate(pairs):
+            w, b = self._colors(min(a, b), max(a, b), board)
+            self._record(w, b)
+            self.games[w] += 1
+            self.games[b] += 1
+            result.pairs.append((self.ids[w], self.ids[b]))
+
+
+def swiss_pairings(players, history=(), rounds=1):
+    """Pair players for rounds rounds, all grouped by the starting scores; see SwissPairer for the arguments."""
+    start = time.perf_counter()
+    result = PairingResult()
+    pairer = SwissPairer(players, history)
+    if len(pairer.ids) >= 2:
+        for _ in range(rounds):
+            pairer.pair_round(result)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def load_players(conn):
+    """Paid players as (student_id, points, matches_played, Elo), for swiss_pairings."""
+    return [(row[0], row[1] or 0, row[2] or 0, row[3]) for row in conn.execute(f'''
+        SELECT s.student_id, s.points, s.matches_played, IFNULL(r.elo, {ratings.ELO_INITIAL})
+        FROM Students s LEFT JOIN Ratings r ON r.student_id = s.student_id
+        WHERE s.paid_entry = 1
+    ''')]
+
+
+def load_history(conn):
+    """Every game in Matches and MatchHistory as (white, black); student1 plays white."""
+    return conn.execute('''
+        SELECT student1_id, student2_id FROM MatchHistory
+        UNION ALL
+        SELECT student1_id, student2_id FROM Matches
+    ''').fetchall()
+
+
+def pair_batch(conn, rounds=1):
+    """Pair the paid players of the batch on conn for rounds rounds."""
+    return swiss_pairings(load_players(conn), load_history(conn), rounds)
@@ -0,0 +1,284 @@
+import json
+import math
+import numpy as np
+
+import history
+
+# Elo and Glicko-2 ratings.
+#
+# Games are rated one at a time in order: archived games (MatchHistory and
+# months in cold storage) by match_id, then Matches by match_id (each game is its own Glicko-2 rating period). To do
+# that with NumPy the games are split into waves in which nobody plays
+# twice; a game goes in the wave after the last one either player appeared
+# in. Every game in a wave only depends on ratings from earlier waves, so a
+# whole wave is rated in one vectorized step and the result is exactly what
+# rating the games one by one would give. For a Swiss event a wave is
+# roughly a round.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+ELO_INITIAL = 1200.0
+ELO_K = 32.0
+
+GLICKO_INITIAL = 1500.0
+GLICKO_RD = 350.0
+GLICKO_VOLATILITY = 0.06
+GLICKO_TAU = 0.5
+_GLICKO_SCALE = 173.7178
+_EPSILON = 1e-6
+
+
+def create_ratings_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Ratings (
+        student_id TEXT PRIMARY KEY,
+        elo REAL NOT NULL,
+        glicko REAL NOT NULL,
+        rd REAL NOT NULL,
+        volatility REAL NOT NULL,
+        games INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    # One row per player per rated game; game numbers follow rating order
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS RatingHistory (
+        game INTEGER NOT NULL,
+        student_id TEXT NOT NULL,
+        opponent_id TEXT NOT NULL,
+        score REAL NOT NULL,
+        elo REAL NOT NULL,
+        glicko REAL NOT NULL,
+        rd REAL NOT NULL,
+        PRIMARY KEY (game, student_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rating_history_student ON RatingHistory(student_id, game)')
+
+
+class RatingState:
+    """Current ratings of n players as parallel arrays."""
+
+    def __init__(self, n):
+        self.elo = np.full(n, ELO_INITIAL)
+        self.mu = np.zeros(n)  # Glicko-2 scale
+        self.phi = np.full(n, GLICKO_RD / _GLICKO_SCALE)
+        self.sigma = np.full(n, GLICKO_VOLATILITY)
+        self.games = np.zeros(n, dtype=np.int64)
+
+    @property
+    def glicko(self):
+        return self.mu * _GLICKO_SCALE + GLICKO_INITIAL
+
+    @property
+    def rd(self):
+        return self.phi * _GLICKO_SCALE
+
+
+def _volatility(sigma, phi, v, delta):
+    """New Glicko-2 volatilities (step 5 of Glickman's paper), solved for all players at once."""
+    a = np.log(sigma ** 2)
+    tau2 = GLICKO_TAU ** 2
+    phi2 = phi ** 2
+    delta2 = delta ** 2
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta2 - phi2 - v - ex) / (2 * (phi2 + v + ex) ** 2) - (x - a) / tau2
+
+    big = delta2 > phi2 + v
+    B = np.where(big, np.log(np.maximum(delta2 - phi2 - v, 1e-300)), a - GLICKO_TAU)
+    small = ~big
+    while True:
+        low = small & (f(B) < 0)
+        if not low.any():
+            break
+        B[low] -= GLICKO_TAU
+    A = a.copy()
+    fA = f(A)
+    fB = f(B)
+    active = np.abs(B - A) > _EPSILON
+    while active.any():
+        C = A + (A - B) * fA / (fB - fA)
+        fC = f(C)
+        swap = active & (fC * fB <= 0)
+        A = np.where(swap, B, A)
+        fA = np.where(swap, fB, np.where(active, fA / 2, fA))
+        B = np.where(active, C, B)
+        fB = np.where(active, fC, fB)
+        active = np.abs(B - A) > _EPSILON
+    return np.exp(A / 2)
+
+
+def rate_wave(state, players, opponents, scores):
+    """Rate one game for each player against opponent (no player twice); scores are 1, 0.5 or 0."""
+    # Elo
+    expected = 1 / (1 + 10 ** ((state.elo[opponents] - state.elo[players]) / 400))
+    new_elo = state.elo[players] + ELO_K * (scores - expected)
+    # Glicko-2, one game per rating period
+    mu, phi, sigma = state.mu[players], state.phi[players], state.sigma[players]
+    mu_j, phi_j = state.mu[opponents], state.phi[opponents]
+    g = 1 / np.sqrt(1 + 3 * phi_j ** 2 / math.pi ** 2)
+    e = 1 / (1 + np.exp(-g * (mu - mu_j)))
+    v = 1 / (g ** 2 * e * (1 - e))
+    delta = v * g * (scores - e)
+    new_sigma = _volatility(sigma, phi, v, delta)
+    phi_star = np.sqrt(phi ** 2 + new_sigma ** 2)
+    new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+    new_mu = mu + new_phi ** 2 * g * (scores - e)
+    state.elo[players] = new_elo
+    state.mu[players] = new_mu
+    state.phi[players] = new_phi
+    state.sigma[players] = new_sigma
+    state.games[players] += 1
+
+
+def waves(white, black, n):
+    """Wave number of each game (see the module comment)."""
+    last = [0] * n
+    wave = np.empty(len(white), dtype=np.int64)
+    for k, (a, b) in enumerate(zip(white.tolist(), black.tolist())):
+        w = max(last[a], last[b]) + 1
+        wave[k] = last[a] = last[b] = w
+    return wave
+
+
+def rate_games(n, white, black, scores, state=None, on_wave=None):
+    """Rate games (index arrays white/black, white's score) in order; return the RatingState.
+
+    on_wave(game indices) is called after each wave with the games it rated.
+    """
+    if state is None:
+        state = RatingState(n)
+    if not len(white):
+        return state
+    wave = waves(white, black, n)
+    order = np.argsort(wave, kind='stable')
+    bounds = np.flatnonzero(np.diff(wave[order])) + 1
+    for games in np.split(order, bounds):
+        players = np.concatenate([white[games], black[games]])
+        opponents = np.concatenate([black[games], white[games]])
+        rate_wave(state, players, opponents, np.concatenate([scores[games], 1 - scores[games]]))
+        if on_wave is not None:
+            on_wave(games)
+    return state
+
+
+def _score(student1_id, student2_id, winner_id):
+    if winner_id == student1_id:
+        return 1.0
+    if winner_id == student2_id:
+        return 0.0
+    return 0.5
+
+
+def load_games(conn):
+    """Every completed game in rating order as (student1_id, student2_id, score for student1)."""
+    archived = [(g['match_id'], g['student1_id'], g['student2_id'], g['winner_id'])
+                for g in history.cold_games(conn) if g['points_assigned'] == 1]
+    archived.extend(row[:4] for row in conn.execute('''
+        SELECT match_id, student1_id, student2_id, winner_id, points_assigned FROM MatchHistory
+    ''') if row[4] == 1)
+    archived.sort(key=lambda g: g[0])
+    current = conn.execute('''
+        SELECT match_id, student1_id, student2_id, winner_id FROM Matches
+        WHERE points_assigned = 1 ORDER BY match_id
+    ''').fetchall()
+    return [(s1, s2, _score(s1, s2, winner_id)) for _, s1, s2, winner_id in archived + current
+            if s1 is not None and s2 is not None and s1 != s2]
+
+
+def _rate(games, state_for, first_game):
+    """Rate games (student1_id, student2_id, score) on top of state_for(ids).
+
+    Return (ids, state, RatingHistory rows numbered from first_game).
+    """
+    ids = sorted({sid for s1, s2, _ in games for sid in (s1, s2)})
+    index = {sid: i for i, sid in enumerate(ids)}
+    white = np.fromiter((index[g[0]] for g in games), dtype=np.int64, count=len(games))
+    black = np.fromiter((index[g[1]] for g in games), dtype=np.int64, count=len(games))
+    scores = np.fromiter((g[2] for g in games), dtype=np.float64, count=len(games))
+    history = []
+    state = state_for(ids)
+
+    def on_wave(wave_games):
+        numbers = (wave_games + first_game).tolist()
+        for side, other, side_scores in ((white, black, scores), (black, white, 1 - scores)):
+            players = side[wave_games]
+            history.extend(zip(numbers, [ids[i] for i in players.tolist()],
+                               [ids[i] for i in other[wave_games].tolist()], side_scores[wave_games].tolist(),
+                               state.elo[players].tolist(),
+                               (state.mu[players] * _GLICKO_SCALE + GLICKO_INITIAL).tolist(),
+                               (state.phi[players] * _GLICKO_SCALE).tolist()))
+
+    rate_games(len(ids), white, black, scores, state, on_wave)
+    return ids, state, history
+
+
+def _store(conn, ids, state, history):
+    conn.executemany('''
+        INSERT INTO Ratings (student_id, elo, glicko, rd, volatility, games) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(student_id) DO UPDATE SET
+            elo = excluded.elo, glicko = excluded.glicko, rd = excluded.rd,
+            volatility = excluded.volatility, games = excluded.games
+    ''', zip(ids, state.elo.tolist(), state.glicko.tolist(), state.rd.tolist(), state.sigma.tolist(),
+             state.games.tolist()))
+    conn.executemany('''
+        INSERT INTO RatingHistory (game, student_id, opponent_id, score, elo, glicko, rd)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', history)
+
+
+def rebuild_ratings(conn):
+    """Recompute Ratings and RatingHistory for the batch on conn from its games; return games rated."""
+    games = load_games(conn)
+    ids, state, history = _rate(games, lambda ids: RatingState(len(ids)), 1)
+    conn.execute('DELETE FROM Ratings')
+    conn.execute('DELETE FROM RatingHistory')
+    _store(conn, ids, state, history)
+    return len(games)
+
+
+def record_games(conn, games):
+    """Rate newly entered results (match_id, student1_id, student2_id, winner_id) on top of the stored ratings.
+
+    The games must already be marked completed in Matches. Ratings follow
+    match_id order, not the order results are entered, so if either
+    player of a new game already has a rated game with a higher match_id
+    (a later round entered first), everything is re-rated with
+    rebuild_ratings instead; return True if that happened.
+    """
+    games = sorted((match_id, s1, s2, _score(s1, s2, winner_id)) for match_id, s1, s2, winner_id in games
+                   if s1 is not None and s2 is not None and s1 != s2)
+    if not games:
+        return False
+    earliest = {}
+    for match_id, s1, s2, _ in reversed(games):
+        earliest[s1] = earliest[s2] = match_id
+    new_ids = {game[0] for game in games}
+    for match_id, s1, s2 in conn.execute('''
+        SELECT match_id, student1_id, student2_id FROM Matches
+        WHERE match_id > ? AND points_assigned = 1
+    ''', (games[0][0],)):
+        if match_id not in new_ids and min(earliest.get(s1, match_id), earliest.get(s2, match_id)) < match_id:
+            rebuild_ratings(conn)
+            return True
+    games = [game[1:] for game in games]
+
+    def stored_state(ids):
+        state = RatingState(len(ids))
+        index = {sid: i for i, sid in enumerate(ids)}
+        for row in conn.execute('''
+            SELECT student_id, elo, glicko, rd, volatility, games FROM Ratings
+            WHERE student_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(ids),)):
+            i = index[row[0]]
+            state.elo[i] = row[1]
+            state.mu[i] = (row[2] - GLICKO_INITIAL) / _GLICKO_SCALE
+            state.phi[i] = row[3] / _GLICKO_SCALE
+            state.sigma[i] = row[4]
+            state.games[i] = row[5]
+        return state
+
+    first_game = conn.execute('SELECT IFNULL(MAX(game), 0) + 1 FROM RatingHistory').fetchone()[0]
+    _store(conn, *_rate(games, stored_state, first_game))
+    return False
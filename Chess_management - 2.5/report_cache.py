@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Content-addressed store for rendered reports. Each PDF is saved once under
+# its SHA-256 (which doubles as its ETag); ReportCache maps a cache key
+# (report kind, batch, filters, data version, day) to the blob. Entries are
+# evicted least recently used first once the blobs exceed the size budget.
+# A hit only writes last_used back when it is more than TOUCH_SECONDS old,
+# so serving a popular report is a read, not a write to DB/jobs.db.
+#
+# A blob is written before its entry is recorded, so eviction (possibly in
+# another worker) leaves blobs younger than BLOB_GRACE_SECONDS alone even
+# when no entry refers to them yet. store_blob refreshes the mtime of a blob
+# it finds already stored, for the same reason.
+
+TOUCH_SECONDS = 300
+BLOB_GRACE_SECONDS = 300
+
+
+def create_cache_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ReportCache (
+        cache_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        batch_name TEXT NOT NULL,
+        blob_sha TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_report_cache_blob ON ReportCache(blob_sha)')
+    conn.commit()
+
+
+def cache_key(kind, batch_name, params, version, day):
+    """Key for a report of kind over batch_name at data version; day covers the 'Generated on' line."""
+    payload = json.dumps([kind, batch_name, params, version, day], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def blob_path(blob_dir, sha):
+    return os.path.join(blob_dir, f'{sha}.pdf')
+
+
+def store_blob(blob_dir, pdf):
+    """Write pdf under its hash unless an identical report is already stored; return (sha, path)."""
+    sha = hashlib.sha256(pdf).hexdigest()
+    path = blob_path(blob_dir, sha)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+    return sha, path
+
+
+def link_archive(path, archive_path):
+    """Expose the blob at path as archive_path, sharing its storage where the filesystem allows."""
+    tmp_path = f'{archive_path}.{os.getpid()}.tmp'
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copyfile(path, tmp_path)
+    os.replace(tmp_path, archive_path)
+
+
+def record(conn, key, kind, batch_name, sha, size):
+    now = time.time()
+    conn.execute('''
+        INSERT OR REPLACE INTO ReportCache (cache_key, kind, batch_name, blob_sha, size, created_at, last_used)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (key, kind, batch_name, sha, size, now, now))
+    conn.commit()
+
+
+def lookup(conn, blob_dir, key):
+    """Return (batch_name, sha, path) for a cached report, or None.
+
+    The entry is marked used if it was last marked over TOUCH_SECONDS ago.
+    """
+    row = conn.execute('SELECT batch_name, blob_sha, last_used FROM ReportCache WHERE cache_key = ?',
+                       (key,)).fetchone()
+    if row is None:
+        return None
+    path = blob_path(blob_dir, row['blob_sha'])
+    if not os.path.exists(path):
+        conn.execute('DELETE FROM ReportCache WHERE cache_key = ?', (key,))
+        conn.commit()
+        return None
+    now = time.time()
+    if now - row['last_used'] > TOUCH_SECONDS:
+        conn.execute('UPDATE ReportCache SET last_used = ? WHERE cache_key = ?', (now, key))
+        conn.commit()
+    return row['batch_name'], row['blob_sha'], path
+
+
+def evict(conn, blob_dir, max_bytes, max_age=None):
+    """Drop least recently used entries until the distinct blobs fit in max_bytes, and any
+    unused for longer than max_age seconds; delete blobs no entry refers to (once older than
+    BLOB_GRACE_SECONDS). Return entries dropped."""
+    cutoff = time.time() - max_age if max_age is not None else None
+    kept_blobs = set()
+    total = 0
+    dropped = []
+    for entry in conn.execute('SELECT cache_key, blob_sha, size, last_used FROM ReportCache ORDER BY last_used DESC'):
+        if cutoff is not None and entry['last_used'] < cutoff:
+            dropped.append(entry['cache_key'])
+        elif entry['blob_sha'] in kept_blobs:
+            continue
+        elif total + entry['size'] <= max_bytes:
+            kept_blobs.add(entry['blob_sha'])
+            total += entry['size']
+        else:
+            dropped.append(entry['cache_key'])
+    if dropped:
+        conn.executemany('DELETE FROM ReportCache WHERE cache_key = ?', [(key,) for key in dropped])
+        conn.commit()
+        grace = time.time() - BLOB_GRACE_SECONDS
+        for name in os.listdir(blob_dir):
+            sha, ext = os.path.splitext(name)
+            if ext != '.pdf' or sha in kept_blobs:
+                continue
+            path = os.path.join(blob_dir, name)
+            try:
+                if os.path.getmtime(path) > grace or conn.execute(
+                        'SELECT 1 FROM ReportCache WHERE blob_sha = ? LIMIT 1', (sha,)).fetchone():
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(dropped)
@@ -0,0 +1,362 @@
+import datetime
+import itertools
+import sqlite3
+from bisect import bisect_right
+from io import BytesIO
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import getFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Flowable
+from reportlab.lib.styles import getSampleStyleSheet
+import history
+import roster
+
+# PDF report builders. Each takes an open batch connection, the batch name
+# and the report parameters, and returns the PDF bytes. They do not touch
+# the Flask request or session, so they can run in a worker process.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+# Shared by every report; reportlab only reads these, so they are built once
+STYLES = getSampleStyleSheet()
+
+# Report tables: a grey header row of white bold text over beige rows, every
+# cell centred and gridded in black
+HEADER_FONT = ('Helvetica-Bold', 9)
+BODY_FONT = ('Helvetica', 10)
+HEADER_BACKGROUND = colors.grey
+HEADER_COLOR = colors.whitesmoke
+BODY_BACKGROUND = colors.beige
+GRID_WIDTH = 1
+# Points: distance between lines of a cell, padding around the text
+LEADING = 12
+SIDE_PADDING = 6
+TOP_PADDING = 3
+BOTTOM_PADDING = 3
+HEADER_BOTTOM_PADDING = 12
+# Longer cells are cut short with an ellipsis
+MAX_CELL_LINES = 3
+ELLIPSIS = '\u2026'
+
+
+def _fit_cell(text, width, font, size, widths):
+    """text as [(line, line width)] no wider than width, wrapped at spaces and cut to MAX_CELL_LINES.
+
+    widths caches line widths for this font and size across calls.
+    """
+    def measure(line):
+        w = widths.get(line)
+        if w is None:
+            w = widths[line] = font.stringWidth(line, size)
+        return w
+
+    whole = measure(text)
+    if whole <= width:
+        return [(text, whole)]
+    lines = []
+    line = ''
+    for word in text.split():
+        if len(lines) > MAX_CELL_LINES:
+            break
+        candidate = f'{line} {word}' if line else word
+        if measure(candidate) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        # A word wider than the cell is broken wherever it reaches the edge
+        while len(word) > 1 and len(lines) <= MAX_CELL_LINES and font.stringWidth(word, size) > width:
+            low, high = 1, len(word) - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if font.stringWidth(word[:middle], size) <= width:
+                    low = middle
+                else:
+                    high = middle - 1
+            lines.append(word[:low])
+            word = word[low:]
+        line = word
+    if line:
+        lines.append(line)
+    if len(lines) > MAX_CELL_LINES:
+        last = lines[MAX_CELL_LINES - 1]
+        while last and measure(last + ELLIPSIS) > width:
+            last = last[:-1]
+        lines = lines[:MAX_CELL_LINES - 1] + [last.rstrip() + ELLIPSIS]
+    return [(line, measure(line)) for line in lines]
+
+
+class _Layout:
+    """The cells of a table wrapped to their columns, and where each row starts; shared by its pages."""
+
+    def __init__(self, header, rows, col_widths):
+        self.col_widths = col_widths
+        self.width = sum(col_widths)
+        room = [w - 2 * SIDE_PADDING for w in col_widths]
+        font, size = getFont(HEADER_FONT[0]), HEADER_FONT[1]
+        widths = {}
+        self.header = [_fit_cell(str(cell), w, font, size, widths) for cell, w in zip(header, room)]
+        self.header_height = (HEADER_BOTTOM_PADDING + TOP_PADDING
+                              + LEADING * max(len(lines) for lines in self.header))
+        font, size = getFont(BODY_FONT[0]), BODY_FONT[1]
+        # Per column, as names and classes repeat down a column
+        widths = [{} for _ in col_widths]
+        self.rows = []
+        # offsets[i]: height of the rows before row i
+        self.offsets = [0]
+        for row in rows:
+            cells = [_fit_cell('' if cell is None else str(cell), w, font, size, column_widths)
+                     for cell, w, column_widths in zip(row, room, widths)]
+            self.rows.append(cells)
+            self.offsets.append(self.offsets[-1] + BOTTOM_PADDING + TOP_PADDING
+                                + LEADING * max(len(lines) for lines in cells))
+
+
+class PagedTable(Flowable):
+    """A header plus any number of rows, laid out one page at a time.
+
+    Every cell is wrapped to its column once, up front, so each row's height
+    and the rows that fit in the space left on a page are a lookup. A split
+    hands the same layout to both halves, each page repeats the header, and
+    rendering stays linear in the number of rows. Pages are drawn straight
+    onto the canvas (backgrounds, one set of grid lines, one text object)
+    rather than through a Table per page, which would style every cell again.
+    """
+
+    def __init__(self, header, rows, col_widths, start=0, end=None, layout=None):
+        Flowable.__init__(self)
+        self.layout = layout or _Layout(header, rows, col_widths)
+        self.start = start
+        self.end = len(self.layout.rows) if end is None else end
+        self.hAlign = 'CENTER'
+
+    def _part(self, start, end):
+        return PagedTable(None, None, None, start, end, self.layout)
+
+    def wrap(self, availWidth, availHeight):
+        layout = self.layout
+        self.width = layout.width
+        self.height = layout.header_height + layout.offsets[self.end] - layout.offsets[self.start]
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        layout = self.layout
+        room = availHeight - layout.header_height
+        end = bisect_right(layout.offsets, layout.offsets[self.start] + room, self.start, self.end + 1) - 1
+        if end <= self.start:
+            return []
+        if end >= self.end:
+            return [self]
+        return [self._part(self.start, end), self._part(end, self.end)]
+
+    def draw(self):
+        layout = self.layout
+        canv = self.canv
+        offsets = layout.offsets
+        body = offsets[self.end] - offsets[self.start]
+        top = body + layout.header_height
+        canv.saveState()
+        canv.setFillColor(HEADER_BACKGROUND)
+        canv.rect(0, body, self.width, layout.header_height, stroke=0, fill=1)
+        canv.setFillColor(BODY_BACKGROUND)
+        canv.rect(0, 0, self.width, body, stroke=0, fill=1)
+
+        lefts = list(itertools.accumulate(layout.col_widths, initial=0))
+        # Row boundaries, from the header's top down to the table's bottom
+        tops = [top] + [body - (offsets[i] - offsets[self.start]) for i in range(self.start, self.end + 1)]
+        canv.setStrokeColor(colors.black)
+        canv.setLineWidth(GRID_WIDTH)
+        canv.lines([(x, 0, x, top) for x in lefts] + [(0, y, self.width, y) for y in tops])
+
+        text = canv.beginText()
+        text.setFont(*HEADER_FONT, leading=LEADING)
+        text.setFillColor(HEADER_COLOR)
+        self._draw_row(text, layout.header, lefts, top, HEADER_FONT[1])
+        text.setFont(*BODY_FONT, leading=LEADING)
+        text.setFillColor(colors.black)
+        for row, row_top in zip(layout.rows[self.start:self.end], tops[1:]):
+            self._draw_row(text, row, lefts, row_top, BODY_FONT[1])
+        canv.drawText(text)
+        canv.restoreState()
+
+    def _draw_row(self, text, cells, lefts, row_top, size):
+        # Lines hang from the top of the row, centred in their column
+        for lines, left, width in zip(cells, lefts, self.layout.col_widths):
+            y = row_top - TOP_PADDING - size
+            for line, line_width in lines:
+                if not line:
+                    break
+                text.setTextOrigin(left + (width - line_width) / 2, y)
+                # The line is already measured; textOut would measure it again to move the cursor
+                text._textOut(line)
+                y -= LEADING
+
+
+def _heading(title, *lines):
+    elements = [Paragraph(title, STYLES['Title']),
+                Paragraph(f"Generated on {datetime.date.today().strftime('%Y-%m-%d')}", STYLES['Normal'])]
+    elements.extend(Paragraph(line, STYLES['Normal']) for line in lines)
+    return elements
+
+
+def _build(elements, progress=None):
+    buffer = BytesIO()
+    # invariant: no timestamp or random ID, so identical data gives identical bytes
+    doc = SimpleDocTemplate(buffer, pagesize=(A4[1], A4[0]), invariant=1)  # Landscape A4
+    if progress is not None:
+        state = {'size': 0}
+
+        def on_progress(kind, value):
+            if kind == 'SIZE_EST':
+                state['size'] = value
+            elif kind == 'PROGRESS' and state['size']:
+                progress(10 + int(85 * value / state['size']))
+        doc.setProgressCallBack(on_progress)
+    doc.build(elements)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def entry_fee_pdf(conn, batch_name, params, progress=None):
+    # Paid students only unless params['all_students'] (the entry fee form)
+    if params.get('all_students'):
+        students = conn.execute('SELECT * FROM Students').fetchall()  # Include all students
+    else:
+        students = conn.execute('SELECT * FROM Students WHERE paid_entry = 1').fetchall()
+    fee_amount = params['fee_amount']
+    if progress is not None:
+        progress(10)
+
+    elements = _heading(f"Entry Fee Report - Batch {batch_name}", f"Fee per Student: {fee_amount} Taka")
+
+    if students:
+        rows = [[student['student_id'], student['name'], student['class'], student['roll'],
+                 student['mobile'], student['year'], 'Yes' if student['paid_entry'] else 'No']
+                for student in students]
+        elements.append(PagedTable(['Student ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year', 'Paid'], rows,
+                                   [20*mm, 40*mm, 20*mm, 20*mm, 30*mm, 20*mm, 20*mm]))
+
+        total_students = len(students)
+        total_amount = total_students * fee_amount
+        elements.append(Paragraph(f"Total Students: {total_students}", STYLES['Normal']))
+        elements.append(Paragraph(f"Total Amount: {total_amount} Taka", STYLES['Normal']))
+
+    return _build(elements, progress)
+
+
+def schedule_pdf(conn, batch_name, params, progress=None):
+    # Placed games by slot, room and board (see scheduler.py), then any not placed yet
+    matches = conn.execute('''
+        SELECT m.match_id, sc.slot, sc.room, sc.board, sc.starts_at,
+               m.student1_id AS s1_id, m.student2_id AS s2_id
+        FROM Matches m
+        LEFT JOIN Schedule sc ON sc.match_id = m.match_id
+        WHERE m.points_assigned = 0
+        ORDER BY sc.slot IS NULL, sc.slot, sc.room, sc.board, m.match_id
+    ''')
+    matches = roster.load(conn).with_names(matches, {'s1_id': 's1_name', 's2_id': 's2_name'},
+                                           {'s1_id': 's1_class', 's2_id': 's2_class'})
+    if progress is not None:
+        progress(10)
+
+    elements = _heading(f"Chess Club Tournament Schedule - Batch {batch_name}")
+    elements.append(Spacer(1, 12))  # Add spacing after header
+
+    if matches:
+        header = ['Match ID', 'Room', 'Board', 'Player 1 ID', 'Player 1 Name', 'Player 1 Class',
+                  'Player 2 ID', 'Player 2 Name', 'Player 2 Class']
+        col_widths = [20*mm, 30*mm, 16*mm, 20*mm, 40*mm, 20*mm, 20*mm, 40*mm, 20*mm]
+        # One section per time slot; board numbers restart at 1 in each room
+        for slot, session_matches in itertools.groupby(matches, key=lambda match: match['slot']):
+            session_matches = list(session_matches)
+            if slot is None:
+                title = "Not yet scheduled"
+            else:
+                title = f"Session {slot + 1}"
+                if session_matches[0]['starts_at']:
+                    title += f" - {session_matches[0]['starts_at']}"
+            elements.append(Paragraph(title, STYLES['Heading2']))
+            elements.append(Spacer(1, 6))
+            rows = [[str(match['match_id']), match['room'] or '', f"Board-{match['board']}" if match['board'] else '',
+                     match['s1_id'], match['s1_name'], match['s1_class'],
+                     match['s2_id'], match['s2_name'], match['s2_class']]
+                    for match in session_matches]
+            elements.append(PagedTable(header, rows, col_widths))
+            elements.append(Spacer(1, 12))  # Add spacing between sessions
+    else:
+        elements.append(Paragraph("No pending matches available.", STYLES['Normal']))
+
+    return _build(elements, progress)
+
+
+def results_pdf(conn, batch_name, params, progress=None):
+    matches = conn.execute('''
+        SELECT m.match_id, m.student1_id AS s1_id, m.student2_id AS s2_id, m.winner_id
+        FROM Matches m
+        WHERE m.points_assigned = 1
+    ''')
+    matches = roster.load(conn).with_names(matches, {'s1_id': 's1_name', 's2_id': 's2_name', 'winner_id': 'winner_name'},
+                                           {'s1_id': 's1_class', 's2_id': 's2_class'})
+    if progress is not None:
+        progress(10)
+
+    elements = _heading(f"Chess Club Match Results - Batch {batch_name}")
+
+    if matches:
+        rows = [[str(match['match_id']), match['s1_id'], match['s1_name'], match['s1_class'],
+                 match['s2_id'], match['s2_name'], match['s2_class'], match['winner_name'] or 'Draw']
+                for match in matches]
+        elements.append(PagedTable(['Match ID', 'Player 1 ID', 'Player 1 Name', 'Player 1 Class',
+                                    'Player 2 ID', 'Player 2 Name', 'Player 2 Class', 'Winner'], rows,
+                                   [20*mm, 20*mm, 40*mm, 20*mm, 20*mm, 40*mm, 20*mm, 40*mm]))
+
+    return _build(elements, progress)
+
+
+def leaderboard_pdf(conn, batch_name, params, progress=None):
+    month_filter = params.get('month', '')
+    month_to = params.get('month_to', '')
+    leaders = history.fetch_leaderboard(conn, month_filter, month_to, params.get('class', ''))
+    if progress is not None:
+        progress(10)
+
+    title = f"Chess Club Leaderboard - Batch {batch_name}"
+    if month_filter and month_to and month_to != month_filter:
+        title += f" ({month_filter} to {month_to})"
+    elif month_filter:
+        title += f" ({month_filter})"
+    elements = _heading(title)
+
+    if leaders:
+        rows = [[str(i + 1), leader['student_id'], leader['name'], leader['class'], leader['roll'],
+                 leader['mobile'], leader['year'], str(leader['points']), str(leader['matches_played']),
+                 f"{leader['elo']:.0f}" if leader['elo'] is not None else '-',
+                 f"{leader['buchholz']:g}", f"{leader['sonneborn_berger']:g}"]
+                for i, leader in enumerate(leaders)]
+        elements.append(PagedTable(['Rank', 'Student ID', 'Name', 'Class', 'Roll', 'Mobile', 'Year', 'Points',
+                                    'Matches Played', 'Elo', 'Buchholz', 'SB'], rows,
+                                   [12*mm, 18*mm, 36*mm, 16*mm, 16*mm, 30*mm, 14*mm, 16*mm, 24*mm, 16*mm,
+                                    18*mm, 16*mm]))
+
+    return _build(elements, progress)
+
+
+# Report kind -> builder
+REPORTS = {
+    'entry_fee': entry_fee_pdf,
+    'schedule': schedule_pdf,
+    'results': results_pdf,
+    'leaderboard': leaderboard_pdf,
+}
+
+
+def build_report(kind, db_path, batch_name, params, progress=None):
+    """Open db_path read-only and build the kind report."""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        return REPORTS[kind](conn, batch_name, params, progress)
+    finally:
+        conn.close()
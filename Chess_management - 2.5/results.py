@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import time
+
+import brackets
+import ratings
+import standings
+import tiebreaks
+
+# Result entry for one board or a whole round. The submitted boards are
+# validated together against a single read of their matches; if every board
+# is valid, the points, matches_played, standings and winner changes are
+# applied in one transaction with a few set-based statements over a temp
+# table of changed boards. Boards whose stored result already matches are
+# left alone, so resubmitting a round is harmless.
+
+REQUIRED_HEADERS = ('match_id', 'winner')
+MAX_BOARDS = 5000
+
+# Winner values other than a player's student ID; student1 plays white
+_WHITE_WINS = {'1-0', 'white'}
+_BLACK_WINS = {'0-1', 'black'}
+_DRAWS = {'draw', '1/2-1/2', '½-½', '0.5-0.5'}
+
+# Points for one side of a game (student_id against winner_id), as Standings scores them
+_POINTS = 'CASE WHEN {winner} = {player} THEN 3 WHEN {winner} IS NULL THEN 0.5 ELSE 0 END'
+
+_STUDENT_DELTAS_SQL = f'''
+    SELECT student_id, SUM(points) AS points, SUM(played) AS played FROM (
+        SELECT student1_id AS student_id,
+               {_POINTS.format(winner='winner_id', player='student1_id')}
+               - old_assigned * ({_POINTS.format(winner='old_winner_id', player='student1_id')}) AS points,
+               1 - old_assigned AS played
+        FROM temp.ResultChanges
+        UNION ALL
+        SELECT student2_id,
+               {_POINTS.format(winner='winner_id', player='student2_id')}
+               - old_assigned * ({_POINTS.format(winner='old_winner_id', player='student2_id')}),
+               1 - old_assigned
+        FROM temp.ResultChanges
+    ) GROUP BY student_id
+'''
+
+
+class ResultReport:
+    """Outcome of a results submission."""
+
+    def __init__(self):
+        self.boards = 0
+        self.applied = 0
+        self.rescored = 0
+        self.unchanged = 0
+        self.started = 0  # knockout games created by these results
+        self.errors = []  # (board, match ID, message)
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {
+            'ok': self.ok,
+            'boards': self.boards,
+            'applied': self.applied,
+            'rescored': self.rescored,
+            'unchanged': self.unchanged,
+            'started': self.started,
+            'errors': [{'board': board, 'match_id': match_id, 'message': msg} for board, match_id, msg in self.errors],
+            'elapsed': self.elapsed,
+        }
+
+
+def read_csv(stream):
+    """Read a binary CSV stream with match_id and winner columns into (line, match_id, winner) entries.
+
+    Raises ValueError if the headers are missing.
+    """
+    # newline='' leaves row endings to the csv module (see csv_import)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if reader.fieldnames is None:
+            raise ValueError("The uploaded CSV file is empty.")
+        missing = [h for h in REQUIRED_HEADERS if h not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"CSV is missing headers: {', '.join(missing)}. Expected headers: {', '.join(REQUIRED_HEADERS)}")
+        try:
+            return [(reader.line_num, row['match_id'], row['winner']) for row in reader]
+        except (csv.Error, UnicodeError) as e:
+            raise ValueError(f"Error processing CSV at line {reader.line_num}: {e}")
+    finally:
+        text.detach()
+
+
+def read_json(payload):
+    """Read {"results": [{"match_id": ..., "winner": ...}, ...]} (or the bare list) into (board, match_id, winner) entries.
+
+    Raises ValueError if payload has the wrong shape.
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('results')
+    if not isinstance(payload, list) or not all(isinstance(item, dict) for item in payload):
+        raise ValueError('Expected a list of {"match_id": ..., "winner": ...} objects under "results".')
+    return [(board, item.get('match_id'), item.get('winner')) for board, item in enumerate(payload, 1)]
+
+
+def _winner(value, student1_id, student2_id):
+    """Return (winner_id, error) for a submitted winner: a player's ID, 1-0 / 0-1, or a draw."""
+    value = str(value).strip() if value is not None else ''
+    if value in (student1_id, student2_id):
+        return value, None
+    key = value.lower()
+    if key in _WHITE_WINS:
+        return student1_id, None
+    if key in _BLACK_WINS:
+        return student2_id, None
+    if key in _DRAWS:
+        return None, None
+    if not value:
+        return None, 'missing winner'
+    return None, f"winner '{value}' is not playing in this match"
+
+
+def apply_results(conn, entries):
+    """Validate and apply (board, match_id, winner) entries; return a ResultReport.
+
+    Nothing is written unless every board is valid. A board whose match
+    already has a different result is rescored: the old result comes out of
+    points and standings and ratings are recomputed from scratch.
+    """
+    report = ResultReport()
+    start = time.perf_counter()
+    report.boards = len(entries)
+    if len(entries) > MAX_BOARDS:
+        report.errors.append((None, None, f'at most {MAX_BOARDS} boards per submission'))
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    match_ids = []
+    for board, match_id, _ in entries:
+        try:
+            match_ids.append(int(str(match_id).strip()))
+        except ValueError:
+            match_ids.append(None)
+    matches = {row['match_id']: row for row in conn.execute('''
+        SELECT m.match_id, m.student1_id, m.student2_id, m.winner_id, m.points_assigned,
+               bg.match_id IS NOT NULL AS knockout
+        FROM Matches m
+        LEFT JOIN BracketGames bg ON bg.match_id = m.match_id
+        WHERE m.match_id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([m for m in match_ids if m is not None]),))}
+
+    changes = []
+    seen = set()
+    for (board, raw_id, value), match_id in zip(entries, match_ids):
+        if match_id is None:
+            report.errors.append((board, raw_id, 'invalid match ID'))
+            continue
+        if match_id in seen:
+            report.errors.append((board, match_id, 'match submitted more than once'))
+            continue
+        seen.add(match_id)
+        match = matches.get(match_id)
+        if match is None:
+            report.errors.append((board, match_id, 'no such match in this batch'))
+            continue
+        s1, s2 = match['student1_id'], match['student2_id']
+        if s1 is None or s2 is None or s1 == s2:
+            report.errors.append((board, match_id, 'match does not have two players'))
+            continue
+        winner_id, error = _winner(value, s1, s2)
+        if error:
+            report.errors.append((board, match_id, error))
+            continue
+        if match['points_assigned'] and match['winner_id'] == winner_id:
+            report.unchanged += 1
+            continue
+        if match['points_assigned'] and match['knockout']:
+            report.errors.append((board, match_id, 'knockout result already decided the next round'))
+            continue
+        changes.append((match_id, s1, s2, winner_id, match['winner_id'], 1 if match['points_assigned'] else 0))
+    if report.errors or not changes:
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    changes.sort()
+    report.rescored = sum(change[5] for change in changes)
+    report.applied = len(changes) - report.rescored
+    try:
+        conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS ResultChanges (
+            match_id INTEGER PRIMARY KEY,
+            student1_id TEXT NOT NULL,
+            student2_id TEXT NOT NULL,
+            winner_id TEXT,
+            old_winner_id TEXT,
+            old_assigned INTEGER NOT NULL
+        )
+        ''')
+        conn.execute('DELETE FROM temp.ResultChanges')
+        conn.executemany('''
+            INSERT INTO temp.ResultChanges (match_id, student1_id, student2_id, winner_id, old_winner_id, old_assigned)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', changes)
+        conn.execute(f'''
+            UPDATE Students SET points = Students.points + d.points, matches_played = Students.matches_played + d.played
+            FROM ({_STUDENT_DELTAS_SQL}) AS d
+            WHERE Students.student_id = d.student_id
+        ''')
+        if report.rescored:
+            standings.record_results(conn, '''(SELECT student1_id, student2_id, old_winner_id AS winner_id,
+                                                      old_assigned AS points_assigned FROM temp.ResultChanges)''',
+                                     sign=-1)
+        standings.record_results(conn, '''(SELECT student1_id, student2_id, winner_id,
+                                                  1 AS points_assigned FROM temp.ResultChanges)''')
+        conn.execute('''
+            UPDATE Matches SET winner_id = c.winner_id, points_assigned = 1
+            FROM temp.ResultChanges AS c
+            WHERE Matches.match_id = c.match_id
+        ''')
+        if report.rescored:
+            # Later games were rated on top of the old results, so re-rate them all
+            ratings.rebuild_ratings(conn)
+        else:
+            # Re-rates everything itself if a later round was entered first
+            ratings.record_games(conn, [change[:4] for change in changes])
+        tiebreaks.rebuild_period(conn, standings.CURRENT_PERIOD)
+        report.started = brackets.advance(conn, [change[0] for change in changes])
+        conn.execute('DELETE FROM temp.ResultChanges')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        report.elapsed = time.perf_counter() - start
+    return report
@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict
+
+# Process-local cache of each batch's roster (student ID, name and class).
+# Match listings, the live board, reports, brackets and the scheduler look
+# player names and classes up here instead of joining Students once per
+# player column. A cached roster is checked on every use against the
+# batch's RosterVersion counter, a single primary-key read. Triggers bump
+# the counter only when a student is added or removed or an ID, name or
+# class changes, so entering results (which rewrites Students.points)
+# leaves the roster valid; DataVersion and PRAGMA data_version move on
+# every commit and would throw it away each round. Rosters of the
+# MAX_ROSTERS most recently used batches are kept.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+MAX_ROSTERS = 32
+
+# Name columns added to match rows by RosterCache.with_names, by ID column
+MATCH_NAMES = {'student1_id': 's1_name', 'student2_id': 's2_name', 'winner_id': 'winner_name'}
+
+
+def create_roster_version(conn):
+    # Starts at a random value so a batch deleted and created again under the
+    # same name does not repeat the versions of a roster cached for the old one
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS RosterVersion (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO RosterVersion (id, version) VALUES (1, random() >> 16 & 0xffffffffff)')
+    for name, event in (('insert', 'INSERT'), ('update', 'UPDATE OF student_id, name, class'), ('delete', 'DELETE')):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS students_roster_{name} AFTER {event} ON Students BEGIN
+            UPDATE RosterVersion SET version = version + 1 WHERE id = 1;
+        END
+        ''')
+
+
+def roster_version(conn):
+    """Return the batch's roster version, which changes whenever a student's ID, name or class does."""
+    return conn.execute('SELECT version FROM RosterVersion WHERE id = 1').fetchone()[0]
+
+
+class Roster:
+    """The students of a batch at one roster version, as parallel lists."""
+
+    __slots__ = ('version', 'ids', 'names', 'classes', '_positions')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.classes = [row[2] for row in rows]
+        self._positions = {student_id: i for i, student_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, student_id):
+        return student_id in self._positions
+
+    def name(self, student_id):
+        """Name of student_id, or None for an unknown ID (or 'draw', or NULL)."""
+        i = self._positions.get(student_id)
+        return None if i is None else self.names[i]
+
+    def student_class(self, student_id):
+        i = self._positions.get(student_id)
+        return None if i is None else self.classes[i]
+
+    def with_names(self, rows, names=MATCH_NAMES, classes=None):
+        """rows as dicts, adding the student name (and class) of each ID column.
+
+        names and classes map an ID column to the column the student's name
+        or class goes in; unknown students get None, as a LEFT JOIN would.
+        """
+        positions = self._positions
+        named = [(id_column, column, self.names) for id_column, column in names.items()]
+        if classes:
+            named += [(id_column, column, self.classes) for id_column, column in classes.items()]
+        result = []
+        for row in rows:
+            row = dict(row)
+            for id_column, column, values in named:
+                i = positions.get(row[id_column])
+                row[column] = None if i is None else values[i]
+            result.append(row)
+        return result
+
+
+class RosterCache:
+    """Rosters of the most recently used batches in this process.
+
+    observer, if set, is called as observer(event) for every lookup
+    ('hit' or 'miss') and every roster evicted ('eviction').
+    """
+
+    def __init__(self, max_rosters=MAX_ROSTERS, observer=None):
+        self.max_rosters = max_rosters
+        self.observer = observer
+        self._lock = threading.Lock()
+        self._rosters = OrderedDict()  # database path -> Roster, least recently used first
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, conn):
+        """The roster of the batch conn is open on, read from conn only if it changed since it was cached."""
+        key = getattr(conn, '_db_path', None) or _database_path(conn)
+        version = roster_version(conn)
+        with self._lock:
+            roster = self._rosters.get(key)
+            hit = roster is not None and roster.version == version
+            if hit:
+                self._rosters.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if self.observer is not None:
+            self.observer('hit' if hit else 'miss')
+        if hit:
+            return roster
+        # The version is read first, so a roster is never older than its version
+        roster = Roster(version, conn.execute('SELECT student_id, name, class FROM Students').fetchall())
+        if conn.in_transaction:
+            # Uncommitted students may yet be rolled back; only committed rosters are kept
+            return roster
+        evicted = 0
+        with self._lock:
+            current = self._rosters.get(key)
+            if current is None or current.version != version:
+                self._rosters[key] = roster
+            self._rosters.move_to_end(key)
+            while len(self._rosters) > self.max_rosters:
+                self._rosters.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if self.observer is not None:
+            for _ in range(evicted):
+                self.observer('eviction')
+        return roster
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'rosters': len(self._rosters),
+                'students': sum(len(roster) for roster in self._rosters.values()),
+            }
+
+
+def _database_path(conn):
+    # Connections opened outside the pool (report builds, live feeds)
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+# This process's rosters
+rosters = RosterCache()
+
+
+def load(conn):
+    """The roster of the batch conn is open on, from this process's cache."""
+    return rosters.get(conn)
@@ -0,0 +1,261 @@
+import datetime
+import json
+import time
+
+import roster
+
+# Board and time-slot scheduling for pending matches.
+#
+# Games are placed one at a time, busiest players first, into the earliest
+# time slot where a room the players may use has a free board, neither
+# player is already playing and both have had rest_slots slots off since
+# (and before) their other games: a first-fit colouring of the conflict
+# graph with a capacity per colour. Each room keeps a skip list over its
+# full slots and each player a set of busy slots, so a placement only
+# looks at the few slots that are actually blocked.
+#
+# Rooms can be limited to classes. A game goes to a room that takes both
+# players' classes or to an unrestricted room (the class room when both
+# have a board at the same time), else to a room that takes either class.
+# The assignment is stored in Schedule (one row per match) and read by the
+# schedule PDF, the matches page and the live board.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+DEFAULT_SETTINGS = {
+    'rooms': [{'name': 'Hall', 'boards': 10, 'classes': []}],
+    'rest_slots': 0,
+    'slot_minutes': 60,
+    'start': '',
+}
+MAX_BOARDS_PER_ROOM = 500
+START_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def create_schedule_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Schedule (
+        match_id INTEGER PRIMARY KEY,
+        slot INTEGER NOT NULL,
+        room TEXT NOT NULL,
+        board INTEGER NOT NULL,
+        starts_at TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_schedule_slot ON Schedule(slot, room, board)')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ScheduleSettings (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        settings TEXT NOT NULL
+    )
+    ''')
+    # A deleted (archived) match gives up its board
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS matches_schedule_delete AFTER DELETE ON Matches BEGIN
+        DELETE FROM Schedule WHERE match_id = old.match_id;
+    END
+    ''')
+
+
+def load_settings(conn):
+    row = conn.execute('SELECT settings FROM ScheduleSettings WHERE id = 1').fetchone()
+    return json.loads(row[0]) if row else dict(DEFAULT_SETTINGS)
+
+
+def save_settings(conn, settings):
+    conn.execute('''
+        INSERT INTO ScheduleSettings (id, settings) VALUES (1, ?)
+        ON CONFLICT(id) DO UPDATE SET settings = excluded.settings
+    ''', (json.dumps(settings),))
+
+
+def parse_rooms(text):
+    """Parse one room per line, "name: boards" or "name: boards: class, class, ...".
+
+    Raises ValueError on a malformed line.
+    """
+    rooms = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        parts = [part.strip() for part in line.split(':')]
+        if len(parts) not in (2, 3) or not parts[0]:
+            raise ValueError(f'Room line {lineno}: expected "name: boards" or "name: boards: classes"')
+        try:
+            boards = int(parts[1])
+        except ValueError:
+            raise ValueError(f'Room line {lineno}: "{parts[1]}" is not a number of boards')
+        if not 1 <= boards <= MAX_BOARDS_PER_ROOM:
+            raise ValueError(f'Room line {lineno}: boards must be between 1 and {MAX_BOARDS_PER_ROOM}')
+        if any(room['name'] == parts[0] for room in rooms):
+            raise ValueError(f'Room line {lineno}: room "{parts[0]}" is listed twice')
+        classes = [c.strip() for c in parts[2].split(',') if c.strip()] if len(parts) == 3 else []
+        rooms.append({'name': parts[0], 'boards': boards, 'classes': classes})
+    if not rooms:
+        raise ValueError('At least one room is needed')
+    return rooms
+
+
+def format_rooms(rooms):
+    return '\n'.join(f"{room['name']}: {room['boards']}" + (f": {', '.join(room['classes'])}" if room['classes'] else '')
+                     for room in rooms)
+
+
+def _room_choices(rooms):
+    """Return choices(class1, class2) giving the indexes of the rooms a game may use."""
+    unrestricted = [i for i, room in enumerate(rooms) if not room['classes']]
+    takes = {}
+    for i, room in enumerate(rooms):
+        for c in room['classes']:
+            takes.setdefault(c, []).append(i)
+    cache = {}
+
+    def choices(class1, class2):
+        key = (class1, class2)
+        if key not in cache:
+            first, second = takes.get(class1, []), takes.get(class2, [])
+            both = [i for i in first if i in second]
+            cache[key] = both + unrestricted or sorted(set(first) | set(second))
+        return cache[key]
+    return choices
+
+
+def _first_free(skip, slot):
+    """Earliest slot at or after slot that is not full, compressing the skip chain."""
+    root = slot
+    while root in skip:
+        root = skip[root]
+    while slot in skip and skip[slot] != root:
+        skip[slot], slot = root, skip[slot]
+    return root
+
+
+def plan(games, rooms, rest_slots=0, booked=(), first_slot=0):
+    """Place games (match_id, student1_id, student2_id, class1, class2) on boards.
+
+    booked holds (match_id, student1_id, student2_id, slot, room index,
+    board) for games that keep their place. Return (assignments as
+    (match_id, slot, room index, board), match_ids that no room takes).
+    """
+    skips = [{} for _ in rooms]
+    used = [{} for _ in rooms]
+    busy = {}
+
+    def take(slot, room, board, players):
+        boards = used[room].setdefault(slot, set())
+        boards.add(board)
+        if len(boards) >= rooms[room]['boards']:
+            skips[room][slot] = slot + 1
+        for player in players:
+            busy.setdefault(player, set()).add(slot)
+
+    for _, s1, s2, slot, room, board in booked:
+        take(slot, room, board, (s1, s2))
+
+    degree = {}
+    for _, s1, s2, _, _ in games:
+        degree[s1] = degree.get(s1, 0) + 1
+        degree[s2] = degree.get(s2, 0) + 1
+    order = sorted(games, key=lambda g: (-max(degree[g[1]], degree[g[2]]), g[0]))
+
+    choices = _room_choices(rooms)
+    assignments = []
+    unscheduled = []
+    for match_id, s1, s2, class1, class2 in order:
+        candidates = choices(class1, class2)
+        if not candidates:
+            unscheduled.append(match_id)
+            continue
+        player_slots = (busy.get(s1, ()), busy.get(s2, ()))
+        best = None
+        for room in candidates:
+            slot = first_slot
+            while True:
+                slot = _first_free(skips[room], slot)
+                # Latest busy slot of either player too close to this one
+                clash = max((b for taken in player_slots for b in range(slot - rest_slots, slot + rest_slots + 1)
+                             if b in taken), default=None)
+                if clash is None:
+                    break
+                slot = clash + rest_slots + 1
+            if best is None or slot < best[0]:
+                best = (slot, room)
+                if slot == first_slot:
+                    break
+        slot, room = best
+        boards = used[room].get(slot, ())
+        board = next(b for b in range(1, rooms[room]['boards'] + 1) if b not in boards)
+        take(slot, room, board, (s1, s2))
+        assignments.append((match_id, slot, room, board))
+    return assignments, unscheduled
+
+
+class ScheduleResult:
+    """Outcome of a scheduling run."""
+
+    def __init__(self):
+        self.scheduled = 0
+        self.kept = 0
+        self.unscheduled = []
+        self.slots = 0
+        self.elapsed = 0.0
+
+
+def schedule(conn, settings=None, reschedule=False):
+    """Assign pending matches without a place to boards and slots; return a ScheduleResult.
+
+    With reschedule, every pending match is placed again. Slots up to the
+    latest one with a finished game count as played, so new games start
+    after it. settings default to the stored ones; the caller commits.
+    """
+    start = time.perf_counter()
+    settings = settings or load_settings(conn)
+    rooms = settings['rooms']
+    room_index = {room['name']: i for i, room in enumerate(rooms)}
+    if reschedule:
+        conn.execute('DELETE FROM Schedule WHERE match_id IN (SELECT match_id FROM Matches WHERE points_assigned = 0)')
+
+    rows = conn.execute('''
+        SELECT m.match_id, m.student1_id, m.student2_id, m.points_assigned, sc.slot, sc.room, sc.board
+        FROM Matches m
+        LEFT JOIN Schedule sc ON sc.match_id = m.match_id
+    ''').fetchall()
+    players = roster.load(conn)
+    played = [row[4] for row in rows if row[3] and row[4] is not None]
+    first_slot = max(played) + 1 if played else 0
+    booked = []
+    games = []
+    stale = []
+    for match_id, s1, s2, assigned, slot, room, board in rows:
+        if slot is not None and room in room_index:
+            booked.append((match_id, s1, s2, slot, room_index[room], board))
+        elif not assigned:
+            if slot is not None:
+                # Its room is gone from the settings
+                stale.append((match_id,))
+            games.append((match_id, s1, s2, players.student_class(s1), players.student_class(s2)))
+    conn.executemany('DELETE FROM Schedule WHERE match_id = ?', stale)
+
+    assignments, unscheduled = plan(games, rooms, settings.get('rest_slots', 0), booked, first_slot)
+    begins = datetime.datetime.strptime(settings['start'], START_FORMAT) if settings.get('start') else None
+    minutes = settings.get('slot_minutes', 60)
+
+    def starts_at(slot):
+        if begins is None:
+            return None
+        return (begins + datetime.timedelta(minutes=slot * minutes)).strftime(START_FORMAT)
+
+    conn.executemany('''
+        INSERT INTO Schedule (match_id, slot, room, board, starts_at) VALUES (?, ?, ?, ?, ?)
+    ''', [(match_id, slot, rooms[room]['name'], board, starts_at(slot)) for match_id, slot, room, board in assignments])
+    if reschedule or stale:
+        conn.executemany('UPDATE Schedule SET starts_at = ? WHERE match_id = ?',
+                         [(starts_at(slot), match_id) for match_id, _, _, slot, _, _ in booked])
+
+    result = ScheduleResult()
+    result.scheduled = len(assignments)
+    result.kept = len(booked)
+    result.unscheduled = unscheduled
+    result.slots = 1 + max([slot for _, slot, _, _ in assignments] + [b[3] for b in booked], default=-1)
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,124 @@
+import re
+
+# Full-text student search. StudentSearch indexes the identifying columns
+# for ranked prefix queries; StudentTrigrams indexes names by trigram so
+# misspelled names still find candidates. Both are external-content FTS5
+# tables over Students, kept in sync by triggers.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+_INDEXED_COLUMNS = ('student_id', 'name', 'class', 'roll', 'mobile')
+
+# bm25 column weights, in _INDEXED_COLUMNS order: a name hit ranks highest
+_BM25_WEIGHTS = '5.0, 10.0, 2.0, 1.0, 1.0'
+
+# Share of the query's (padded) trigrams a name must contain to count as a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.5
+
+
+def create_search_index(conn):
+    columns = ', '.join(_INDEXED_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in _INDEXED_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in _INDEXED_COLUMNS)
+    conn.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS StudentSearch USING fts5(
+        {columns}, content='Students', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''')
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS StudentTrigrams USING fts5(
+        name, content='Students', content_rowid='id', tokenize='trigram'
+    )
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS students_search_insert AFTER INSERT ON Students BEGIN
+        INSERT INTO StudentSearch(rowid, {columns}) VALUES (new.id, {new_values});
+        INSERT INTO StudentTrigrams(rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS students_search_delete AFTER DELETE ON Students BEGIN
+        INSERT INTO StudentSearch(StudentSearch, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO StudentTrigrams(StudentTrigrams, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    ''')
+    # Points and paid_entry change constantly; only re-index the searchable columns
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS students_search_update AFTER UPDATE OF {columns} ON Students BEGIN
+        INSERT INTO StudentSearch(StudentSearch, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO StudentSearch(rowid, {columns}) VALUES (new.id, {new_values});
+        INSERT INTO StudentTrigrams(StudentTrigrams, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO StudentTrigrams(rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+    rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    conn.execute("INSERT INTO StudentSearch(StudentSearch) VALUES ('rebuild')")
+    conn.execute("INSERT INTO StudentTrigrams(StudentTrigrams) VALUES ('rebuild')")
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def prefix_query(q):
+    """Turn free text into an FTS5 query matching every word as a prefix, or '' if q has no words."""
+    return ' '.join(_quote(word) + '*' for word in re.findall(r'\w+', q))
+
+
+def _trigrams(text, padded=False):
+    # Padding each word (as pg_trgm does) adds start/end grams, which keeps
+    # short names with one wrong letter similar enough to match
+    grams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        if padded:
+            word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def search_students(conn, q, limit=20, fuzzy=True):
+    """Return up to limit (student row, match kind) pairs for q, best first.
+
+    Prefix matches come first, ranked by bm25. If there are fewer than limit
+    of them and fuzzy is set, names sharing enough trigrams with q fill the
+    rest, most similar first.
+    """
+    results = []
+    match = prefix_query(q)
+    if match:
+        rows = conn.execute(f'''
+            SELECT s.* FROM StudentSearch JOIN Students s ON s.id = StudentSearch.rowid
+            WHERE StudentSearch MATCH ? ORDER BY bm25(StudentSearch, {_BM25_WEIGHTS}) LIMIT ?
+        ''', (match, limit)).fetchall()
+        results = [(row, 'prefix') for row in rows]
+    if fuzzy and len(results) < limit:
+        results.extend((row, 'fuzzy') for row in fuzzy_search(conn, q, limit - len(results),
+                                                              exclude={row['id'] for row, _ in results}))
+    return results
+
+
+def fuzzy_search(conn, q, limit=20, exclude=()):
+    """Return up to limit students whose names share most of q's trigrams."""
+    candidate_grams = _trigrams(q)
+    if not candidate_grams:
+        return []
+    query_grams = _trigrams(q, padded=True)
+    # bm25 over OR-ed trigrams favours names containing more of them; take a
+    # generous candidate set and re-score it exactly below
+    rows = conn.execute('''
+        SELECT s.* FROM StudentTrigrams JOIN Students s ON s.id = StudentTrigrams.rowid
+        WHERE StudentTrigrams MATCH ? ORDER BY bm25(StudentTrigrams) LIMIT ?
+    ''', (' OR '.join(_quote(g) for g in sorted(candidate_grams)), (limit + len(exclude)) * 5)).fetchall()
+    scored = []
+    for row in rows:
+        if row['id'] in exclude:
+            continue
+        similarity = len(query_grams & _trigrams(row['name'] or '', padded=True)) / len(query_grams)
+        if similarity >= FUZZY_MIN_SIMILARITY:
+            scored.append((-similarity, row['id'], row))
+    scored.sort(key=lambda item: item[:2])
+    return [row for _, _, row in scored[:limit]]
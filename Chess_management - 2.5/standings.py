@@ -0,0 +1,135 @@
+# Materialized leaderboard standings.
+#
+# Standings holds one row per (period, student_id). The 'current' period
+# aggregates completed games still in Matches; each 'YYYY-MM' period
+# aggregates archived games in MatchHistory for that month (and stays when the
+# month is compacted into cold storage, see history.py). Rows are updated
+# in the same transaction as the result or archive that changes them, so a
+# leaderboard is a single indexed read.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+CURRENT_PERIOD = 'current'
+
+# Per-participant game rows. A win scores 3, a draw (no winner) 0.5 each.
+_GAMES_SQL = '''
+    SELECT {period} AS period, student1_id AS student_id, winner_id FROM {table}
+    WHERE points_assigned = 1 AND student1_id IS NOT NULL
+    UNION ALL
+    SELECT {period} AS period, student2_id AS student_id, winner_id FROM {table}
+    WHERE points_assigned = 1 AND student2_id IS NOT NULL AND student2_id IS NOT student1_id
+'''
+
+_UPSERT_SQL = '''
+    INSERT INTO Standings (period, student_id, points, wins, draws, losses, games)
+    SELECT period, student_id,
+           {sign} * SUM(CASE WHEN winner_id = student_id THEN 3 WHEN winner_id IS NULL THEN 0.5 ELSE 0 END),
+           {sign} * SUM(CASE WHEN winner_id = student_id THEN 1 ELSE 0 END),
+           {sign} * SUM(CASE WHEN winner_id IS NULL THEN 1 ELSE 0 END),
+           {sign} * SUM(CASE WHEN winner_id != student_id THEN 1 ELSE 0 END),
+           {sign} * COUNT(*)
+    FROM ({games}) WHERE period IS NOT NULL
+    GROUP BY period, student_id
+    ON CONFLICT(period, student_id) DO UPDATE SET
+        points = points + excluded.points,
+        wins = wins + excluded.wins,
+        draws = draws + excluded.draws,
+        losses = losses + excluded.losses,
+        games = games + excluded.games
+'''
+
+_MONTH = "strftime('%Y-%m', match_date)"
+
+
+def create_standings_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Standings (
+        period TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        points REAL NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        draws INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        games INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, student_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_standings_rank ON Standings(period, points DESC, student_id)')
+
+
+def rebuild_standings(conn):
+    """Recompute every period from Matches and MatchHistory; months in cold storage are kept as they are."""
+    conn.execute('DELETE FROM Standings WHERE period NOT IN (SELECT month_key FROM ColdMonths)')
+    conn.execute(_UPSERT_SQL.format(games=_GAMES_SQL.format(period=f"'{CURRENT_PERIOD}'", table='Matches'), sign=1))
+    conn.execute(_UPSERT_SQL.format(games=_GAMES_SQL.format(period='month_key', table='MatchHistory'), sign=1))
+
+
+def record_result(conn, student1_id, student2_id, winner_id, sign=1, period=CURRENT_PERIOD):
+    """Add (sign=1) or remove (sign=-1) one game's result for both players."""
+    players = [student1_id] if student1_id == student2_id else [student1_id, student2_id]
+    for student_id in players:
+        if student_id is None:
+            continue
+        win = int(winner_id == student_id)
+        draw = int(winner_id is None)
+        conn.execute('''
+            INSERT INTO Standings (period, student_id, points, wins, draws, losses, games)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(period, student_id) DO UPDATE SET
+                points = points + excluded.points,
+                wins = wins + excluded.wins,
+                draws = draws + excluded.draws,
+                losses = losses + excluded.losses,
+                games = games + excluded.games
+        ''', (period, student_id, sign * (3 * win + 0.5 * draw), sign * win, sign * draw,
+              sign * (1 - win - draw), sign))
+    conn.execute('DELETE FROM Standings WHERE period = ? AND student_id IN (?, ?) AND games <= 0',
+                 (period, student1_id, student2_id))
+
+
+def record_results(conn, games, sign=1):
+    """record_result for many games of the current period in one statement.
+
+    games is a table or parenthesised subquery with student1_id, student2_id,
+    winner_id and points_assigned columns; only rows with points_assigned = 1 count.
+    """
+    conn.execute(_UPSERT_SQL.format(games=_GAMES_SQL.format(period=f"'{CURRENT_PERIOD}'", table=games), sign=sign))
+    if sign < 0:
+        conn.execute('DELETE FROM Standings WHERE period = ? AND games <= 0', (CURRENT_PERIOD,))
+
+
+def archive_completed(conn):
+    """Move completed Matches results from the current period into their months.
+
+    Call before the completed rows are copied to MatchHistory and deleted.
+    """
+    conn.execute(_UPSERT_SQL.format(games=_GAMES_SQL.format(period=_MONTH, table='Matches'), sign=1))
+    conn.execute('DELETE FROM Standings WHERE period = ?', (CURRENT_PERIOD,))
+
+
+def fetch_leaderboard(conn, period=CURRENT_PERIOD, class_filter=''):
+    """Return leaderboard rows for period, best first.
+
+    Equal points are split by the tie-breaks in tiebreaks.TIEBREAK_COLUMNS order.
+    """
+    # Points stay an integer unless a draw contributed, as SUM() returned before
+    query = '''
+        SELECT s.student_id, s.name, s.class, s.roll, s.mobile, s.year, s.matches_played,
+               CASE WHEN st.draws = 0 THEN CAST(st.points AS INTEGER) ELSE st.points END AS points,
+               st.wins, st.draws, st.losses, st.games, r.elo, r.glicko, r.rd,
+               IFNULL(tb.buchholz, 0) AS buchholz, IFNULL(tb.median_buchholz, 0) AS median_buchholz,
+               IFNULL(tb.sonneborn_berger, 0) AS sonneborn_berger, IFNULL(tb.progressive, 0) AS progressive,
+               IFNULL(tb.direct_encounter, 0) AS direct_encounter
+        FROM Standings st
+        JOIN Students s ON s.student_id = st.student_id
+        LEFT JOIN Ratings r ON r.student_id = st.student_id
+        LEFT JOIN TieBreaks tb ON tb.period = st.period AND tb.student_id = st.student_id
+        WHERE st.period = ?
+    '''
+    params = [period]
+    if class_filter:
+        query += ' AND s.class = ?'
+        params.append(class_filter)
+    query += ''' ORDER BY st.points DESC, buchholz DESC, median_buchholz DESC, sonneborn_berger DESC,
+                          progressive DESC, direct_encounter DESC, st.student_id'''
+    return conn.execute(query, params).fetchall()
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live flat next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import migrate_database  # noqa: E402
+
+
+def add_students(conn, count, class_='7'):
+    """Insert students 00001 .. count (Player 1, ...) and commit."""
+    conn.executemany('INSERT INTO Students (student_id, name, class, paid_entry) VALUES (?, ?, ?, 1)',
+                     [(f'{i:05d}', f'Player {i}', class_) for i in range(1, count + 1)])
+    conn.commit()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated, empty batch database file."""
+    path = str(tmp_path / 'batch_test_database.db')
+    migrate_database(path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    """A connection to db_path with eight students."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    add_students(conn, 8)
+    yield conn
+    conn.close()
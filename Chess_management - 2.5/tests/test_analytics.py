@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+import analytics
+import catalog
+import standings
+from conftest import add_students
+from database import migrate_database
+
+
+@pytest.fixture
+def batches(tmp_path):
+    return catalog.Catalog(str(tmp_path / 'catalog.db'))
+
+
+def _batch(tmp_path, batches, name, created_at, games, students=4):
+    """A registered batch with students 00001.. and the completed games (white, black, winner)."""
+    path = str(tmp_path / f'batch_{name}_database.db')
+    migrate_database(path)
+    conn = sqlite3.connect(path)
+    add_students(conn, students)
+    conn.execute("UPDATE Students SET name = ? WHERE student_id = '00001'", (f'Ann ({name})',))
+    _play(conn, games)
+    conn.close()
+    batches.register(name, name, path, created_at=created_at)
+    return path
+
+
+def _play(conn, games):
+    conn.executemany('INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned) VALUES (?, ?, ?, 1)',
+                     games)
+    for game in games:
+        standings.record_result(conn, *game)
+    conn.commit()
+
+
+def _refresh(batches, path):
+    conn = sqlite3.connect(path)
+    batches.refresh(path, conn)
+    conn.close()
+
+
+@pytest.fixture
+def three_batches(tmp_path, batches):
+    paths = [
+        _batch(tmp_path, batches, 'Spring', 1, [('00001', '00002', '00001'), ('00003', '00004', None)]),
+        _batch(tmp_path, batches, 'Summer', 2, [('00001', '00003', None), ('00002', '00004', '00004')]),
+        _batch(tmp_path, batches, 'Autumn', 3, [('00002', '00001', '00002')], students=2),
+    ]
+    for path in paths:
+        _refresh(batches, path)
+    return paths
+
+
+def test_leaderboard_adds_up_every_batch(batches, three_batches):
+    leaders = analytics.Analytics(batches, workers=1).leaderboard()
+    ann = next(p for p in leaders if p['student_id'] == '00001')
+    assert (ann['points'], ann['wins'], ann['draws'], ann['losses'], ann['games']) == (3.5, 1, 1, 1, 3)
+    assert (ann['batches'], ann['batches_played']) == (3, 3)
+    # Named as in the newest batch
+    assert (ann['name'], ann['first_batch'], ann['last_batch']) == ('Ann (Autumn)', 'Spring', 'Autumn')
+    assert [p['student_id'] for p in leaders] == ['00001', '00004', '00002', '00003']
+
+
+def test_groups_of_attached_batches_give_the_same_results(monkeypatch, batches, three_batches):
+    cross_batch = analytics.Analytics(batches, workers=1)
+    expected = cross_batch._leaderboard(batches.batches(), None), cross_batch._player(batches.batches(), '00001')
+    groups = []
+
+    def group_standings(db_paths):
+        groups.append(db_paths)
+        return analytics._group_standings(db_paths)
+
+    monkeypatch.setattr(analytics, 'ATTACH_LIMIT', 2)
+    partials = cross_batch._map(group_standings, batches.batches())
+    assert [len(group) for group in groups] == [2, 1]
+    assert sorted(db_path for db_path, _ in partials) == sorted(three_batches)
+    assert (cross_batch._leaderboard(batches.batches(), None),
+            cross_batch._player(batches.batches(), '00001')) == expected
+
+
+def test_player_career_and_head_to_head(batches, three_batches):
+    career = analytics.Analytics(batches, workers=1).player('00001')
+    assert [season['batch_name'] for season in career['seasons']] == ['Spring', 'Summer', 'Autumn']
+    assert career['totals'] == {'points': 3.5, 'wins': 1, 'draws': 1, 'losses': 1, 'games': 3}
+    assert [(r['opponent_id'], r['wins'], r['draws'], r['losses'], r['games']) for r in career['head_to_head']] == [
+        ('00002', 1, 0, 1, 2), ('00003', 0, 1, 0, 1)]
+    assert analytics.Analytics(batches, workers=1).player('99999')['seasons'] == []
+
+
+def test_results_are_cached_until_a_batch_changes(batches, three_batches):
+    cross_batch = analytics.Analytics(batches, workers=1)
+    before = cross_batch.leaderboard()
+    conn = sqlite3.connect(three_batches[0])
+    _play(conn, [('00003', '00001', '00003')])
+    # The catalog has not seen the change yet: still the cached result
+    assert cross_batch.leaderboard() == before
+    batches.refresh(three_batches[0], conn)
+    conn.close()
+    after = cross_batch.leaderboard()
+    assert next(p for p in after if p['student_id'] == '00003')['points'] == \
+        next(p for p in before if p['student_id'] == '00003')['points'] + 3
+    cache = sqlite3.connect(batches.catalog_db)
+    assert cache.execute('SELECT COUNT(*) FROM AnalyticsCache').fetchone()[0] == 2
+    cache.close()
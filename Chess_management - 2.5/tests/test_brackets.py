@@ -0,0 +1,88 @@
+from itertools import combinations
+
+import pytest
+
+import brackets
+import results
+
+
+@pytest.mark.parametrize('count', [2, 5, 8])
+def test_round_robin_pairs_everyone_once(count):
+    players = [f'p{i}' for i in range(count)]
+    rounds = brackets.berger_rounds(players)
+    games = [game for games in rounds for game in games]
+    assert sorted(tuple(sorted(game)) for game in games) == list(combinations(players, 2))
+    for games in rounds:
+        seated = [player for game in games for player in game]
+        assert len(seated) == len(set(seated))
+
+
+def test_double_round_robin_reverses_colours():
+    games = brackets.round_robin(['a', 'b', 'c', 'd'], double=True)
+    first, second = games[:6], games[6:]
+    assert second == [(black, white) for white, black in first]
+
+
+def test_seed_positions_keep_top_seeds_apart():
+    assert brackets.seed_positions(8) == [1, 8, 4, 5, 2, 7, 3, 6]
+
+
+def test_knockout_byes_go_to_top_seeds():
+    nodes = brackets.build_knockout(['s1', 's2', 's3', 's4', 's5', 's6'])
+    first_round = [(node['player1_id'], node['player2_id']) for node in nodes if node['round'] == 1]
+    assert first_round == [('s1', None), ('s4', 's5'), ('s2', None), ('s3', 's6')]
+
+
+def _pending(conn):
+    return conn.execute('SELECT match_id, student1_id, student2_id FROM Matches WHERE points_assigned = 0 '
+                        'ORDER BY match_id').fetchall()
+
+
+def test_single_elimination_plays_through_to_a_champion(conn):
+    created = brackets.create_event(conn, brackets.SINGLE_ELIMINATION, brackets.load_seeds(conn, limit=6))
+    conn.commit()
+    # Seeds 1 and 2 have byes
+    assert created.matches == 2
+    rounds = 0
+    while _pending(conn):
+        rounds += 1
+        # The lower student ID (the better seed here) always wins
+        assert results.apply_results(conn, [(board, match_id, min(s1, s2))
+                                             for board, (match_id, s1, s2) in enumerate(_pending(conn), 1)]).ok
+    assert rounds == 3
+    champion = conn.execute('SELECT champion_id FROM Brackets WHERE bracket_id = ?', (created.bracket_id,))
+    assert champion.fetchone()[0] == '00001'
+
+
+def test_knockout_draw_is_replayed_with_colours_reversed(conn):
+    created = brackets.create_event(conn, brackets.SINGLE_ELIMINATION, ['00001', '00002'])
+    conn.commit()
+    (match_id, white, black), = _pending(conn)
+    report = results.apply_results(conn, [(1, match_id, 'draw')])
+    assert report.ok and report.started == 1
+    (replay, replay_white, replay_black), = _pending(conn)
+    assert replay != match_id and (replay_white, replay_black) == (black, white)
+    assert results.apply_results(conn, [(1, match_id, '1-0')]).errors[0][2] == \
+        'knockout result already decided the next round'
+    assert results.apply_results(conn, [(1, replay, '1-0')]).ok
+    assert conn.execute('SELECT champion_id FROM Brackets WHERE bracket_id = ?',
+                        (created.bracket_id,)).fetchone()[0] == replay_white
+
+
+def test_double_elimination_loser_drops_to_the_losers_bracket(conn):
+    created = brackets.create_event(conn, brackets.DOUBLE_ELIMINATION, brackets.load_seeds(conn, limit=4))
+    conn.commit()
+    first_round = _pending(conn)
+    assert results.apply_results(conn, [(board, match_id, min(s1, s2))
+                                        for board, (match_id, s1, s2) in enumerate(first_round, 1)]).ok
+    losers = conn.execute("SELECT player1_id, player2_id FROM BracketNodes WHERE bracket_id = ? "
+                          "AND section = ? AND round = 1", (created.bracket_id, brackets.LOSERS)).fetchone()
+    assert sorted(losers) == sorted(max(s1, s2) for _, s1, s2 in first_round)
+
+
+def test_create_event_checks_the_player_count(conn):
+    with pytest.raises(ValueError, match='between 2 and'):
+        brackets.create_event(conn, brackets.SINGLE_ELIMINATION, ['00001'])
+    with pytest.raises(ValueError, match='Unknown format'):
+        brackets.create_event(conn, 'swiss', ['00001', '00002'])
+    assert conn.execute('SELECT COUNT(*) FROM Matches').fetchone()[0] == 0
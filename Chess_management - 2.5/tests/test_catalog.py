@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+import pytest
+
+import catalog
+from conftest import add_students
+from database import migrate_database
+from db_pool import ConnectionPool
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def batches(tmp_path):
+    return catalog.Catalog(str(tmp_path / 'catalog.db'))
+
+
+def _batch_file(tmp_path, safe_name, students=0):
+    path = str(tmp_path / f'batch_{safe_name}_database.db')
+    migrate_database(path)
+    conn = sqlite3.connect(path)
+    add_students(conn, students)
+    conn.close()
+    return path
+
+
+def _counts(batches, name):
+    row = batches.get(name)
+    return row['players'], row['matches']
+
+
+def test_register_keeps_the_name_and_rejects_clashes(batches):
+    batches.register('Spring 2025', 'Spring_2025', 'DB/batch_Spring_2025_database.db')
+    # Created again under the same name: nothing to do
+    batches.register('Spring 2025', 'Spring_2025', 'DB/batch_Spring_2025_database.db')
+    with pytest.raises(catalog.NameTaken, match='Spring 2025'):
+        batches.register('Spring/2025', 'Spring_2025', 'DB/batch_Spring_2025_database.db')
+    assert [row['batch_name'] for row in batches.batches()] == ['Spring 2025']
+
+
+def test_sync_registers_recounts_and_forgets_files(tmp_path, batches):
+    spring = _batch_file(tmp_path, 'Spring_2025', students=3)
+    autumn = _batch_file(tmp_path, 'Autumn_2025', students=2)
+    assert batches.sync([spring, autumn]) == 2
+    assert _counts(batches, 'Spring_2025') == (3, 0)
+    # The full name, once the batch is created again, replaces the sanitized one
+    batches.register('Spring 2025', 'Spring_2025', spring)
+    assert batches.get('Spring 2025') is not None
+
+    # Changed outside the app (a CLI command)
+    conn = sqlite3.connect(autumn)
+    conn.execute("INSERT INTO Matches (student1_id, student2_id, points_assigned) VALUES ('00001', '00002', 0)")
+    conn.commit()
+    conn.close()
+    assert batches.sync([spring, autumn]) == 1
+    assert _counts(batches, 'Autumn_2025') == (2, 1)
+
+    os.remove(autumn)
+    assert batches.sync([spring]) == 1
+    assert batches.get('Autumn_2025') is None
+
+
+def test_sync_does_not_open_unmodified_files(tmp_path, batches):
+    path = _batch_file(tmp_path, 'Spring_2025', students=3)
+    batches.sync([path])
+    mtime = os.path.getmtime(path)
+    # Not a database any more, but not modified as far as sync() can tell
+    with open(path, 'wb') as f:
+        f.write(b'x' * 4096)
+    os.utime(path, (mtime, mtime))
+    assert batches.sync([path]) == 0
+
+
+def test_writer_refreshes_the_catalog_after_each_commit(tmp_path, batches):
+    path = _batch_file(tmp_path, 'Spring_2025', students=3)
+    batches.register('Spring 2025', 'Spring_2025', path)
+    pool = ConnectionPool()
+    writer = WriteQueue(pool, on_commit=batches.refresh)
+    try:
+        writer.run(path, lambda conn: conn.execute(
+            "INSERT INTO Students (student_id, name, class, paid_entry) VALUES ('00004', 'New', '7', 1)"))
+        assert _counts(batches, 'Spring 2025') == (4, 0)
+        # Seen by the writer already, so a restart's sync leaves it alone
+        pool.close_all()
+        assert batches.sync([path]) == 0
+    finally:
+        pool.close_all()
@@ -0,0 +1,47 @@
+import io
+
+from csv_import import import_students
+
+HEADER = 'ID,Name,Class,Roll,Mobile,Year\r\n'
+
+
+def _import(conn, body, **kwargs):
+    return import_students(conn, io.BytesIO((HEADER + body).encode('utf-8-sig')), **kwargs)
+
+
+def test_imports_and_updates_students(conn):
+    report = _import(conn, '00001,Renamed,8,1,,2025\r\n,Walk In,7,2,+44 7700 900123,2025\r\n')
+    assert (report.rows, report.written, report.skipped, report.fatal) == (2, 2, 0, None)
+    assert tuple(conn.execute("SELECT name, class FROM Students WHERE student_id = '00001'").fetchone()) == \
+        ('Renamed', '8')
+    assert conn.execute("SELECT mobile FROM Students WHERE student_id = '00009'").fetchone()[0] == '+447700900123'
+
+
+def test_bad_rows_are_skipped_and_reported(conn):
+    report = _import(conn, '00010,,7,1,,2025\r\n00011,Ok,7,1,12ab,2025\r\n00012,Ok,7,1,,2025\r\n'
+                           '00012,Again,7,1,,2025\r\n')
+    assert (report.written, report.skipped) == (1, 3)
+    assert [(line, message) for line, _, message in report.errors] == [
+        (2, 'missing Name'), (3, "invalid mobile number '12ab'"), (5, 'duplicate ID')]
+
+
+def test_only_cr_and_lf_end_rows(conn):
+    # str.splitlines() also breaks at \x0c, \x1e, \x85 and \u2028, which are ordinary characters in CSV
+    name = 'Form\x0cfeed\x1erecord\x85next\u2028line'
+    report = _import(conn, f'00010,{name},7,1,,2025\r\n00011,"Two\r\nlines",7,1,,2025\r\n')
+    assert (report.rows, report.written, report.skipped, report.fatal) == (2, 2, 0, None)
+    assert conn.execute("SELECT name FROM Students WHERE student_id = '00010'").fetchone()[0] == name
+    assert conn.execute("SELECT name FROM Students WHERE student_id = '00011'").fetchone()[0] == 'Two\r\nlines'
+
+
+def test_dry_run_writes_nothing_and_leaves_the_stream_open(conn):
+    stream = io.BytesIO((HEADER + '00010,New,7,1,,2025\r\n').encode())
+    report = import_students(conn, stream, dry_run=True)
+    assert report.written == 1 and not stream.closed
+    assert conn.execute("SELECT COUNT(*) FROM Students WHERE student_id = '00010'").fetchone()[0] == 0
+
+
+def test_missing_headers_are_fatal(conn):
+    report = import_students(conn, io.BytesIO(b'ID,Name\r\n1,A\r\n'))
+    assert report.fatal.startswith('CSV is missing headers: Class, Roll, Mobile, Year')
+    assert import_students(conn, io.BytesIO(b'')).fatal == 'The uploaded CSV file is empty.'
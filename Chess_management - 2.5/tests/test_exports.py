@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+import exports
+
+
+@pytest.fixture
+def export_conn(db_path, conn):
+    # stream_export closes the connection it is given
+    return sqlite3.connect(db_path)
+
+
+def _closed(conn):
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    return True
+
+
+def test_csv_header_comes_first_then_rows_in_batches(monkeypatch, export_conn):
+    monkeypatch.setattr(exports, 'FETCH_SIZE', 3)
+    chunks = exports.stream_export(export_conn, exports.STUDENTS, 'csv')
+    assert next(chunks) == b'ID,Name,Class,Roll,Mobile,Year,Paid Entry\r\n'
+    rest = list(chunks)
+    # Eight students, three rows per chunk
+    assert len(rest) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(rest).decode())))
+    assert rows[0] == ['00001', 'Player 1', '7', '', '', '', 'Yes'] and len(rows) == 8
+    assert _closed(export_conn)
+
+
+def test_ndjson_has_one_object_per_line(conn, export_conn):
+    conn.execute("INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned, match_date) "
+                 "VALUES ('00001', '00002', '00002', 1, '2025-01-01')")
+    conn.commit()
+    lines = b''.join(exports.stream_export(export_conn, exports.MATCHES, 'ndjson')).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{
+        'match_id': 1, 'student1_id': '00001', 's1_name': 'Player 1', 'student2_id': '00002',
+        's2_name': 'Player 2', 'winner_id': '00002', 'winner_name': 'Player 2', 'points_assigned': 1,
+        'match_date': '2025-01-01'}]
+
+
+def test_abandoned_export_closes_the_connection(export_conn):
+    chunks = exports.stream_export(export_conn, exports.MATCH_HISTORY, 'csv')
+    next(chunks)
+    # A client that disconnects: the response closes the generator
+    chunks.close()
+    assert _closed(export_conn)
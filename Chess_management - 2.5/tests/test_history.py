@@ -0,0 +1,90 @@
+import os
+import sqlite3
+
+import pytest
+
+import history
+import tiebreaks
+
+
+def _archive(conn, month, games):
+    conn.executemany('''
+        INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date)
+        VALUES (?, ?, ?, 1, ?)
+    ''', [('00001', '00002', '00001', f'{month}-{day:02d}') for day in range(1, games + 1)])
+    conn.commit()
+
+
+def _cold_files(conn):
+    return sorted(os.listdir(history.cold_dir(conn)))
+
+
+def _history_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM MatchHistory').fetchone()[0]
+
+
+def test_compact_moves_old_months_to_cold_storage(conn):
+    _archive(conn, '2020-01', 3)
+    _archive(conn, '2020-02', 2)
+    _archive(conn, '2021-01', 4)
+    assert history.compact(conn, '2021-01') == {'2020-01': 3, '2020-02': 2}
+    assert history.cold_months(conn) == ['2020-01', '2020-02']
+    assert len(_cold_files(conn)) == 2
+    assert _history_count(conn) == 4
+    assert len(history.month_games(conn, '2020-01')) == 3
+    assert len(list(history.cold_games(conn))) == 5
+
+
+def test_failed_compaction_leaves_rows_and_files_as_they_were(conn):
+    _archive(conn, '2020-01', 3)
+    history.compact(conn, '2020-02')
+    files = _cold_files(conn)
+    _archive(conn, '2020-01', 2)
+    _archive(conn, '2020-02', 2)
+    conn.execute('''
+        CREATE TEMP TRIGGER fail_delete BEFORE DELETE ON MatchHistory WHEN old.month_key = '2020-02' BEGIN
+            SELECT RAISE(ABORT, 'disk full');
+        END
+    ''')
+    with pytest.raises(sqlite3.IntegrityError):
+        history.compact(conn, '2021-01')
+    assert _cold_files(conn) == files
+    assert _history_count(conn) == 4
+    assert len(list(history.cold_games(conn, '2020-01', '2020-01'))) == 3
+
+    # Running it again moves every game exactly once
+    conn.execute('DROP TRIGGER temp.fail_delete')
+    assert history.compact(conn, '2021-01') == {'2020-01': 5, '2020-02': 2}
+    assert _history_count(conn) == 0
+    assert len(_cold_files(conn)) == 2
+    assert sorted(g['match_id'] for g in history.cold_games(conn)) == list(range(1, 8))
+
+
+def test_month_range_needs_a_start(conn):
+    with pytest.raises(ValueError):
+        history.fetch_leaderboard(conn, '', '2020-03')
+    with pytest.raises(ValueError):
+        history.fetch_leaderboard(conn, '2020-03', '2020-01')
+    assert history.fetch_leaderboard(conn, '2020-01', '2020-03') == []
+
+
+def test_month_archived_into_after_compaction_keeps_its_cold_games(conn):
+    _archive(conn, '2020-01', 2)
+    history.compact(conn, '2020-02')
+    conn.executemany('''
+        INSERT INTO MatchHistory (student1_id, student2_id, winner_id, points_assigned, match_date)
+        VALUES (?, ?, ?, 1, '2020-01-20')
+    ''', [('00003', '00001', '00003'), ('00002', '00003', None)])
+    conn.commit()
+    games = history.month_games(conn, '2020-01')
+    assert [g['match_id'] for g in games] == [1, 2, 3, 4]
+
+    tiebreaks.rebuild_tiebreaks(conn)
+    stored = {row[0]: tuple(row[1:]) for row in conn.execute(f'''
+        SELECT student_id, {', '.join(tiebreaks.TIEBREAK_COLUMNS)} FROM TieBreaks WHERE period = '2020-01'
+    ''')}
+    assert stored == tiebreaks.compute([(g['student1_id'], g['student2_id'], g['winner_id']) for g in games])
+    assert stored['00002'] != tiebreaks.compute([('00003', '00001', '00003'), ('00002', '00003', None)])['00002']
+    leaders = history.fetch_leaderboard(conn, '2020-01', '2020-01')
+    assert {l['student_id']: l['buchholz'] for l in leaders}.items() <= \
+        {sid: values[0] for sid, values in stored.items()}.items()
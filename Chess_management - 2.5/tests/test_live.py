@@ -0,0 +1,72 @@
+import json
+import queue
+import sqlite3
+
+import pytest
+
+import live
+import results
+
+
+@pytest.fixture
+def feed(db_path, conn):
+    feed = live.Feed(db_path)
+    viewer = queue.Queue(live.SUBSCRIBER_BACKLOG)
+    feed._subscribers.add(viewer)
+    reader = sqlite3.connect(db_path)
+    reader.row_factory = sqlite3.Row
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                     "VALUES (?, ?, 0, '2025-01-01')", [('00001', '00002'), ('00003', '00004')])
+    conn.commit()
+    feed._update(reader)
+    yield feed, viewer, reader
+    reader.close()
+
+
+def _events(viewer):
+    events = []
+    while not viewer.empty():
+        lines = dict(line.split(': ', 1) for line in viewer.get_nowait().strip().split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_first_poll_sends_a_snapshot(feed):
+    _, viewer, _ = feed
+    (name, data), = _events(viewer)
+    assert name == 'snapshot' and [board['match_id'] for board in data['boards']] == [1, 2]
+    assert data['standings'] == []
+
+
+def test_a_result_sends_only_what_changed(feed, conn):
+    feed, viewer, reader = feed
+    _events(viewer)
+    assert results.apply_results(conn, [(1, 1, '1-0')]).ok
+    feed._update(reader)
+    events = dict(_events(viewer))
+    assert [board['match_id'] for board in events['boards']['changed']] == [1]
+    assert sorted(row['student_id'] for row in events['standings']['changed']) == ['00001', '00002']
+    # Nothing committed since: nothing sent
+    feed._update(reader)
+    assert _events(viewer) == []
+
+
+def test_viewer_too_far_behind_is_dropped(feed):
+    feed, _, _ = feed
+    slow = queue.Queue(2)
+    feed._subscribers.add(slow)
+    with feed._lock:
+        for n in range(3):
+            feed._broadcast(f'event {n}')
+    assert slow not in feed._subscribers
+    # Its stream ends, so the browser reconnects to a fresh snapshot
+    assert slow.get_nowait() is None and slow.empty()
+
+
+def test_stream_starts_with_the_reconnect_delay_then_a_snapshot(monkeypatch, db_path, conn):
+    monkeypatch.setattr(live, 'POLL_SECONDS', 0.01)
+    messages = live.stream(db_path)
+    assert next(messages) == f'retry: {live.RECONNECT_MS}\n\n'
+    assert next(messages).startswith('id: ') and live.get_feed(db_path)._thread is not None
+    messages.close()
+    assert not live.get_feed(db_path)._subscribers
@@ -0,0 +1,84 @@
+import random
+import sqlite3
+import threading
+
+import loadtest
+import metrics
+
+
+class _Client:
+    """Stands in for loadtest.Client: answers /metrics from a Registry and remembers every request."""
+
+    def __init__(self, registry=None, boards=([], []), stop_after=None):
+        self.registry = registry
+        self._boards = boards
+        self.stop = threading.Event()
+        self.stop_after = stop_after
+        self.requests = []
+
+    def request(self, route, path=None, method='GET', form=None, body=None, record=True):
+        self.requests.append((method, path or route, form))
+        if self.stop_after and len(self.requests) >= self.stop_after:
+            self.stop.set()
+        if route == '/metrics':
+            return 200, self.registry.render().encode()
+        return 200, b''
+
+    def boards(self):
+        pending, finished = self._boards
+        # Everything pending is scored by the next fetch
+        self._boards = [], finished + pending
+        return [dict(m) for m in pending], [dict(m) for m in finished]
+
+
+def test_percentiles_and_route_summary():
+    ordered = [i / 1000 for i in range(1, 101)]
+    assert [loadtest.percentile(ordered, p) for p in (50, 95, 99, 100)] == [0.05, 0.095, 0.099, 0.1]
+    assert loadtest.percentile([0.2], 99) == 0.2
+    recorder = loadtest.Recorder()
+    for i, status in enumerate([200] * 7 + [302, 500, 0]):
+        recorder.record('/leaderboard', (i + 1) / 100, status)
+    stats = recorder.summary(elapsed=2.0)['/leaderboard']
+    assert (stats['requests'], stats['errors'], stats['per_second']) == (10, 2, 5.0)
+    assert stats['statuses'] == {'0': 1, '200': 7, '302': 1, '500': 1}
+    assert round(stats['p50_ms']) == 50 and round(stats['max_ms']) == 100
+
+
+def test_scrape_reads_lock_errors_from_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, 'FLUSH_SECONDS', -0.5)
+    registry = metrics.Registry()
+    busy = sqlite3.OperationalError('database is locked')
+    busy.sqlite_errorcode = sqlite3.SQLITE_BUSY
+    for seconds in (1.0, 2.5):
+        registry.observe_statement("UPDATE Matches SET winner_id = '00001' WHERE match_id = 7", seconds, error=busy)
+    registry.observe_statement('SELECT * FROM Students', 0.001)
+    client = _Client(registry)
+    locks = loadtest.scrape('http://test', 2, client)
+    assert locks == {metrics.fingerprint('UPDATE Matches SET winner_id = ? WHERE match_id = ?'): [2, 3.5]}
+    # A burst of requests to reach every worker first
+    assert len(client.requests) == 2 * 4 + 1
+
+
+def test_arbiter_scores_pending_boards_before_correcting_finished_ones():
+    pending = [{'match_id': 1, 'student1_id': '00001', 'student2_id': '00002'}]
+    finished = [{'match_id': 2, 'student1_id': '00003', 'student2_id': '00004'}]
+    client = _Client(boards=(pending, finished), stop_after=4)
+    loadtest.arbiter(client, random.Random(1), 0, client.stop)
+    posts = [(path, form['winner']) for method, path, form in client.requests if method == 'POST']
+    assert posts[0][0] == '/matches/update/1' and posts[0][1] in ('00001', '00002', 'draw')
+    # Correcting finished boards once none are pending
+    assert posts[1][0] in ('/matches/update/1', '/matches/update/2')
+    assert len(client.requests) == 4 and client.requests[2][1] == posts[1][0]
+
+
+def test_report_shows_the_baseline_next_to_the_results():
+    route = {'requests': 10, 'errors': 1, 'per_second': 5.0, 'p50_ms': 10.0, 'p95_ms': 40.0, 'p99_ms': 80.0}
+    results = {'routes': {'/live': route}, 'requests': 10, 'duration': 2.0, 'per_second': 5.0, 'errors': 1,
+               'lock_errors': {'UPDATE Matches 1234abcd': {'errors': 3, 'seconds': 1.5, 'sql': 'UPDATE Matches'}}}
+    baseline = dict(results, per_second=4.0, routes={'/live': dict(route, p95_ms=60.0)}, lock_errors={})
+    lines = []
+    loadtest.print_report(results, baseline, echo=lines.append)
+    assert lines[0].endswith('p95 before') and lines[1].split()[-1] == '60.0'
+    assert '(before: 4.0 req/s, 1 errors)' in lines[2]
+    assert lines[3] == 'SQLite busy/locked errors: 3, 1.50s spent before failing (before: 0)'
+    assert lines[4].split() == ['3', '1.50s', 'UPDATE', 'Matches', '1234abcd', 'UPDATE', 'Matches']
@@ -0,0 +1,70 @@
+import json
+import os
+import sqlite3
+
+import metrics
+
+
+def _lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_statements_differing_only_in_literals_share_a_series():
+    a = "SELECT * FROM Students WHERE student_id = '00001' AND points > 3"
+    b = "select *\n  from Students where student_id = 'O''Brien' and points > 2.5"
+    assert metrics.normalize_sql(a) == 'SELECT * FROM Students WHERE student_id = ? AND points > ?'
+    assert metrics.normalize_sql('DELETE FROM Matches WHERE match_id IN (?, ?,?)') == \
+        'DELETE FROM Matches WHERE match_id IN (?...)'
+    assert metrics.fingerprint(a).startswith('SELECT Students ')
+    assert metrics.fingerprint(a) != metrics.fingerprint(b)
+    assert metrics.fingerprint(a) == metrics.fingerprint(a.replace('00001', '00002'))
+
+
+def test_registry_records_statements_lock_errors_and_slow_queries():
+    registry = metrics.Registry(slow_query_seconds=0.5)
+    registry.observe_statement("SELECT name FROM Students WHERE student_id = '00001'", 0.002)
+    registry.observe_statement("SELECT name FROM Students WHERE student_id = '00002'", 0.7)
+    busy = sqlite3.OperationalError('database is locked')
+    busy.sqlite_errorcode = sqlite3.SQLITE_BUSY
+    registry.observe_statement('UPDATE Students SET points = 0', 5.0, error=busy)
+    registry.observe_statement('SELECT nope', 0.1, error=sqlite3.OperationalError('no such column'))
+
+    text = registry.render()
+    label = metrics.fingerprint("SELECT name FROM Students WHERE student_id = '00001'")
+    assert f'sqlite_statement_duration_seconds_count{{statement="{label}"}} 2' in text
+    assert f'sqlite_statement_duration_seconds_bucket{{statement="{label}",le="0.0025"}} 1' in text
+    update = metrics.fingerprint('UPDATE Students SET points = 0')
+    assert _lines(text, 'sqlite_lock_error_duration_seconds_count') == [
+        f'sqlite_lock_error_duration_seconds_count{{statement="{update}"}} 1']
+    assert 'sqlite_slow_statements_total 1' in text
+    assert 'nope' not in json.dumps(registry.statements())
+    assert registry.statements()[label] == 'SELECT name FROM Students WHERE student_id = ?'
+
+
+def test_statements_past_the_series_limit_count_as_other(monkeypatch):
+    monkeypatch.setattr(metrics, 'MAX_SERIES', 2)
+    registry = metrics.Registry()
+    for table in ('Students', 'Matches', 'Standings', 'Ratings'):
+        registry.observe_statement(f'SELECT * FROM {table}', 0.001)
+    text = registry.render()
+    assert 'sqlite_statement_duration_seconds_count{statement="other"} 2' in text
+    assert len(_lines(text, 'sqlite_statement_duration_seconds_count')) == 3
+
+
+def test_render_adds_up_the_workers_and_drops_exited_ones(tmp_path):
+    registry = metrics.Registry(str(tmp_path))
+    registry.observe_write_group(3, 0.001, 0.01)
+    other = metrics.Registry()
+    other.observe_write_group(2, 0.002, 0.02)
+    other.observe('http_request_duration_seconds', (('route', 'say "hi"\n'),), 0.01)
+    # A live worker (this process's parent) and one that has exited
+    for pid in (os.getppid(), 2 ** 22 + 1):
+        with open(tmp_path / f'{pid}.json', 'w') as f:
+            json.dump(other.snapshot(), f)
+
+    text = registry.render()
+    assert 'write_mutations_total 5' in text and 'write_groups_total 2' in text
+    assert 'write_lock_wait_seconds_count 2' in text
+    assert 'http_request_duration_seconds_count{route="say \\"hi\\"\\n"} 1' in text
+    assert _lines(text, '# TYPE write_mutations_total') == ['# TYPE write_mutations_total counter']
+    assert sorted(os.listdir(tmp_path)) == sorted([f'{os.getpid()}.json', f'{os.getppid()}.json'])
@@ -0,0 +1,45 @@
+import pytest
+
+from database import STUDENT_SORT_COLUMNS
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+
+def _walk(conn, sort, order, limit):
+    """Every page of Students in (sort, order), as lists of student IDs."""
+    pages, cursor = [], None
+    while True:
+        page = keyset_page(conn, '*', 'Students', 'id', STUDENT_SORT_COLUMNS, sort, order, cursor, limit)
+        pages.append([row['student_id'] for row in page.rows])
+        if page.next_cursor is None:
+            return pages
+        cursor = decode_cursor(page.next_cursor)
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_cover_every_row_once_with_ties(conn, order):
+    # Four points values over eight students: pages must break ties by key
+    conn.execute('UPDATE Students SET points = id % 4')
+    pages = _walk(conn, 'points', order, 3)
+    assert [len(page) for page in pages] == [3, 3, 2]
+    seen = [student_id for page in pages for student_id in page]
+    expected = [row[0] for row in conn.execute(
+        f'SELECT student_id FROM Students ORDER BY points {order}, id {order}')]
+    assert seen == expected
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(['Player 3', 3])) == ['Player 3', 3]
+    assert decode_cursor('') is None
+
+
+@pytest.mark.parametrize('token', [
+    'not base64!',
+    encode_cursor([1]),
+    encode_cursor({'sort': 1, 'key': 2}),
+    encode_cursor([[1], 2]),
+    encode_cursor([None, 2]),
+    encode_cursor([True, 2]),
+])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
@@ -0,0 +1,43 @@
+import pairing
+
+PLAYERS = [(f'{i:05d}', score, 2, 1200.0 + i) for i, score in
+           enumerate((6, 6, 6, 6, 3, 3, 3, 3), 1)]
+
+
+def _paired(result):
+    return [frozenset(pair) for pair in result.pairs]
+
+
+def test_pairs_inside_score_groups():
+    result = pairing.swiss_pairings(PLAYERS)
+    scores = {sid: score for sid, score, _, _ in PLAYERS}
+    assert len(result.pairs) == 4 and not result.byes and result.rematches == 0
+    assert all(scores[white] == scores[black] for white, black in result.pairs)
+    assert sorted(sid for pair in result.pairs for sid in pair) == sorted(scores)
+
+
+def test_avoids_games_already_played():
+    first = pairing.swiss_pairings(PLAYERS)
+    second = pairing.swiss_pairings(PLAYERS, first.pairs)
+    assert not set(_paired(first)) & set(_paired(second))
+    assert second.rematches == 0
+
+
+def test_colours_go_to_whoever_is_owed_them():
+    # 00001 has had black twice and 00002 white twice, against the 3-point players
+    history = [('00005', '00001'), ('00006', '00001'), ('00002', '00007'), ('00002', '00008')]
+    players = PLAYERS[:2] + PLAYERS[4:]
+    result = pairing.swiss_pairings(players, history)
+    assert ('00001', '00002') in result.pairs
+
+
+def test_byes_rotate():
+    players = PLAYERS[:5]
+    result = pairing.swiss_pairings(players, rounds=5)
+    assert sorted(result.byes) == sorted(sid for sid, _, _, _ in players)
+
+
+def test_later_rounds_avoid_earlier_ones():
+    result = pairing.swiss_pairings(PLAYERS, rounds=3)
+    assert len(result.pairs) == 12
+    assert len(set(_paired(result))) == 12 and result.rematches == 0
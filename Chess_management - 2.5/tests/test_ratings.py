@@ -0,0 +1,64 @@
+import pytest
+
+import ratings
+import results
+
+
+def _pair(conn, pairs):
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                     "VALUES (?, ?, 0, '2025-01-01')", pairs)
+    conn.commit()
+
+
+def _ratings(conn):
+    return {row[0]: tuple(row[1:]) for row in conn.execute(
+        'SELECT student_id, elo, glicko, rd, volatility, games FROM Ratings ORDER BY student_id')}
+
+
+def _assert_same_as_rebuild(conn):
+    entered = _ratings(conn)
+    ratings.rebuild_ratings(conn)
+    rebuilt = _ratings(conn)
+    assert entered.keys() == rebuilt.keys()
+    for student_id, values in rebuilt.items():
+        assert entered[student_id] == pytest.approx(values), student_id
+
+
+# Round 1: matches 1-4, round 2: matches 5-8
+ROUND_1 = [('00001', '00002'), ('00003', '00004'), ('00005', '00006'), ('00007', '00008')]
+ROUND_2 = [('00001', '00003'), ('00002', '00004'), ('00005', '00007'), ('00006', '00008')]
+
+
+def test_results_entered_in_order_match_rebuild(conn):
+    _pair(conn, ROUND_1 + ROUND_2)
+    assert results.apply_results(conn, [(1, 1, '1-0'), (2, 2, 'draw'), (3, 3, '0-1'), (4, 4, '1-0')]).ok
+    assert results.apply_results(conn, [(1, 5, '0-1'), (2, 6, '1-0'), (3, 7, 'draw'), (4, 8, '1-0')]).ok
+    _assert_same_as_rebuild(conn)
+
+
+def test_later_round_entered_first_matches_rebuild(conn):
+    _pair(conn, ROUND_1 + ROUND_2)
+    assert results.apply_results(conn, [(1, 5, '1-0'), (2, 6, '0-1')]).ok
+    assert results.apply_results(conn, [(1, 1, '0-1'), (2, 2, '1-0'), (3, 3, 'draw')]).ok
+    assert results.apply_results(conn, [(1, 4, '1-0'), (2, 7, '0-1'), (3, 8, 'draw')]).ok
+    _assert_same_as_rebuild(conn)
+
+
+def test_rescore_matches_rebuild(conn):
+    _pair(conn, ROUND_1 + ROUND_2)
+    assert results.apply_results(conn, [(n, n, '1-0') for n in range(1, 9)]).ok
+    report = results.apply_results(conn, [(1, 2, '0-1')])
+    assert report.ok and report.rescored == 1
+    _assert_same_as_rebuild(conn)
+
+
+def test_record_games_only_rebuilds_for_out_of_order_games(conn):
+    _pair(conn, ROUND_1 + ROUND_2)
+    conn.execute("UPDATE Matches SET winner_id = student1_id, points_assigned = 1 WHERE match_id IN (1, 5)")
+    assert ratings.record_games(conn, [(5, '00001', '00003', '00001')]) is False
+    # Player 1's match 1 comes before the match 5 already rated
+    assert ratings.record_games(conn, [(1, '00001', '00002', '00001')]) is True
+    # Match 4 (players 7 and 8) has no later rated games
+    conn.execute("UPDATE Matches SET winner_id = student1_id, points_assigned = 1 WHERE match_id = 4")
+    assert ratings.record_games(conn, [(4, '00007', '00008', '00007')]) is False
+    _assert_same_as_rebuild(conn)
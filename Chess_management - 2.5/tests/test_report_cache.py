@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import report_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'jobs.db'))
+    conn.row_factory = sqlite3.Row
+    report_cache.create_cache_table(conn)
+    yield conn, str(tmp_path)
+    conn.close()
+
+
+def _store(conn, blob_dir, key, pdf, last_used=None):
+    sha, path = report_cache.store_blob(blob_dir, pdf)
+    report_cache.record(conn, key, 'results', 'Spring', sha, len(pdf))
+    if last_used is not None:
+        conn.execute('UPDATE ReportCache SET last_used = ? WHERE cache_key = ?', (last_used, key))
+        conn.commit()
+    return sha, path
+
+
+def test_recent_hit_is_a_read(cache):
+    conn, blob_dir = cache
+    sha, path = _store(conn, blob_dir, 'k', b'%PDF one')
+    changes = conn.total_changes
+    assert report_cache.lookup(conn, blob_dir, 'k') == ('Spring', sha, path)
+    assert conn.total_changes == changes
+
+
+def test_stale_hit_marks_the_entry_used(cache):
+    conn, blob_dir = cache
+    _store(conn, blob_dir, 'k', b'%PDF one', last_used=1.0)
+    assert report_cache.lookup(conn, blob_dir, 'k') is not None
+    assert conn.execute("SELECT last_used FROM ReportCache WHERE cache_key = 'k'").fetchone()[0] > 1.0
+
+
+def test_missing_blob_drops_the_entry(cache):
+    conn, blob_dir = cache
+    _, path = _store(conn, blob_dir, 'k', b'%PDF one')
+    os.remove(path)
+    assert report_cache.lookup(conn, blob_dir, 'k') is None
+    assert report_cache.lookup(conn, blob_dir, 'missing') is None
+    assert conn.execute('SELECT COUNT(*) FROM ReportCache').fetchone()[0] == 0
+
+
+def test_evict_drops_least_recently_used_first(cache):
+    conn, blob_dir = cache
+    _store(conn, blob_dir, 'old', b'%PDF old report', last_used=1.0)
+    _store(conn, blob_dir, 'new', b'%PDF new report', last_used=2.0)
+    assert report_cache.evict(conn, blob_dir, max_bytes=len(b'%PDF new report')) == 1
+    assert report_cache.lookup(conn, blob_dir, 'old') is None
+    assert report_cache.lookup(conn, blob_dir, 'new') is not None
+
+
+def test_evict_spares_blobs_not_yet_recorded(cache):
+    conn, blob_dir = cache
+    _store(conn, blob_dir, 'old', b'%PDF old report', last_used=1.0)
+    # Another worker's job has written its blob but not yet recorded the entry
+    _, pending = report_cache.store_blob(blob_dir, b'%PDF pending report')
+    assert report_cache.evict(conn, blob_dir, max_bytes=0) == 1
+    assert os.path.exists(pending)
+    stale = time.time() - report_cache.BLOB_GRACE_SECONDS - 1
+    for name in os.listdir(blob_dir):
+        if name.endswith('.pdf'):
+            os.utime(os.path.join(blob_dir, name), (stale, stale))
+    # Once old enough, unreferenced blobs go with the next eviction; the new one is spared again
+    _, fresh = _store(conn, blob_dir, 'new', b'%PDF new report', last_used=2.0)
+    assert report_cache.evict(conn, blob_dir, max_bytes=0) == 1
+    assert [name for name in os.listdir(blob_dir) if name.endswith('.pdf')] == [os.path.basename(fresh)]
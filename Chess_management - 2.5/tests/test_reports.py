@@ -0,0 +1,59 @@
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+import reports
+
+COLUMNS = [20*mm, 40*mm]
+
+
+def _table(rows):
+    return reports.PagedTable(['ID', 'Name'], rows, COLUMNS)
+
+
+def _lines(table, row, column):
+    return [line for line, _ in table.layout.rows[row][column]]
+
+
+def test_long_cells_wrap_and_make_their_row_taller():
+    name = 'Mohammad Abdullah Al Mamun Chowdhury'
+    table = _table([['00001', 'Ann'], ['00002', name], ['00003', 'Bo']])
+    lines = _lines(table, 1, 1)
+    assert len(lines) == 2 and ' '.join(lines) == name
+    assert all(stringWidth(line, *reports.BODY_FONT) <= COLUMNS[1] - 2 * reports.SIDE_PADDING for line in lines)
+    single = reports.TOP_PADDING + reports.BOTTOM_PADDING + reports.LEADING
+    assert table.layout.offsets == [0, single, 2 * single + reports.LEADING, 3 * single + reports.LEADING]
+
+
+def test_cells_past_the_line_limit_end_in_an_ellipsis():
+    table = _table([['00001', 'Word ' * 40], ['x' * 200, '']])
+    lines = _lines(table, 0, 1)
+    assert len(lines) == reports.MAX_CELL_LINES and lines[-1].endswith(reports.ELLIPSIS)
+    # No spaces to wrap at: broken at the column edge instead
+    assert len(_lines(table, 1, 0)) == reports.MAX_CELL_LINES
+    assert _lines(table, 1, 1) == ['']
+
+
+def test_pages_split_on_row_boundaries_and_keep_every_row():
+    rows = [[f'{i:05d}', 'Very long name ' * (i % 4 + 1)] for i in range(500)]
+    table = _table(rows)
+    pages = []
+    while True:
+        table.wrap(0, 500)
+        parts = table.split(0, 500)
+        pages.append(parts[0])
+        if len(parts) == 1:
+            break
+        table = parts[1]
+    assert pages[0].start == 0 and pages[-1].end == len(rows)
+    assert all(a.end == b.start for a, b in zip(pages, pages[1:]))
+    assert all(page.wrap(0, 500)[1] <= 500 for page in pages)
+
+
+def test_reports_render_long_names(conn):
+    conn.execute("UPDATE Students SET name = ? WHERE student_id = '00001'", ('Long ' * 30,))
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned) VALUES (?, ?, ?, ?)",
+                     [('00001', '00002', None, 0), ('00003', '00001', '00001', 1)])
+    conn.commit()
+    for kind, params in (('entry_fee', {'fee_amount': 100, 'all_students': True}), ('schedule', {}),
+                         ('results', {}), ('leaderboard', {})):
+        assert reports.REPORTS[kind](conn, 'Test', params).startswith(b'%PDF')
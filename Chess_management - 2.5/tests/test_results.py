@@ -0,0 +1,89 @@
+import io
+import sqlite3
+
+import pytest
+
+import results
+import standings
+
+
+@pytest.fixture
+def round_1(conn):
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                     "VALUES (?, ?, 0, '2025-01-01')",
+                     [('00001', '00002'), ('00003', '00004'), ('00005', '00006'), ('00007', '00008')])
+    conn.commit()
+    return conn
+
+
+def _points(conn):
+    return {row[0]: (row[1], row[2]) for row in conn.execute(
+        'SELECT student_id, points, matches_played FROM Students ORDER BY student_id')}
+
+
+def _standings(conn):
+    return {row['student_id']: (row['points'], row['wins'], row['draws'], row['losses'])
+            for row in standings.fetch_leaderboard(conn)}
+
+
+def test_round_updates_points_and_standings(round_1):
+    report = results.apply_results(round_1, [(1, 1, '1-0'), (2, 2, 'draw'), (3, 3, '00006'), (4, '4', 'black')])
+    assert report.ok and report.applied == 4
+    points = _points(round_1)
+    assert points['00001'] == (3, 1) and points['00002'] == (0, 1)
+    assert points['00003'] == (0.5, 1) and points['00006'] == (3, 1) and points['00008'] == (3, 1)
+    assert _standings(round_1)['00003'] == (0.5, 0, 1, 0)
+    assert _standings(round_1)['00001'] == (3, 1, 0, 0)
+
+
+def test_resubmitting_a_round_changes_nothing(round_1):
+    entries = [(1, 1, '1-0'), (2, 2, 'draw')]
+    assert results.apply_results(round_1, entries).ok
+    before = _points(round_1), _standings(round_1)
+    report = results.apply_results(round_1, entries)
+    assert report.ok and report.unchanged == 2 and report.applied == 0
+    assert (_points(round_1), _standings(round_1)) == before
+
+
+def test_one_bad_board_writes_nothing(round_1):
+    before = _points(round_1)
+    report = results.apply_results(round_1, [(1, 1, '1-0'), (2, 2, '00009'), (3, 99, '1-0'), (4, 1, '0-1')])
+    assert [(board, message) for board, _, message in report.errors] == [
+        (2, "winner '00009' is not playing in this match"), (3, 'no such match in this batch'),
+        (4, 'match submitted more than once')]
+    assert _points(round_1) == before
+    assert round_1.execute('SELECT COUNT(*) FROM Matches WHERE points_assigned = 1').fetchone()[0] == 0
+
+
+def test_failure_while_applying_rolls_everything_back(round_1):
+    before = _points(round_1), _standings(round_1)
+    # Fails after Students and Standings have been updated
+    round_1.execute("CREATE TEMP TRIGGER fail_results BEFORE UPDATE OF winner_id ON Matches "
+                    "BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    with pytest.raises(sqlite3.IntegrityError):
+        results.apply_results(round_1, [(1, 1, '1-0'), (2, 2, 'draw')])
+    assert not round_1.in_transaction
+    assert (_points(round_1), _standings(round_1)) == before
+    round_1.execute('DROP TRIGGER temp.fail_results')
+    assert results.apply_results(round_1, [(1, 1, '1-0'), (2, 2, 'draw')]).applied == 2
+
+
+def test_rescore_replaces_the_old_result(round_1):
+    assert results.apply_results(round_1, [(1, 1, '1-0')]).ok
+    report = results.apply_results(round_1, [(1, 1, 'draw')])
+    assert report.ok and report.rescored == 1
+    points = _points(round_1)
+    assert points['00001'] == (0.5, 1) and points['00002'] == (0.5, 1)
+    assert _standings(round_1)['00001'] == (0.5, 0, 1, 0)
+
+
+def test_read_csv_needs_the_headers():
+    entries = results.read_csv(io.BytesIO(b'match_id,winner\r\n1,1-0\r\n2,draw\r\n'))
+    assert entries == [(2, '1', '1-0'), (3, '2', 'draw')]
+    with pytest.raises(ValueError, match='missing headers: winner'):
+        results.read_csv(io.BytesIO(b'match_id,result\r\n1,1-0\r\n'))
+
+
+def test_read_csv_ends_rows_only_at_line_breaks():
+    entries = results.read_csv(io.BytesIO('match_id,winner\r\n1,Ann\x85Lee\r\n2,draw\r\n'.encode()))
+    assert entries == [(2, '1', 'Ann\x85Lee'), (3, '2', 'draw')]
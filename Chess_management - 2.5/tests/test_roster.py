@@ -0,0 +1,63 @@
+import sqlite3
+
+import roster
+from database import migrate_database
+
+
+def test_unchanged_roster_is_a_hit(conn):
+    cache = roster.RosterCache()
+    first = cache.get(conn)
+    assert cache.get(conn) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first.name('00003') == 'Player 3' and first.student_class('00003') == '7'
+
+
+def test_points_do_not_invalidate_the_roster(conn):
+    cache = roster.RosterCache()
+    first = cache.get(conn)
+    conn.execute("UPDATE Students SET points = points + 3, matches_played = matches_played + 1 "
+                 "WHERE student_id = '00001'")
+    conn.commit()
+    assert cache.get(conn) is first
+
+
+def test_rename_add_and_remove_invalidate_the_roster(conn):
+    cache = roster.RosterCache()
+    cache.get(conn)
+    conn.execute("UPDATE Students SET name = 'Renamed' WHERE student_id = '00001'")
+    conn.commit()
+    assert cache.get(conn).name('00001') == 'Renamed'
+    conn.execute("INSERT INTO Students (student_id, name, class, paid_entry) VALUES ('00009', 'New', '8', 1)")
+    conn.commit()
+    assert cache.get(conn).student_class('00009') == '8'
+    conn.execute("DELETE FROM Students WHERE student_id = '00002'")
+    conn.commit()
+    assert '00002' not in cache.get(conn)
+    assert cache.misses == 4
+
+
+def test_uncommitted_students_are_not_cached(conn):
+    cache = roster.RosterCache()
+    conn.execute("UPDATE Students SET name = 'Not yet' WHERE student_id = '00001'")
+    assert cache.get(conn).name('00001') == 'Not yet'
+    conn.rollback()
+    assert cache.get(conn).name('00001') == 'Player 1'
+
+
+def test_least_recently_used_roster_is_evicted(tmp_path, conn):
+    other_path = str(tmp_path / 'batch_other_database.db')
+    migrate_database(other_path)
+    other = sqlite3.connect(other_path)
+    cache = roster.RosterCache(max_rosters=1)
+    cache.get(conn)
+    cache.get(other)
+    cache.get(conn)
+    other.close()
+    assert cache.evictions == 2 and cache.misses == 3
+
+
+def test_with_names_fills_unknown_ids_with_none(conn):
+    rows = roster.RosterCache().get(conn).with_names(
+        [{'student1_id': '00001', 'student2_id': '00002', 'winner_id': None}])
+    assert rows == [{'student1_id': '00001', 'student2_id': '00002', 'winner_id': None,
+                     's1_name': 'Player 1', 's2_name': 'Player 2', 'winner_name': None}]
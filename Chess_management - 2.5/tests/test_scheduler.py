@@ -0,0 +1,78 @@
+import pytest
+
+import scheduler
+
+
+def _games(pairs, classes=None):
+    classes = classes or {}
+    return [(match_id, s1, s2, classes.get(s1, '7'), classes.get(s2, '7'))
+            for match_id, (s1, s2) in enumerate(pairs, 1)]
+
+
+def _slots(games, assignments):
+    """{player: [slots]} of the games placed."""
+    placed = {match_id: slot for match_id, slot, _, _ in assignments}
+    slots = {}
+    for match_id, s1, s2, _, _ in games:
+        for player in (s1, s2):
+            slots.setdefault(player, []).append(placed[match_id])
+    return slots
+
+
+def test_no_board_or_player_is_double_booked():
+    games = _games([('a', 'b'), ('c', 'd'), ('a', 'c'), ('b', 'd'), ('a', 'd'), ('b', 'c')])
+    assignments, unscheduled = scheduler.plan(games, [{'name': 'Hall', 'boards': 1, 'classes': []}])
+    assert not unscheduled and len(assignments) == 6
+    assert len({(slot, room, board) for _, slot, room, board in assignments}) == 6
+    for slots in _slots(games, assignments).values():
+        assert len(set(slots)) == len(slots)
+
+
+def test_rest_slots_between_a_players_games():
+    games = _games([('a', 'b'), ('a', 'c'), ('a', 'd')])
+    assignments, _ = scheduler.plan(games, [{'name': 'Hall', 'boards': 5, 'classes': []}], rest_slots=1)
+    assert sorted(_slots(games, assignments)['a']) == [0, 2, 4]
+
+
+def test_rooms_by_class():
+    rooms = [{'name': 'Junior', 'boards': 2, 'classes': ['6']},
+             {'name': 'Senior', 'boards': 2, 'classes': ['10']}]
+    games = _games([('j1', 'j2'), ('s1', 's2'), ('j3', 's3')],
+                   {'j1': '6', 'j2': '6', 'j3': '6', 's1': '10', 's2': '10', 's3': '10'})
+    assignments, unscheduled = scheduler.plan(games, rooms)
+    room_of = {match_id: rooms[room]['name'] for match_id, _, room, _ in assignments}
+    assert room_of[1] == 'Junior' and room_of[2] == 'Senior' and not unscheduled
+    # Nobody in class 8 may use either room
+    assert scheduler.plan(_games([('x', 'y')], {'x': '8', 'y': '8'}), rooms) == ([], [1])
+
+
+def test_booked_games_keep_their_place():
+    games = _games([('a', 'b')])
+    booked = [(9, 'a', 'c', 0, 0, 1)]
+    assignments, _ = scheduler.plan(games, [{'name': 'Hall', 'boards': 5, 'classes': []}], booked=booked)
+    assert assignments == [(1, 1, 0, 1)]
+
+
+def test_parse_rooms():
+    assert scheduler.parse_rooms('Hall: 10\nLab: 4: 6, 7\n') == [
+        {'name': 'Hall', 'boards': 10, 'classes': []}, {'name': 'Lab', 'boards': 4, 'classes': ['6', '7']}]
+    for text, message in (('Hall', 'expected'), ('Hall: many', 'not a number'), ('Hall: 2\nHall: 3', 'twice'),
+                          ('', 'At least one room')):
+        with pytest.raises(ValueError, match=message):
+            scheduler.parse_rooms(text)
+
+
+def test_schedule_places_new_games_after_played_slots(conn):
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                     "VALUES (?, ?, 0, '2025-01-01')", [('00001', '00002'), ('00003', '00004')])
+    settings = dict(scheduler.DEFAULT_SETTINGS, rooms=[{'name': 'Hall', 'boards': 1, 'classes': []}],
+                    start='2025-01-01 09:00')
+    result = scheduler.schedule(conn, settings)
+    assert (result.scheduled, result.slots) == (2, 2)
+    conn.execute("UPDATE Matches SET winner_id = student1_id, points_assigned = 1")
+    conn.execute("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                 "VALUES ('00001', '00003', 0, '2025-01-01')")
+    result = scheduler.schedule(conn, settings, reschedule=True)
+    assert (result.scheduled, result.kept) == (1, 2)
+    assert tuple(conn.execute('SELECT slot, starts_at FROM Schedule WHERE match_id = 3').fetchone()) == \
+        (2, '2025-01-01 11:00')
@@ -0,0 +1,41 @@
+import search
+
+
+def _add(conn, *students):
+    conn.executemany('INSERT INTO Students (student_id, name, class, roll, paid_entry) VALUES (?, ?, ?, ?, 1)',
+                     students)
+    conn.commit()
+
+
+def _found(conn, q, **kwargs):
+    return [(row['student_id'], kind) for row, kind in search.search_students(conn, q, **kwargs)]
+
+
+def test_prefix_query_quotes_every_word():
+    assert search.prefix_query('nus rah"man') == '"nus"* "rah"* "man"*'
+    assert search.prefix_query(' -- ') == ''
+
+
+def test_prefix_search_ranks_names_first(conn):
+    _add(conn, ('00010', 'Nusrat Jahan', '9', '5'), ('00011', 'Tanvir Rahman', '9', '12'))
+    assert _found(conn, 'nus', fuzzy=False) == [('00010', 'prefix')]
+    assert _found(conn, 'Tanvir Rah', fuzzy=False) == [('00011', 'prefix')]
+    assert _found(conn, '0001', fuzzy=False)[:2] == [('00010', 'prefix'), ('00011', 'prefix')]
+
+
+def test_misspelled_names_are_found_by_trigrams(conn):
+    _add(conn, ('00010', 'Farhana Akter', '8', '1'), ('00011', 'Rafiq Hossain', '8', '2'))
+    assert _found(conn, 'Farhna', fuzzy=False) == []
+    assert _found(conn, 'Farhna') == [('00010', 'fuzzy')]
+    assert _found(conn, 'Hosain')[0] == ('00011', 'fuzzy')
+
+
+def test_triggers_keep_the_index_in_sync(conn):
+    _add(conn, ('00010', 'Kamal Uddin', '7', '3'))
+    conn.execute("UPDATE Students SET name = 'Kamrul Uddin' WHERE student_id = '00010'")
+    assert _found(conn, 'kamal', fuzzy=False) == []
+    assert _found(conn, 'kamrul', fuzzy=False) == [('00010', 'prefix')]
+    # Points changes do not touch the index
+    conn.execute("UPDATE Students SET points = points + 3 WHERE student_id = '00010'")
+    conn.execute("DELETE FROM Students WHERE student_id = '00010'")
+    assert _found(conn, 'kamrul') == []
@@ -0,0 +1,60 @@
+import standings
+
+
+def _rows(conn, period=standings.CURRENT_PERIOD):
+    return {row[0]: tuple(row[1:]) for row in conn.execute(
+        'SELECT student_id, points, wins, draws, losses, games FROM Standings WHERE period = ?', (period,))}
+
+
+def _play(conn, games, match_date='2025-01-15'):
+    conn.executemany('''
+        INSERT INTO Matches (student1_id, student2_id, winner_id, points_assigned, match_date)
+        VALUES (?, ?, ?, 1, ?)
+    ''', [game + (match_date,) for game in games])
+
+
+def test_record_result_upserts_and_reverses(conn):
+    standings.record_result(conn, '00001', '00002', '00001')
+    standings.record_result(conn, '00001', '00003', None)
+    assert _rows(conn) == {'00001': (3.5, 1, 1, 0, 2), '00002': (0, 0, 0, 1, 1), '00003': (0.5, 0, 1, 0, 1)}
+    # Rescoring removes the old result; a player left with no games has no row
+    standings.record_result(conn, '00001', '00002', '00001', sign=-1)
+    assert _rows(conn) == {'00001': (0.5, 0, 1, 0, 1), '00003': (0.5, 0, 1, 0, 1)}
+
+
+def test_bulk_and_single_updates_match_a_rebuild(conn):
+    games = [('00001', '00002', '00001'), ('00003', '00004', None), ('00002', '00003', '00003'),
+             ('00005', '00005', '00005')]
+    _play(conn, games)
+    standings.record_results(conn, 'Matches')
+    bulk = _rows(conn)
+    conn.execute('DELETE FROM Standings')
+    for game in games:
+        standings.record_result(conn, *game)
+    assert _rows(conn) == bulk
+    conn.execute("UPDATE Standings SET points = 99 WHERE student_id = '00001'")
+    standings.rebuild_standings(conn)
+    assert _rows(conn) == bulk
+    # Playing yourself counts once
+    assert bulk['00005'] == (3, 1, 0, 0, 1)
+
+
+def test_archiving_moves_results_into_their_month(conn):
+    _play(conn, [('00001', '00002', '00001')], '2025-01-15')
+    _play(conn, [('00001', '00003', None)], '2025-02-03')
+    standings.record_results(conn, 'Matches')
+    standings.archive_completed(conn)
+    assert _rows(conn) == {}
+    assert _rows(conn, '2025-01') == {'00001': (3, 1, 0, 0, 1), '00002': (0, 0, 0, 1, 1)}
+    assert _rows(conn, '2025-02')['00001'] == (0.5, 0, 1, 0, 1)
+
+
+def test_leaderboard_is_ordered_by_points(conn):
+    _play(conn, [('00001', '00002', '00002'), ('00003', '00004', '00003'), ('00003', '00002', None)])
+    standings.record_results(conn, 'Matches')
+    leaders = standings.fetch_leaderboard(conn)
+    assert [(row['student_id'], row['points']) for row in leaders] == [
+        ('00002', 3.5), ('00003', 3.5), ('00001', 0), ('00004', 0)]
+    # Integer points unless a draw contributed
+    assert isinstance(leaders[2]['points'], int) and isinstance(leaders[0]['points'], float)
+    assert [row['student_id'] for row in standings.fetch_leaderboard(conn, class_filter='8')] == []
@@ -0,0 +1,43 @@
+import pytest
+
+import results
+import standings
+import tiebreaks
+
+# In playing order: A beats B, C and D draw, C beats A, B beats D.
+# Points: A 3, B 3, C 3.5, D 0.5
+GAMES = [('A', 'B', 'A'), ('C', 'D', None), ('A', 'C', 'C'), ('B', 'D', 'B')]
+
+
+def test_compute_by_hand():
+    values = tiebreaks.compute(GAMES)
+    # (buchholz, median buchholz, Sonneborn-Berger, progressive, direct encounter)
+    assert values['A'] == pytest.approx((6.5, 6.5, 3.0, 6.0, 3.0))
+    assert values['B'] == pytest.approx((3.5, 3.5, 0.5, 3.0, 0.0))
+    assert values['C'] == pytest.approx((3.5, 3.5, 3.25, 4.0, 0.0))
+    assert values['D'] == pytest.approx((6.5, 6.5, 1.75, 1.0, 0.0))
+
+
+def test_median_buchholz_drops_best_and_worst():
+    games = [('A', 'B', 'A'), ('A', 'C', 'A'), ('A', 'D', 'A'), ('B', 'C', 'B'), ('B', 'D', 'B'), ('C', 'D', 'C')]
+    buchholz, median = tiebreaks.compute(games)['A'][:2]
+    # Opponents scored 6, 3 and 0
+    assert (buchholz, median) == (9.0, 3.0)
+
+
+def test_skips_games_without_two_players():
+    assert tiebreaks.compute([('A', None, None), ('B', 'B', 'B')]) == {}
+
+
+def test_results_keep_stored_tiebreaks_current(conn):
+    conn.executemany("INSERT INTO Matches (student1_id, student2_id, points_assigned, match_date) "
+                     "VALUES (?, ?, 0, '2025-01-01')", [('00001', '00002'), ('00003', '00004'), ('00001', '00003')])
+    conn.commit()
+    assert results.apply_results(conn, [(1, 1, '1-0'), (2, 2, 'draw'), (3, 3, '0-1')]).ok
+    stored = {row[0]: tuple(row[1:]) for row in conn.execute(
+        f"SELECT student_id, {', '.join(tiebreaks.TIEBREAK_COLUMNS)} FROM TieBreaks WHERE period = ?",
+        (standings.CURRENT_PERIOD,))}
+    expected = tiebreaks.compute([('00001', '00002', '00001'), ('00003', '00004', None), ('00001', '00003', '00003')])
+    assert stored.keys() == expected.keys()
+    for student_id, values in expected.items():
+        assert stored[student_id] == pytest.approx(values)
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def writer():
+    pool = ConnectionPool()
+    yield WriteQueue(pool)
+    pool.close_all()
+
+
+def _add(conn, name):
+    max_id = conn.execute('SELECT MAX(student_id) FROM Students').fetchone()[0]
+    conn.execute("INSERT INTO Students (student_id, name, class, paid_entry) VALUES (?, ?, '7', 0)",
+                 (str(int(max_id) + 1).zfill(5), name))
+    return name
+
+
+def _fail(conn):
+    conn.execute("UPDATE Students SET name = 'Changed' WHERE student_id = '00001'")
+    raise ValueError('bad mutation')
+
+
+def test_run_returns_result_once_committed(writer, conn, db_path):
+    assert writer.run(db_path, _add, 'New player') == 'New player'
+    assert conn.execute("SELECT name FROM Students WHERE student_id = '00009'").fetchone()[0] == 'New player'
+
+
+def test_failing_mutation_is_rolled_back_alone(writer, conn, db_path):
+    futures = [writer.submit(db_path, _add, 'Before'), writer.submit(db_path, _fail),
+               writer.submit(db_path, _add, 'After')]
+    assert futures[0].result(10) == 'Before'
+    with pytest.raises(ValueError):
+        futures[1].result(10)
+    assert futures[2].result(10) == 'After'
+    assert conn.execute("SELECT name FROM Students WHERE student_id = '00001'").fetchone()[0] == 'Player 1'
+    assert conn.execute('SELECT COUNT(*) FROM Students').fetchone()[0] == 10
+
+
+def test_commit_and_rollback_inside_a_mutation_stay_in_its_savepoint(writer, conn, db_path):
+    def undo(conn):
+        _add(conn, 'Undone')
+        conn.rollback()
+        _add(conn, 'Kept')
+        conn.commit()
+    writer.run(db_path, undo)
+    names = [row[0] for row in conn.execute('SELECT name FROM Students WHERE student_id > ?', ('00008',))]
+    assert names == ['Kept']
+
+
+def test_concurrent_writers_never_collide(writer, conn, db_path):
+    errors = []
+
+    def client(number):
+        for i in range(20):
+            try:
+                writer.run(db_path, _add, f'Walk-in {number}-{i}')
+            except sqlite3.Error as e:
+                errors.append(e)
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert conn.execute('SELECT COUNT(DISTINCT student_id) FROM Students').fetchone()[0] == 8 + 160
+
+
+def test_timed_out_mutation_is_withdrawn_unless_running(conn, db_path):
+    pool = ConnectionPool()
+    writer = WriteQueue(pool, timeout=0.2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(conn, name):
+        started.set()
+        release.wait(10)
+        return _add(conn, name)
+
+    blocking = writer.submit(db_path, slow, 'Slow')
+    assert started.wait(10)
+    # Queued behind the running group: withdrawn when the wait runs out
+    with pytest.raises(TimeoutError):
+        writer.run(db_path, _add, 'Withdrawn')
+    release.set()
+    assert blocking.result(10) == 'Slow'
+    # Running when the wait runs out: its result is still returned
+    release.clear()
+    threading.Timer(0.5, release.set).start()
+    assert writer.run(db_path, slow, 'Late') == 'Late'
+    assert writer.run(db_path, _add, 'After') == 'After'
+    names = [row[0] for row in conn.execute("SELECT name FROM Students WHERE student_id > '00008'")]
+    assert sorted(names) == ['After', 'Late', 'Slow']
+    pool.close_all()
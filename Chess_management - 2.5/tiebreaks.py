@@ -0,0 +1,131 @@
+import numpy as np
+import standings
+
+# Tie-breaks for the leaderboard, stored per Standings period.
+#
+# A period's games are loaded once into parallel arrays (white, black and
+# the points each side scored, 3 / 0.5 / 0 as in Standings); every
+# tie-break is then a handful of bincounts over those arrays, so a
+# recompute costs one query and no per-player work in Python.
+
+CHECK_QUERY_PLANS = True  # see database.query_sources
+
+# In leaderboard order, after points (see standings.fetch_leaderboard)
+TIEBREAK_COLUMNS = ('buchholz', 'median_buchholz', 'sonneborn_berger', 'progressive', 'direct_encounter')
+
+_WIN_POINTS = 3.0
+_DRAW_POINTS = 0.5
+
+
+def create_tiebreaks_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS TieBreaks (
+        period TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        buchholz REAL NOT NULL,
+        median_buchholz REAL NOT NULL,
+        sonneborn_berger REAL NOT NULL,
+        progressive REAL NOT NULL,
+        direct_encounter REAL NOT NULL,
+        PRIMARY KEY (period, student_id)
+    ) WITHOUT ROWID
+    ''')
+
+
+def compute(games):
+    """Tie-breaks for games, a list of (student1_id, student2_id, winner_id) in playing order.
+
+    Returns {student_id: (buchholz, median_buchholz, sonneborn_berger,
+    progressive, direct_encounter)}. Buchholz is the sum of the opponents'
+    points; the median variant drops the best and worst opponent once a
+    player has three. Sonneborn-Berger adds the points of beaten opponents
+    and half those of drawn ones. Progressive sums the player's running
+    score after each game. Direct encounter is the points scored against
+    players on the same total.
+    """
+    games = [g for g in games if g[0] is not None and g[1] is not None and g[0] != g[1]]
+    if not games:
+        return {}
+    ids = sorted({sid for s1, s2, _ in games for sid in (s1, s2)})
+    index = {sid: i for i, sid in enumerate(ids)}
+    n = len(ids)
+    white = np.fromiter((index[g[0]] for g in games), dtype=np.int64, count=len(games))
+    black = np.fromiter((index[g[1]] for g in games), dtype=np.int64, count=len(games))
+    white_wins = np.fromiter((g[2] == g[0] for g in games), dtype=bool, count=len(games))
+    black_wins = np.fromiter((g[2] == g[1] for g in games), dtype=bool, count=len(games))
+    draws = ~(white_wins | black_wins)
+    # Both sides of every game as one array pair: player, opponent, points scored, result (1 / 0.5 / 0)
+    player = np.concatenate([white, black])
+    opponent = np.concatenate([black, white])
+    won = np.concatenate([white_wins, black_wins])
+    drawn = np.concatenate([draws, draws])
+    scored = np.where(won, _WIN_POINTS, np.where(drawn, _DRAW_POINTS, 0.0))
+    result = np.where(won, 1.0, np.where(drawn, 0.5, 0.0))
+
+    points = np.bincount(player, scored, n)
+    opponent_points = points[opponent]
+    buchholz = np.bincount(player, opponent_points, n)
+    best = np.full(n, -np.inf)
+    worst = np.full(n, np.inf)
+    np.maximum.at(best, player, opponent_points)
+    np.minimum.at(worst, player, opponent_points)
+    played = np.bincount(player, minlength=n)
+    median_buchholz = np.where(played >= 3, buchholz - best - worst, buchholz)
+    sonneborn_berger = np.bincount(player, result * opponent_points, n)
+    # Progressive: a game's points count once for it and every later game,
+    # i.e. (games played - games before it) times
+    game = np.arange(len(player)) % len(games)
+    order = np.lexsort((game, player))  # each player's games, in playing order
+    starts = np.cumsum(played) - played
+    before = np.empty_like(order)
+    before[order] = np.arange(len(order)) - starts[player[order]]
+    progressive = np.bincount(player, scored * (played[player] - before), n)
+    tied = points[player] == points[opponent]
+    direct_encounter = np.bincount(player[tied], scored[tied], n)
+    return {sid: values for sid, values in zip(ids, zip(buchholz.tolist(), median_buchholz.tolist(),
+                                                           sonneborn_berger.tolist(), progressive.tolist(),
+                                                           direct_encounter.tolist()))}
+
+
+def _store(conn, period, values):
+    conn.execute('DELETE FROM TieBreaks WHERE period = ?', (period,))
+    conn.executemany(f'''
+        INSERT INTO TieBreaks (period, student_id, {', '.join(TIEBREAK_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((period, sid) + row for sid, row in values.items()))
+
+
+def rebuild_period(conn, period=standings.CURRENT_PERIOD):
+    """Recompute one period's tie-breaks: the current games, or a 'YYYY-MM' month of history."""
+    if period == standings.CURRENT_PERIOD:
+        games = conn.execute('''
+            SELECT student1_id, student2_id, winner_id FROM Matches
+            WHERE points_assigned = 1 ORDER BY match_id
+        ''').fetchall()
+    else:
+        import history  # history imports this module
+        games = [(g['student1_id'], g['student2_id'], g['winner_id'])
+                 for g in history.month_games(conn, period) if g['points_assigned'] == 1]
+    values = compute(games)
+    _store(conn, period, values)
+    return len(values)
+
+
+def rebuild_tiebreaks(conn):
+    """Recompute every period; months only in cold storage are kept as they are."""
+    cold = {row[0] for row in conn.execute('SELECT month_key FROM ColdMonths')}
+    periods = [row[0] for row in conn.execute('SELECT DISTINCT period FROM TieBreaks')]
+    conn.executemany('DELETE FROM TieBreaks WHERE period = ?', [(p,) for p in periods if p not in cold])
+    rebuild_period(conn, standings.CURRENT_PERIOD)
+    months = {}
+    for month, s1, s2, winner_id, assigned in conn.execute('''
+        SELECT month_key, student1_id, student2_id, winner_id, points_assigned FROM MatchHistory ORDER BY match_id
+    '''):
+        if month is not None and assigned == 1:
+            months.setdefault(month, []).append((s1, s2, winner_id))
+    for month, games in months.items():
+        if month in cold:
+            # Games archived after the month was compacted: count its cold games too
+            rebuild_period(conn, month)
+        else:
+            _store(conn, month, compute(games))
@@ -0,0 +1,156 @@
+import fcntl
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Serialized, group-committed writes. SQLite allows one writer per database.
+# Concurrent writers wait in its busy handler, which polls with growing
+# sleeps rather than queueing, so behind slow writes (archiving, rescoring)
+# others give up with "database is locked" after the busy timeout. A value
+# read before the write transaction starts (add_student's MAX(student_id))
+# can also be stale by the time it is written. So every mutation of a batch
+# goes through one writer thread per batch in each worker process, and the
+# writers of all workers take turns on an exclusive flock next to the batch
+# database (DB/batch_..._database.db.writelock).
+#
+# A writer takes everything queued for its batch (up to MAX_GROUP
+# mutations), runs it in one BEGIN IMMEDIATE transaction with a savepoint
+# per mutation and commits once, then completes the callers' futures. The
+# longer the lock or the disk keeps a writer waiting, the more mutations
+# queue behind it and share its next commit, so throughput grows with load
+# rather than requests failing. A mutation that raises is rolled back to
+# its savepoint without affecting the rest of its group. Reads do not go
+# through the queue and stay concurrent (WAL).
+
+MAX_GROUP = 64
+# Seconds a caller waits for its mutation to start; one still queued by then is withdrawn
+WRITE_TIMEOUT = 60.0
+# A writer thread with nothing to do for this long exits; the next write starts another
+IDLE_SECONDS = 30.0
+SAVEPOINT = 'write_queue_mutation'
+
+
+class WriteQueue:
+    """Per-process writer threads, one per batch database, fed from in-process queues.
+
+    Mutations are fn(conn, *args) on a pooled connection from pool (see
+    db_pool); they must not close it. Their commit() and rollback() calls
+    apply to their own savepoint only, so code that commits on its own
+    (results.apply_results) can run unchanged. observer, if given, is called
+    as observer(mutations, lock_wait_seconds, group_seconds) after each group.
+    on_commit, if given, is called as on_commit(db_path, conn) right after
+    each commit, on the writer's connection and before the callers' futures
+    are completed; it must not raise.
+    """
+
+    def __init__(self, pool, max_group=MAX_GROUP, timeout=WRITE_TIMEOUT, observer=None, on_commit=None):
+        self.pool = pool
+        self.max_group = max_group
+        self.timeout = timeout
+        self.observer = observer
+        self.on_commit = on_commit
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._queues = {}  # db_path -> queue of (fn, args, future)
+
+    def submit(self, db_path, fn, *args):
+        """Queue fn(conn, *args) for db_path; return a Future of its result, set once committed."""
+        future = Future()
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Writer threads are not inherited across a fork
+                self._pid = os.getpid()
+                self._queues = {}
+            pending = self._queues.get(db_path)
+            if pending is None:
+                pending = self._queues[db_path] = queue.SimpleQueue()
+                threading.Thread(target=self._writer, args=(db_path, pending), daemon=True,
+                                 name=f'writer {os.path.basename(db_path)}').start()
+            pending.put((fn, args, future))
+        return future
+
+    def run(self, db_path, fn, *args):
+        """Run fn(conn, *args) through the queue and return its result once committed (or raise its error).
+
+        Raises TimeoutError only if the mutation was still queued after
+        timeout seconds, in which case it is withdrawn and never runs. One
+        that has started is waited for, so a write reported as failed can
+        not land afterwards.
+        """
+        future = self.submit(db_path, fn, *args)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+        # Its group is running: report how it ends
+        return future.result()
+
+    def _writer(self, db_path, pending):
+        with open(f'{db_path}.writelock', 'a') as lock_file:
+            while True:
+                try:
+                    group = [pending.get(timeout=IDLE_SECONDS)]
+                except queue.Empty:
+                    with self._lock:
+                        if pending.empty():
+                            if self._queues.get(db_path) is pending:
+                                del self._queues[db_path]
+                            return
+                    continue
+                while len(group) < self.max_group:
+                    try:
+                        group.append(pending.get_nowait())
+                    except queue.Empty:
+                        break
+                self._run_group(db_path, lock_file, [item for item in group if item[2].set_running_or_notify_cancel()])
+
+    def _run_group(self, db_path, lock_file, group):
+        if not group:
+            return
+        start = time.perf_counter()
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        locked = time.perf_counter()
+        outcomes = []
+        try:
+            conn = self.pool.acquire(db_path)
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for fn, args, _ in group:
+                        conn._savepoint = SAVEPOINT
+                        conn.execute(f'SAVEPOINT {SAVEPOINT}')
+                        try:
+                            outcomes.append((True, fn(conn, *args)))
+                        except Exception as e:
+                            conn.execute(f'ROLLBACK TO {SAVEPOINT}')
+                            outcomes.append((False, e))
+                        finally:
+                            conn._savepoint = None
+                        conn.execute(f'RELEASE {SAVEPOINT}')
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                if self.on_commit is not None:
+                    self.on_commit(db_path, conn)
+            finally:
+                self.pool.release(conn)
+        except Exception as e:
+            # Nothing of the group was committed
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        for (ok, value), (_, _, future) in zip(outcomes, group):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        if self.observer is not None:
+            self.observer(len(group), locked - start, time.perf_counter() - start)